@@ -1,19 +1,193 @@
 # coding=utf-8
 import datetime
+import random
+import threading
+import time
 
-import botocore
-from boto3 import Session as BotoSession
-from botocore import errorfactory as err
+import requests
 
+import constants
+import STSQuery
 from Logging import Logging
 
 log_stream = Logging('aws')
 
+# boto3/botocore are imported on first use rather than at module load: with the 'query'
+# STS backend a login never needs them, and they dominate start-up time and memory.
+STS_BACKENDS = ['boto3', 'query']
+
+# Errors worth retrying: throttling and transient service or network failures. Anything
+# else (a bad or expired assertion, a role the user may not assume, ...) fails the same
+# way on every attempt, so it is reported at once.
+THROTTLING_ERRORS = {'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException'}
+RETRYABLE_ERRORS = THROTTLING_ERRORS | {'IDPCommunicationError', 'ServiceUnavailable', 'InternalFailure',
+                                        'InternalError', 'RequestTimeout', 'ConnectionError'}
+
+
+class STSCallError(Exception):
+    """A failed AssumeRoleWithSAML call, normalized across the boto3 and query backends."""
+
+    def __init__(self, code, message, status_code=None):
+        super().__init__(message)
+        self.code = code
+        self.status_code = status_code
+
+    @property
+    def retryable(self):
+        # Any 5xx is a server-side failure worth retrying, whatever its body says
+        return self.code in RETRYABLE_ERRORS or self.throttled or (self.status_code or 0) >= 500
+
+    @property
+    def throttled(self):
+        return self.code in THROTTLING_ERRORS or self.status_code == 429
+
+
+class AdaptiveRateLimiter:
+    """
+    Client-side token bucket shared by every AssumeRoleWithSAML call in a batch.
+
+    Calls go out unthrottled until STS first throttles one. The limiter then drops to
+    constants.__sts_rate_limit__ calls per second (or rate, if given), halves the rate on
+    every further throttle and grows it additively while calls succeed, so a burst of
+    profiles settles at a rate the account can sustain instead of hammering STS with retries.
+    """
+
+    def __init__(self, rate=None, min_rate=0.5, max_rate=None, increase=0.5, decrease_factor=0.5):
+        self.rate = float(rate) if rate else None
+        self.min_rate = min_rate
+        self.max_rate = float(max_rate or (self.rate or constants.__sts_rate_limit__) * 4)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._tokens = max(self.rate or 1.0, 1.0)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Block until a call may be sent."""
+        while True:
+            with self._lock:
+                if self.rate is None:
+                    return
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate is not None:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            if self.rate is None:
+                self.rate = float(constants.__sts_rate_limit__)
+                self._last_refill = time.monotonic()
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class AssumeRoleStats:
+    """Thread-safe counters for a batch of AssumeRoleWithSAML calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def record(self, calls=0, retries=0, throttles=0):
+        with self._lock:
+            self.calls += calls
+            self.retries += retries
+            self.throttles += throttles
+
+    def summary(self):
+        return f'{self.calls} STS call(s), {self.retries} retried, {self.throttles} throttled'
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped."""
+    base = constants.__sts_retry_base_delay__ if base is None else base
+    cap = constants.__sts_retry_max_delay__ if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# One STS client per region for the life of the process. Clients are thread safe, and
+# keeping them around means the botocore loader, endpoint resolver and the HTTPS
+# connection pool are built once instead of once per AssumeRoleWithSAML call.
+_sts_clients = {}
+_sts_clients_lock = threading.Lock()
+_sts_session = None
+
 
 class STS:
 
+    @staticmethod
+    def get_sts_client(region, pool_size=None):
+        """
+        Return the shared STS client for a region, creating it on first use.
+
+        Args:
+            region (str): AWS region the client is bound to
+            pool_size (int, optional): Number of keep-alive connections the client should hold.
+                A client with a smaller pool is rebuilt so a batch never queues on connections.
+                Without it the cached client is returned whatever its size, and a new client
+                gets constants.__sts_pool_size__.
+
+        Returns:
+            botocore client for STS
+        """
+        global _sts_session
+        with _sts_clients_lock:
+            cached = _sts_clients.get(region)
+            if cached is not None and (pool_size is None or cached[1] >= int(pool_size)):
+                return cached[0]
+            pool_size = max(int(pool_size or constants.__sts_pool_size__), 1)
+
+            from boto3 import Session as BotoSession
+            from botocore.config import Config as BotoConfig
+
+            if _sts_session is None:
+                _sts_session = BotoSession()
+            # Retries are handled by aws_assume_role so they can be counted and bounded by the
+            # assertion's lifetime; botocore makes a single attempt
+            client_config = BotoConfig(
+                region_name=region,
+                max_pool_connections=pool_size,
+                tcp_keepalive=True,
+                retries={'total_max_attempts': 1},
+            )
+            sts = _sts_session.client('sts', region_name=region, config=client_config,
+                                      endpoint_url=constants.__sts_endpoint_url__)
+            _sts_clients[region] = (sts, pool_size)
+            log_stream.debug(f'Created STS client for {region} with {pool_size} pooled connection(s)')
+            return sts
+
+    @staticmethod
+    def reset_sts_clients():
+        """Drop every cached STS client, closing their connection pools."""
+        global _sts_session
+        with _sts_clients_lock:
+            for sts, _ in _sts_clients.values():
+                try:
+                    sts.close()
+                except AttributeError:
+                    pass
+            _sts_clients.clear()
+            _sts_session = None
+
     @staticmethod
     def get_aws_caller_id(profile):
+        from boto3 import Session as BotoSession
+
         post_session = BotoSession(profile_name=profile)
         sts = post_session.client('sts')
 
@@ -23,28 +197,162 @@ class STS:
         return aws_user_id
 
     @staticmethod
-    def aws_assume_role(region, role, principle, saml_assertion, duration):
-        pre_session = BotoSession(region_name=region)
-        sts = pre_session.client('sts')
+    def get_caller_id_from_sts(sts_object):
+        """
+        Return the session user id carried in the AssumeRoleWithSAML response.
 
-        log_stream.info(f'Role: {role}')
-        log_stream.info(f'Principle: {principle}')
+        AssumedRoleUser.AssumedRoleId is '<role id>:<session name>', the same value
+        GetCallerIdentity reports as UserId, so no second round trip is needed.
+        """
+        assumed_role_id = str(sts_object['AssumedRoleUser']['AssumedRoleId'])
+        return assumed_role_id.split(":", 1)[1]
+
+    @staticmethod
+    def verify_caller_id_async(aws_access_id, aws_secret_key, aws_session_token, region, expected_user_id):
+        """
+        Confirm the new credentials with a live GetCallerIdentity call on a background thread.
+
+        The check uses the credentials in hand rather than re-reading ~/.aws, and only logs
+        its outcome, so it never holds up the login. The thread is a daemon, so a caller that
+        joins it with a timeout can still exit while a slow GetCallerIdentity is in flight.
+
+        Returns:
+            threading.Thread: The started verification thread
+        """
+        def verify():
+            from boto3 import Session as BotoSession
+
+            try:
+                session = BotoSession(aws_access_key_id=aws_access_id, aws_secret_access_key=aws_secret_key,
+                                      aws_session_token=aws_session_token, region_name=region)
+                live_user_id = str(session.client('sts').get_caller_identity()['UserId']).split(":", 1)[1]
+            except Exception as e:
+                log_stream.warning(f'Unable to verify caller identity: {str(e)}')
+                return
+
+            if live_user_id == expected_user_id:
+                log_stream.info(f'Caller identity verified for {live_user_id}')
+            else:
+                log_stream.warning(f'Caller identity mismatch: STS returned {expected_user_id}, '
+                                   f'GetCallerIdentity reports {live_user_id}')
+
+        verification = threading.Thread(target=verify, name='verify-caller-id', daemon=True)
+        verification.start()
+        return verification
+
+    @staticmethod
+    def prepare_sts_transport(regions, pool_size, backend=None):
+        """
+        Size the connection pool of the selected STS backend before a batch of assumes.
+
+        Args:
+            regions (iterable): Regions the batch will call
+            pool_size (int): Number of concurrent calls the batch makes
+            backend (str, optional): 'boto3' or 'query'; defaults to constants.__sts_backend__
+        """
+        if (backend or constants.__sts_backend__) == 'query':
+            STSQuery.get_http_session(pool_size)
+        else:
+            for region in regions:
+                STS.get_sts_client(region, pool_size=pool_size)
+
+    @staticmethod
+    def _assume_once(region, role, principle, saml_assertion, duration, backend):
+        """Make a single AssumeRoleWithSAML call, raising STSCallError on any AWS error."""
+        if backend == 'query':
+            try:
+                return STSQuery.assume_role_with_saml(region, role, principle, saml_assertion, duration,
+                                                      endpoint_url=constants.__sts_endpoint_url__)
+            except STSQuery.STSQueryError as e:
+                raise STSCallError(e.code, str(e), e.status_code) from e
+            except requests.RequestException as e:
+                log_stream.warning(f'STS query transport failed, falling back to boto3: {str(e)}')
+
+        from botocore import exceptions as boto_exceptions
+
+        sts = STS.get_sts_client(region)
 
         try:
-            get_sts = sts.assume_role_with_saml(
+            return sts.assume_role_with_saml(
                 RoleArn=role,
                 PrincipalArn=principle,
                 SAMLAssertion=saml_assertion,
                 DurationSeconds=int(duration)
             )
+        except boto_exceptions.ClientError as e:
+            raise STSCallError(e.response.get('Error', {}).get('Code', 'Unknown'), str(e),
+                               e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')) from e
+        except (boto_exceptions.EndpointConnectionError, boto_exceptions.ConnectTimeoutError,
+                boto_exceptions.ReadTimeoutError) as e:
+            raise STSCallError('ConnectionError', str(e)) from e
+
+    @staticmethod
+    def aws_assume_role(region, role, principle, saml_assertion, duration, backend=None, deadline=None,
+                        rate_limiter=None, stats=None):
+        """
+        Assume a role with a SAML assertion, retrying throttling and transient errors.
 
-        except err.ClientError as e:
-            log_stream.critical(f'Error assuming role. Token length: {len(saml_assertion)}')
-            # log_stream.info(str(saml_assertion))
-            log_stream.critical(str(e))
-            raise SystemExit(2)
+        Retries use jittered exponential backoff and stop at constants.__sts_max_attempts__,
+        or earlier when the next attempt would land after the deadline (the assertion's
+        NotOnOrAfter), since STS rejects an expired assertion anyway.
 
-        return get_sts
+        Args:
+            region (str): Region whose STS endpoint is called
+            role (str): ARN of the role to assume
+            principle (str): ARN of the SAML provider
+            saml_assertion (str): Base64 encoded SAML response
+            duration (int): Session duration in seconds
+            backend (str, optional): 'boto3' or 'query'; defaults to constants.__sts_backend__
+            deadline (datetime, optional): Time after which no further attempt is made
+            rate_limiter (AdaptiveRateLimiter, optional): Limiter shared across a batch
+            stats (AssumeRoleStats, optional): Counters shared across a batch
+
+        Returns:
+            dict: The AssumeRoleWithSAML response
+
+        Raises:
+            SystemExit: If the role cannot be assumed
+        """
+        backend = backend or constants.__sts_backend__
+
+        log_stream.info(f'Role: {role}')
+        log_stream.info(f'Principle: {principle}')
+
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            if stats is not None:
+                stats.record(calls=1)
+            try:
+                get_sts = STS._assume_once(region, role, principle, saml_assertion, duration, backend)
+                if rate_limiter is not None:
+                    rate_limiter.on_success()
+                return get_sts
+            except STSCallError as e:
+                if e.throttled:
+                    if stats is not None:
+                        stats.record(throttles=1)
+                    if rate_limiter is not None:
+                        rate_limiter.on_throttle()
+
+                delay = backoff_delay(attempt)
+                attempt += 1
+                out_of_attempts = attempt >= constants.__sts_max_attempts__
+                past_deadline = deadline is not None and \
+                    datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=delay) >= deadline
+                if not e.retryable or out_of_attempts or past_deadline:
+                    log_stream.critical(f'Error assuming role. Token length: {len(saml_assertion)}')
+                    # log_stream.info(str(saml_assertion))
+                    if e.retryable:
+                        log_stream.critical(f'Giving up after {attempt} attempt(s)')
+                    log_stream.critical(str(e))
+                    raise SystemExit(2) from e
+
+                log_stream.warning(f'{e.code} assuming {role}, retrying in {delay:.2f}s (attempt {attempt})')
+                if stats is not None:
+                    stats.record(retries=1)
+                time.sleep(delay)
 
     @staticmethod
     def get_sts_details(sts_object):
@@ -62,14 +370,25 @@ class STS:
 class IAM:
     @staticmethod
     def get_account_alias(profile):
-        account_name = None
+        """
+        Look up the account alias for a profile's account.
+
+        Returns:
+            str | None: The alias, or None when the account has none
+
+        Raises:
+            botocore.exceptions.ClientError: ListAccountAliases was refused, so whether the
+                account has an alias is unknown
+        """
+        import botocore
+        from boto3 import Session as BotoSession
+
         session = BotoSession(profile_name=profile)
         iam_client = session.client('iam')
         try:
-            account_aliases = iam_client.list_account_aliases()
-            account_name = account_aliases['AccountAliases'][0]
-        except botocore.exceptions.ClientError as e:
+            account_aliases = iam_client.list_account_aliases()['AccountAliases']
+        except botocore.exceptions.ClientError:
             log_stream.info('Unable to get account alias')
-            pass
+            raise
 
-        return account_name
+        return account_aliases[0] if account_aliases else None
@@ -0,0 +1,193 @@
+# coding=utf-8
+"""
+Account number -> account name directory, kept in the account_directory table of
+~/.aws/aws_saml.db.
+
+account-map.json used to be the store itself: every lookup scanned the list and every
+new name re-read and rewrote the whole file. It is now an interchange format. It is
+imported in bulk whenever it changes on disk (by size, mtime and inode) and can be
+exported again with `samlstat accounts --export`. Lookups are primary-key reads and new
+names are written in batches.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+from Logging import Logging
+
+log_stream = Logging('account_directory')
+
+# Keeps IN (...) queries under SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+
+
+def parse_account_map(text: str) -> dict[str, str]:
+    """
+    Parse account-map.json text into account number -> name.
+
+    Raises:
+        ValueError: The text is not JSON, or not a list of {"name", "number"} objects
+    """
+    entries = json.loads(text)
+    if not isinstance(entries, list):
+        raise ValueError(f'expected a list, got {type(entries).__name__}')
+    accounts = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('number') and entry.get('name'):
+            accounts[str(entry['number'])] = str(entry['name'])
+    return accounts
+
+
+def format_account_map(accounts: dict[str, str]) -> str:
+    """account number -> name as account-map.json text, sorted by name."""
+    entries = [{"name": name, "number": number}
+               for number, name in sorted(accounts.items(), key=lambda item: (item[1].lower(), item[0]))]
+    return json.dumps(entries, indent=4) + '\n'
+
+
+class AccountDirectory:
+    """Account number -> name lookups backed by the account_directory table in aws_saml.db."""
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str | Path): Path to aws_saml.db
+        """
+        self.db_path = str(db_path)
+        self._ensure_table()
+
+    def _ensure_table(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS account_directory "
+                "(account_number TEXT PRIMARY KEY, name TEXT NOT NULL, updated_at TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS account_directory_imports "
+                "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL)"
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to prepare account directory: {str(e)}')
+
+    def get(self, account_number: str) -> str | None:
+        """Name of one account, or None if the directory does not know it."""
+        return self.lookup_many([account_number]).get(str(account_number))
+
+    def lookup_many(self, account_numbers) -> dict[str, str]:
+        """Names for many accounts at once; accounts without a name are left out."""
+        numbers = list(dict.fromkeys(str(number) for number in account_numbers))
+        names = {}
+        try:
+            conn = sqlite3.connect(self.db_path)
+            for start in range(0, len(numbers), _LOOKUP_CHUNK):
+                chunk = numbers[start:start + _LOOKUP_CHUNK]
+                names.update(conn.execute(
+                    "SELECT account_number, name FROM account_directory "
+                    f"WHERE account_number IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+            conn.close()
+        except sqlite3.Error:
+            pass
+        return names
+
+    def all(self) -> dict[str, str]:
+        """Every account as account number -> name."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            accounts = dict(conn.execute("SELECT account_number, name FROM account_directory").fetchall())
+            conn.close()
+        except sqlite3.Error:
+            return {}
+        return accounts
+
+    def __len__(self) -> int:
+        try:
+            conn = sqlite3.connect(self.db_path)
+            count = conn.execute("SELECT COUNT(*) FROM account_directory").fetchone()[0]
+            conn.close()
+        except sqlite3.Error:
+            return 0
+        return count
+
+    def upsert_many(self, accounts: dict[str, str]) -> int:
+        """
+        Insert or rename many accounts in one transaction.
+
+        Returns:
+            int: How many rows were added or changed
+        """
+        if not accounts:
+            return 0
+        now_str = datetime.now(timezone.utc).isoformat()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO account_directory (account_number, name, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(account_number) DO UPDATE SET name = excluded.name, updated_at = excluded.updated_at "
+                "WHERE account_directory.name != excluded.name",
+                [(str(number), str(name), now_str) for number, name in accounts.items()],
+            )
+            conn.commit()
+            changed = conn.total_changes - before
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to update account directory: {str(e)}')
+            return 0
+        return changed
+
+    def import_file(self, path, force: bool = False) -> int:
+        """
+        Bulk-import an account-map.json file, skipping it if it has not changed since the last import.
+
+        Args:
+            path (str | Path): account-map.json
+            force (bool): Import even if the file looks unchanged
+
+        Returns:
+            int: How many rows were added or changed
+
+        Raises:
+            OSError: The file could not be read
+            ValueError: The file is not a valid account map
+        """
+        path = str(path)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        if not force and self._imported_key(path) == key:
+            return 0
+
+        with open(path, 'r') as mapfile:
+            accounts = parse_account_map(mapfile.read())
+        changed = self.upsert_many(accounts)
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                "INSERT OR REPLACE INTO account_directory_imports (path, size, mtime_ns, inode) VALUES (?, ?, ?, ?)",
+                (path, *key),
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error:
+            pass
+        log_stream.debug(f'Imported {len(accounts)} account(s) from {path}, {changed} new or renamed')
+        return changed
+
+    def _imported_key(self, path: str):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute("SELECT size, mtime_ns, inode FROM account_directory_imports WHERE path = ?",
+                               (path,)).fetchone()
+            conn.close()
+        except sqlite3.Error:
+            return None
+        return tuple(row) if row else None
+
+    def export_text(self) -> str:
+        """The whole directory as account-map.json text."""
+        return format_account_map(self.all())
@@ -0,0 +1,186 @@
+# coding=utf-8
+"""
+Persistent cache of IAM account aliases, kept in ~/.aws/aws_saml.db next to the token
+state samlstat already tracks there.
+
+Aliases almost never change, so a cached answer saves a boto3 session and a
+ListAccountAliases call on every text-menu login. Accounts without an alias are cached
+too, for a shorter time, so they are not looked up again on every login either. A lookup
+that fails is not cached, so the next login asks again.
+"""
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from Logging import Logging
+
+log_stream = Logging('alias_cache')
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL_SECONDS = 24 * 3600
+
+
+class AliasCache:
+    """Account number -> alias lookups backed by the account_aliases table in aws_saml.db."""
+
+    def __init__(self, db_path, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 negative_ttl_seconds: int = DEFAULT_NEGATIVE_TTL_SECONDS):
+        """
+        Args:
+            db_path (str | Path): Path to aws_saml.db
+            ttl_seconds (int): How long a known alias stays fresh
+            negative_ttl_seconds (int): How long "this account has no alias" stays fresh
+        """
+        self.db_path = str(db_path)
+        self.ttl = timedelta(seconds=int(ttl_seconds))
+        self.negative_ttl = timedelta(seconds=int(negative_ttl_seconds))
+        self._ensure_table()
+
+    def _ensure_table(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS account_aliases "
+                "(account_number TEXT PRIMARY KEY, alias TEXT, fetched_at TEXT NOT NULL)"
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to prepare account alias cache: {str(e)}')
+
+    def _is_fresh(self, alias, fetched_at: str, now: datetime) -> bool:
+        try:
+            fetched = datetime.fromisoformat(fetched_at)
+        except (TypeError, ValueError):
+            return False
+        ttl = self.ttl if alias is not None else self.negative_ttl
+        return now - fetched < ttl
+
+    def get(self, account_number: str) -> tuple[bool, str | None]:
+        """
+        Look up a cached alias.
+
+        Returns:
+            tuple: (hit, alias). hit is False when there is no fresh entry; on a hit alias is
+                   None for an account that is known to have no alias.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute(
+                "SELECT alias, fetched_at FROM account_aliases WHERE account_number = ?", (str(account_number),)
+            ).fetchone()
+            conn.close()
+        except sqlite3.Error:
+            return False, None
+
+        if row is None or not self._is_fresh(row[0], row[1], datetime.now(timezone.utc)):
+            return False, None
+        return True, row[0]
+
+    def put(self, account_number: str, alias: str | None):
+        """Record an alias, or None for an account without one."""
+        self.put_many({account_number: alias})
+
+    def put_many(self, aliases: dict[str, str | None]):
+        """Record many aliases in one transaction."""
+        now_str = datetime.now(timezone.utc).isoformat()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.executemany(
+                "INSERT OR REPLACE INTO account_aliases (account_number, alias, fetched_at) VALUES (?, ?, ?)",
+                [(str(number), alias, now_str) for number, alias in aliases.items()],
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to update account alias cache: {str(e)}')
+
+    def fresh_aliases(self) -> dict[str, str]:
+        """Return every fresh, known alias as account number -> alias."""
+        now = datetime.now(timezone.utc)
+        aliases = {}
+        try:
+            conn = sqlite3.connect(self.db_path)
+            for number, alias, fetched_at in conn.execute(
+                    "SELECT account_number, alias, fetched_at FROM account_aliases WHERE alias IS NOT NULL"):
+                if self._is_fresh(alias, fetched_at, now):
+                    aliases[number] = alias
+            conn.close()
+        except sqlite3.Error:
+            pass
+        return aliases
+
+
+def lookup_alias(cache: AliasCache, account_number: str, fetch_alias) -> str | None:
+    """
+    Return the alias for an account from the cache, calling fetch_alias() and caching its
+    answer (including None) when there is no fresh entry. If fetch_alias() raises, None is
+    returned and nothing is cached.
+    """
+    hit, alias = cache.get(account_number)
+    if hit:
+        log_stream.debug(f'Account alias for {account_number} served from cache')
+        return alias
+    try:
+        alias = fetch_alias()
+    except Exception as e:
+        log_stream.warning(f'Unable to look up alias for account {account_number}: {str(e)}')
+        return None
+    cache.put(account_number, alias)
+    return alias
+
+
+def warm_alias_cache(cache: AliasCache, profile_accounts: dict[str, str], fetch_alias,
+                     force: bool = False, max_workers: int = 8) -> dict[str, str | None]:
+    """
+    Fill the cache for many accounts at once.
+
+    Args:
+        cache (AliasCache): Cache to fill
+        profile_accounts (dict): profile name -> account number; one profile per account is used
+        fetch_alias (callable): fetch_alias(profile) -> alias or None; accounts it raises for are skipped
+        force (bool): Refresh accounts that already have a fresh entry
+        max_workers (int): Concurrent ListAccountAliases calls
+
+    Returns:
+        dict: account number -> alias for every account that was looked up
+    """
+    profile_for_account = {}
+    for profile, account_number in profile_accounts.items():
+        if account_number and account_number not in profile_for_account:
+            profile_for_account[account_number] = profile
+
+    if not force:
+        profile_for_account = {number: profile for number, profile in profile_for_account.items()
+                               if not cache.get(number)[0]}
+    if not profile_for_account:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(profile_for_account)))) as executor:
+        futures = {number: executor.submit(fetch_alias, profile) for number, profile in profile_for_account.items()}
+        fetched = {}
+        for number, future in futures.items():
+            try:
+                fetched[number] = future.result()
+            except Exception as e:
+                log_stream.warning(f'Unable to look up alias for account {number}: {str(e)}')
+
+    cache.put_many(fetched)
+    return fetched
+
+
+def from_saml_config(aws_root, config_saml) -> AliasCache:
+    """
+    Build the cache for ~/.aws/aws_saml.db, taking TTLs from the samlsts global block
+    (aliasCacheTTL and aliasNegativeTTL, in seconds) when they are set.
+    """
+    ttl = DEFAULT_TTL_SECONDS
+    negative_ttl = DEFAULT_NEGATIVE_TTL_SECONDS
+    if config_saml is not None and config_saml.has_section('global'):
+        try:
+            ttl = int(config_saml.get('global', 'aliascachettl', fallback=ttl))
+            negative_ttl = int(config_saml.get('global', 'aliasnegativettl', fallback=negative_ttl))
+        except ValueError:
+            log_stream.warning('Invalid alias cache TTL in global settings, using defaults')
+    return AliasCache(f"{str(aws_root).rstrip('/')}/aws_saml.db", ttl, negative_ttl)
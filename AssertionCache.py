@@ -0,0 +1,165 @@
+# coding=utf-8
+"""
+Encrypted cache of captured SAML assertions, kept in ~/.aws/aws_saml.db.
+
+An assertion can be used for AssumeRoleWithSAML until the NotOnOrAfter it carries, so a
+second getCredentials or samlstat run for the same (SAML provider, username) identity can
+reuse it instead of opening a browser and sending another MFA push. Assertions are
+encrypted with the same Fernet key that protects the stored password, and entries are
+dropped as soon as they expire.
+"""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from cryptography.fernet import Fernet, InvalidToken
+
+import constants
+import Password
+import SAMLSelector
+from Logging import Logging
+
+log_stream = Logging('assertion_cache')
+
+
+class AssertionCache:
+    """Per-identity SAML assertions, encrypted at rest, valid until their NotOnOrAfter."""
+
+    def __init__(self, db_path, pass_key, reuse_margin_seconds: int | None = None):
+        """
+        Args:
+            db_path (str | Path): Path to aws_saml.db
+            pass_key (str): Path to the Fernet key file shared with the password store
+            reuse_margin_seconds (int, optional): An assertion this close to expiry is not handed out
+        """
+        self.db_path = str(db_path)
+        self.pass_key = pass_key
+        margin = constants.__assertion_reuse_margin__ if reuse_margin_seconds is None else reuse_margin_seconds
+        self.reuse_margin = timedelta(seconds=margin)
+        self._fernet = None
+        self._ensure_table()
+
+    def _ensure_table(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS saml_assertions "
+                "(saml_provider TEXT NOT NULL, username TEXT NOT NULL, assertion BLOB NOT NULL, "
+                "not_on_or_after TEXT NOT NULL, PRIMARY KEY (saml_provider, username))"
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to prepare SAML assertion cache: {str(e)}')
+
+    def _get_fernet(self):
+        if self._fernet is None:
+            self._fernet = Fernet(Password.load_or_create_key(self.pass_key))
+        return self._fernet
+
+    def evict_expired(self):
+        """Delete every assertion whose NotOnOrAfter has passed."""
+        now_str = datetime.now(timezone.utc).isoformat(timespec='microseconds')
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("DELETE FROM saml_assertions WHERE not_on_or_after <= ?", (now_str,))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def get(self, saml_provider: str, username: str) -> str | None:
+        """
+        Return a still-valid assertion for an identity, or None.
+
+        Args:
+            saml_provider (str): SAML provider name, e.g. OKTA
+            username (str): IdP username
+        """
+        self.evict_expired()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute(
+                "SELECT assertion, not_on_or_after FROM saml_assertions WHERE saml_provider = ? AND username = ?",
+                (saml_provider, str(username)),
+            ).fetchone()
+            conn.close()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+
+        not_on_or_after = datetime.fromisoformat(row[1])
+        if not_on_or_after - datetime.now(timezone.utc) <= self.reuse_margin:
+            return None
+
+        try:
+            saml_response = self._get_fernet().decrypt(row[0]).decode()
+        except InvalidToken:
+            log_stream.warning('Cached SAML assertion could not be decrypted, discarding it')
+            self.remove(saml_provider, username)
+            return None
+
+        remaining = int((not_on_or_after - datetime.now(timezone.utc)).total_seconds())
+        log_stream.info(f'Reusing cached SAML assertion for {username} via {saml_provider} ({remaining}s left)')
+        return saml_response
+
+    def valid_until(self, saml_provider: str, username: str) -> datetime | None:
+        """
+        When the cached assertion for an identity stops being handed out, or None if get() would return None.
+
+        Reads only the expiry, so it needs neither the key nor a decryption; used to plan a batch.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            row = conn.execute(
+                "SELECT not_on_or_after FROM saml_assertions WHERE saml_provider = ? AND username = ?",
+                (saml_provider, str(username)),
+            ).fetchone()
+            conn.close()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        usable_until = datetime.fromisoformat(row[0]) - self.reuse_margin
+        return usable_until if usable_until > datetime.now(timezone.utc) else None
+
+    def put(self, saml_provider: str, username: str, saml_response: str) -> bool:
+        """
+        Store an assertion for the rest of its validity window.
+
+        Returns:
+            bool: False when the assertion carries no NotOnOrAfter or has already expired
+        """
+        not_on_or_after = SAMLSelector.get_assertion_expiry(saml_response)
+        if not_on_or_after is None or not_on_or_after <= datetime.now(timezone.utc):
+            log_stream.debug('SAML assertion has no usable NotOnOrAfter, not caching it')
+            return False
+
+        encrypted = self._get_fernet().encrypt(saml_response.encode())
+        expiry_str = not_on_or_after.astimezone(timezone.utc).isoformat(timespec='microseconds')
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                "INSERT OR REPLACE INTO saml_assertions (saml_provider, username, assertion, not_on_or_after) "
+                "VALUES (?, ?, ?, ?)",
+                (saml_provider, str(username), encrypted, expiry_str),
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to cache SAML assertion: {str(e)}')
+            return False
+        self.evict_expired()
+        return True
+
+    def remove(self, saml_provider: str, username: str):
+        """Forget the assertion for an identity, e.g. after STS rejected it."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("DELETE FROM saml_assertions WHERE saml_provider = ? AND username = ?",
+                         (saml_provider, str(username)))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,211 @@
+# coding=utf-8
+"""
+Checkpoint journal for batch authentication, kept in ~/.aws/aws_saml.db.
+
+Every profile of a batch moves from planned to assertion (its group's SAML assertion was
+captured), assumed and written, or else to failed. The journal records each step, so a
+batch cut short by Ctrl+C, a laptop sleep or an MFA timeout can be continued with
+`samlstat auth --resume`. Profiles that were written and whose credentials are still
+valid are skipped, and a captured assertion that has not expired is reused instead of
+logging in again.
+
+Assertions are encrypted with the Fernet key that protects the stored password, and a
+batch's journal, assertions included, is deleted once every profile in it is written.
+"""
+
+import json
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from cryptography.fernet import Fernet, InvalidToken
+
+import constants
+import Password
+import SAMLSelector
+from Logging import Logging
+
+log_stream = Logging('batch_journal')
+
+PLANNED = 'planned'
+ASSERTION = 'assertion'
+ASSUMED = 'assumed'
+WRITTEN = 'written'
+FAILED = 'failed'
+
+_MAX_AGE = timedelta(days=7)
+
+
+def _ensure_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS batch_runs "
+                 "(batch_id TEXT PRIMARY KEY, profiles TEXT NOT NULL, created_at TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS batch_journal "
+                 "(batch_id TEXT NOT NULL, profile TEXT NOT NULL, state TEXT NOT NULL, updated_at TEXT NOT NULL, "
+                 "PRIMARY KEY (batch_id, profile))")
+    conn.execute("CREATE TABLE IF NOT EXISTS batch_journal_assertions "
+                 "(batch_id TEXT NOT NULL, saml_provider TEXT NOT NULL, username TEXT NOT NULL, "
+                 "assertion BLOB NOT NULL, not_on_or_after TEXT NOT NULL, "
+                 "PRIMARY KEY (batch_id, saml_provider, username))")
+
+
+def _delete_runs(conn, batch_ids):
+    for table in ('batch_journal_assertions', 'batch_journal', 'batch_runs'):
+        conn.executemany(f"DELETE FROM {table} WHERE batch_id = ?", [(batch_id,) for batch_id in batch_ids])
+
+
+def unfinished_profiles(db_path) -> list[str] | None:
+    """Profiles of the most recent batch that did not finish, or None when there is none."""
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_tables(conn)
+        row = conn.execute("SELECT profiles FROM batch_runs ORDER BY created_at DESC LIMIT 1").fetchone()
+        conn.close()
+    except sqlite3.Error:
+        return None
+    return json.loads(row[0]) if row else None
+
+
+class BatchJournal:
+    """The checkpoints of one batch."""
+
+    def __init__(self, db_path, pass_key, batch_id: str, profiles: list[str], resumed: bool = False):
+        self.db_path = str(db_path)
+        self.pass_key = pass_key
+        self.batch_id = batch_id
+        self.profiles = profiles
+        self.resumed = resumed
+        self._fernet = None
+
+    @classmethod
+    def start(cls, db_path, pass_key, profiles: list[str]):
+        """Journal a new batch, every profile planned; journals older than a week are dropped."""
+        journal = cls(db_path, pass_key, uuid.uuid4().hex, list(profiles))
+        now = datetime.now(timezone.utc)
+        try:
+            conn = sqlite3.connect(journal.db_path)
+            _ensure_tables(conn)
+            stale = [batch_id for batch_id, in conn.execute("SELECT batch_id FROM batch_runs WHERE created_at < ?",
+                                                            ((now - _MAX_AGE).isoformat(),))]
+            _delete_runs(conn, stale)
+            conn.execute("INSERT INTO batch_runs (batch_id, profiles, created_at) VALUES (?, ?, ?)",
+                         (journal.batch_id, json.dumps(journal.profiles), now.isoformat()))
+            conn.executemany("INSERT INTO batch_journal (batch_id, profile, state, updated_at) VALUES (?, ?, ?, ?)",
+                             [(journal.batch_id, profile, PLANNED, now.isoformat()) for profile in journal.profiles])
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to start the batch journal: {str(e)}')
+        return journal
+
+    @classmethod
+    def resume(cls, db_path, pass_key, profiles: list[str]):
+        """
+        The most recent unfinished batch for exactly these profiles, or None.
+
+        Profiles added to the batch since are not in it; start a new batch for those.
+        """
+        try:
+            conn = sqlite3.connect(str(db_path))
+            _ensure_tables(conn)
+            rows = conn.execute("SELECT batch_id, profiles FROM batch_runs ORDER BY created_at DESC").fetchall()
+            conn.close()
+        except sqlite3.Error:
+            return None
+        for batch_id, journaled in rows:
+            if set(json.loads(journaled)) == set(profiles):
+                return cls(db_path, pass_key, batch_id, json.loads(journaled), resumed=True)
+        return None
+
+    def _get_fernet(self):
+        if self._fernet is None:
+            self._fernet = Fernet(Password.load_or_create_key(self.pass_key))
+        return self._fernet
+
+    def states(self) -> dict[str, str]:
+        """profile -> its last recorded state."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            _ensure_tables(conn)
+            states = dict(conn.execute("SELECT profile, state FROM batch_journal WHERE batch_id = ?",
+                                       (self.batch_id,)))
+            conn.close()
+        except sqlite3.Error:
+            return {}
+        return states
+
+    def mark(self, profiles, state: str):
+        """Record that profiles reached state, in one transaction."""
+        profiles = list(profiles)
+        if not profiles:
+            return
+        now_str = datetime.now(timezone.utc).isoformat()
+        try:
+            conn = sqlite3.connect(self.db_path)
+            _ensure_tables(conn)
+            conn.executemany("INSERT OR REPLACE INTO batch_journal (batch_id, profile, state, updated_at) "
+                             "VALUES (?, ?, ?, ?)", [(self.batch_id, profile, state, now_str) for profile in profiles])
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to update the batch journal: {str(e)}')
+
+    def save_assertion(self, saml_provider: str, username: str, saml_response: str):
+        """Keep a group's captured assertion, encrypted, until it expires or the batch finishes."""
+        not_on_or_after = SAMLSelector.get_assertion_expiry(saml_response)
+        if not_on_or_after is None:
+            return
+        encrypted = self._get_fernet().encrypt(saml_response.encode())
+        try:
+            conn = sqlite3.connect(self.db_path)
+            _ensure_tables(conn)
+            conn.execute("INSERT OR REPLACE INTO batch_journal_assertions "
+                         "(batch_id, saml_provider, username, assertion, not_on_or_after) VALUES (?, ?, ?, ?, ?)",
+                         (self.batch_id, saml_provider, str(username), encrypted,
+                          not_on_or_after.astimezone(timezone.utc).isoformat()))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to journal the SAML assertion: {str(e)}')
+
+    def assertion(self, saml_provider: str, username: str) -> str | None:
+        """The group's journaled assertion while it can still be used, else None."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            _ensure_tables(conn)
+            row = conn.execute("SELECT assertion, not_on_or_after FROM batch_journal_assertions "
+                               "WHERE batch_id = ? AND saml_provider = ? AND username = ?",
+                               (self.batch_id, saml_provider, str(username))).fetchone()
+            conn.close()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        margin = timedelta(seconds=constants.__assertion_reuse_margin__)
+        if datetime.fromisoformat(row[1]) - datetime.now(timezone.utc) <= margin:
+            return None
+        try:
+            return self._get_fernet().decrypt(row[0]).decode()
+        except InvalidToken:
+            log_stream.warning('Journaled SAML assertion could not be decrypted, logging in again')
+            return None
+
+    def forget_assertion(self, saml_provider: str, username: str):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("DELETE FROM batch_journal_assertions WHERE batch_id = ? AND saml_provider = ? "
+                         "AND username = ?", (self.batch_id, saml_provider, str(username)))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def finish(self):
+        """Drop the journal of a batch whose profiles are all written."""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            _ensure_tables(conn)
+            _delete_runs(conn, [self.batch_id])
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            log_stream.warning(f'Unable to clear the batch journal: {str(e)}')
@@ -0,0 +1,298 @@
+# coding=utf-8
+"""
+Execution plan for a batch authentication (samlstat auth with several profiles).
+
+build() reads everything a batch depends on once: the compiled samlsts table, the [global]
+STS, assertion-cache and compaction settings, which login groups still hold a reusable
+cached assertion, and the timings recorded by earlier batches. The BatchPlan it returns
+lists:
+
+- the login groups, one per (SAML provider, username), each with its browser
+- the profiles that are skipped, and why
+- profiles of one login that assume the same role with the same SAML provider and session
+  duration, which share one AssumeRoleWithSAML call because STS would return the same
+  session for each
+- an estimate of browser logins, STS calls and wall time
+- warnings for profiles that would expire before the batch reaches them
+
+Groups, and the profiles within each, are ordered most urgent first by Scheduler.
+
+perform_batch_auth runs a plan without reading samlsts again, and `samlstat auth --plan`
+prints one without logging in. Timings live in the batch_timings table of
+~/.aws/aws_saml.db: one row per browser login, and one per group fan-out in seconds per
+round of concurrent STS calls.
+"""
+
+import heapq
+import math
+import sqlite3
+import statistics
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import constants
+import Scheduler
+import TokenState
+from Logging import Logging
+
+log_stream = Logging('batch_plan')
+
+DEFAULT_LOGIN_SECONDS = 25.0
+DEFAULT_ASSUME_SECONDS = 0.5
+_TIMINGS_KEPT = 200
+_RECENT_SAMPLES = 20
+
+
+def _ensure_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS batch_timings "
+        "(kind TEXT NOT NULL, saml_provider TEXT, username TEXT, seconds REAL NOT NULL, recorded_at TEXT NOT NULL)"
+    )
+
+
+def load_timings(db_path) -> dict[str, list[tuple[str, str, float]]]:
+    """kind ('login' or 'assume') -> [(saml_provider, username, seconds), ...], newest first."""
+    timings = defaultdict(list)
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        for kind, saml_provider, username, seconds in conn.execute(
+                "SELECT kind, saml_provider, username, seconds FROM batch_timings ORDER BY recorded_at DESC"):
+            timings[kind].append((saml_provider, username, seconds))
+        conn.close()
+    except sqlite3.Error:
+        pass
+    return dict(timings)
+
+
+def record_timings(db_path, rows):
+    """
+    Record how long a batch's logins and STS rounds took, keeping the newest rows of each kind.
+
+    Args:
+        rows (list): (kind, saml_provider, username, seconds) tuples
+    """
+    if not rows:
+        return
+    now_str = datetime.now(timezone.utc).isoformat()
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        conn.executemany(
+            "INSERT INTO batch_timings (kind, saml_provider, username, seconds, recorded_at) VALUES (?, ?, ?, ?, ?)",
+            [(kind, saml_provider, username, seconds, now_str) for kind, saml_provider, username, seconds in rows],
+        )
+        for kind in {row[0] for row in rows}:
+            conn.execute(
+                "DELETE FROM batch_timings WHERE kind = ? AND rowid NOT IN "
+                "(SELECT rowid FROM batch_timings WHERE kind = ? ORDER BY recorded_at DESC, rowid DESC LIMIT ?)",
+                (kind, kind, _TIMINGS_KEPT),
+            )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        log_stream.warning(f'Unable to record batch timings: {str(e)}')
+
+
+def _estimate(timings: dict, kind: str, login: tuple, default: float) -> tuple[float, bool]:
+    """Median of this login's recent samples, else of everyone's, else the default; and whether history was used."""
+    samples = timings.get(kind, [])
+    own = [seconds for saml_provider, username, seconds in samples if (saml_provider, username) == login]
+    for values in (own, [seconds for _, _, seconds in samples]):
+        if values:
+            return statistics.median(values[:_RECENT_SAMPLES]), True
+    return default, False
+
+
+def _profile_info(record: dict) -> dict:
+    return {key: record[key] for key in ('saml_provider', 'username', 'account_number', 'iam_role', 'aws_region',
+                                         'session_duration', 'role_arn', 'principal_arn', 'gui_name', 'login_page',
+                                         'login_title', 'dsso_url', 'browser')}
+
+
+class BatchPlan:
+    """What a batch will do, resolved from one read of its inputs."""
+
+    def __init__(self):
+        self.requested = []
+        self.profile_info = {}
+        self.skipped = {}
+        self.groups = []
+        self.settings = {}
+        self.assertion_cache = None
+        self.estimate = {}
+        self.warnings = []
+
+    @property
+    def shared(self) -> dict[str, str]:
+        """profile -> the profile whose AssumeRoleWithSAML call it reuses."""
+        return {copy: source for group in self.groups for copy, source in group['copies'].items()}
+
+    def exclude(self, profiles):
+        """Leave profiles out of the groups, e.g. those a resumed batch already wrote; empty groups are dropped."""
+        profiles = set(profiles)
+        groups = []
+        for group in self.groups:
+            remaining = [profile for profile in group['profiles'] if profile not in profiles]
+            if remaining:
+                group['profiles'] = remaining
+                group['assume'], group['copies'] = _split_shared(self.profile_info, remaining)
+                groups.append(group)
+        self.groups = groups
+
+    def group_for(self, saml_provider: str, username: str) -> dict | None:
+        return next((group for group in self.groups
+                     if (group['saml_provider'], group['username']) == (saml_provider, username)), None)
+
+
+def _split_shared(profile_info: dict, group_profiles: list[str]) -> tuple[list[str], dict[str, str]]:
+    """
+    (profiles whose role is assumed, {profile: profile whose session it shares}) for one group.
+
+    A profile shares another's session only when every AssumeRoleWithSAML parameter matches,
+    so a different sessionDuration gets its own call and its own lifetime.
+    """
+    assume, copies, first_for_identity = [], {}, {}
+    for profile in group_profiles:
+        info = profile_info[profile]
+        identity = (info['role_arn'], info['principal_arn'], info['session_duration'])
+        if identity in first_for_identity:
+            copies[profile] = first_for_identity[identity]
+        else:
+            first_for_identity[identity] = profile
+            assume.append(profile)
+    return assume, copies
+
+
+def _plan_groups(plan: BatchPlan, browser: str | None):
+    members = defaultdict(list)
+    for profile, info in plan.profile_info.items():
+        members[(info['saml_provider'], info['username'])].append(profile)
+
+    for (saml_provider, username), group_profiles in members.items():
+        assume, copies = _split_shared(plan.profile_info, group_profiles)
+        plan.groups.append({
+            'saml_provider': saml_provider,
+            'provider_name': saml_provider.split('-', 1)[1] if '-' in saml_provider else saml_provider,
+            'username': username,
+            'profiles': group_profiles,
+            'assume': assume,
+            'copies': copies,
+            'browser': browser or plan.profile_info[group_profiles[0]]['browser'] or 'chrome',
+            'cached_assertion': False,
+        })
+
+
+def _estimate_plan(plan: BatchPlan, timings: dict):
+    """Fill in per-group and batch estimates by replaying the batch's login pool and STS stage."""
+    from_history = False
+    login_slots = [0.0] * max(1, min(constants.__login_max_workers__,
+                                     sum(1 for group in plan.groups if not group['cached_assertion'])))
+    ready = []
+    for group in plan.groups:
+        login = (group['saml_provider'], group['username'])
+        assume_seconds, used = _estimate(timings, 'assume', login, DEFAULT_ASSUME_SECONDS)
+        from_history = from_history or used
+        rounds = math.ceil(len(group['assume']) / min(len(group['assume']), constants.__sts_max_workers__))
+        group['sts_seconds'] = rounds * assume_seconds
+        group['login_seconds'] = 0.0
+        if group['cached_assertion']:
+            ready.append((0.0, group['rank'], group))
+            continue
+        group['login_seconds'], used = _estimate(timings, 'login', login, DEFAULT_LOGIN_SECONDS)
+        from_history = from_history or used
+        finished = heapq.heappop(login_slots) + group['login_seconds']
+        heapq.heappush(login_slots, finished)
+        ready.append((finished, group['rank'], group))
+
+    # STS fan-outs run one group at a time, each as soon as its assertion is ready, the most
+    # urgent first when several are waiting
+    clock = 0.0
+    for ready_at, _, group in sorted(ready, key=lambda entry: entry[:2]):
+        clock = max(clock, ready_at) + group['sts_seconds']
+        group['finish_seconds'] = clock
+
+    plan.estimate = {
+        'logins': sum(1 for group in plan.groups if not group['cached_assertion']),
+        'cached_groups': sum(1 for group in plan.groups if group['cached_assertion']),
+        'sts_calls': sum(len(group['assume']) for group in plan.groups),
+        'seconds': clock,
+        'from_history': from_history,
+    }
+
+
+def _schedule(plan: BatchPlan, expirations: dict, pinned: set, now: datetime):
+    """Order each group's profiles, then the groups by their most urgent profile (Scheduler)."""
+    expiry_queue = Scheduler.ExpiryQueue(now)
+    for group in plan.groups:
+        ordered = Scheduler.order(group['profiles'], expirations, pinned, now)
+        group['profiles'] = [profile for _, profile in ordered]
+        group['assume'], group['copies'] = _split_shared(plan.profile_info, group['profiles'])
+        expiry_queue.push_key(ordered[0][0], group['username'], group)
+    plan.groups = [group for _, _, group in expiry_queue.drain()]
+    for rank, group in enumerate(plan.groups):
+        group['rank'] = rank
+
+
+def _warn_late(plan: BatchPlan, expirations: dict, now: datetime, deadline_seconds: int | None):
+    for profile, (expiration, refreshed_at) in sorted(Scheduler.lapses(plan.groups, expirations, now).items()):
+        plan.warnings.append(f"{profile} expires in {(expiration - now).total_seconds() / 60:.0f}m "
+                             f"but is refreshed after ~{(refreshed_at - now).total_seconds() / 60:.0f}m")
+    if deadline_seconds is not None and plan.estimate['seconds'] > deadline_seconds:
+        plan.warnings.append(f"Batch needs ~{plan.estimate['seconds']:.0f}s, "
+                             f"more than the {deadline_seconds}s deadline")
+
+
+def build(profiles: list[str], config_obj, browser: str | None = None,
+          deadline_seconds: int | None = None, probe_sts: bool = True) -> BatchPlan:
+    """
+    Plan a batch for the requested profiles.
+
+    Args:
+        profiles (list): Profile names, in the order requested; repeats are planned once
+        config_obj (Config.Config): Source of the compiled samlsts table and global settings
+        browser (str, optional): Browser for every group, overriding samlsts
+        deadline_seconds (int, optional): Warn when the estimate says the batch takes longer
+        probe_sts (bool): Probe the regional STS endpoints when their stored ranking is stale;
+            a plan that is only shown passes False and reads the stored ranking alone
+
+    Returns:
+        BatchPlan
+    """
+    index = config_obj.profile_index()
+    plan = BatchPlan()
+    plan.requested = list(dict.fromkeys(profiles))
+
+    for profile in plan.requested:
+        record = index.get(profile)
+        if record is None:
+            plan.skipped[profile] = 'No such profile in samlsts'
+        elif record['problems']:
+            plan.skipped[profile] = '; '.join(record['problems'])
+        else:
+            plan.profile_info[profile] = _profile_info(record)
+            plan.profile_info[profile]['session_duration'] = index.batch_session_duration(profile)
+
+    pass_key, pass_file = config_obj.return_stored_pass_config()
+    plan.assertion_cache = config_obj.get_assertion_cache()
+    plan.settings = {
+        'sts_backend': config_obj.get_sts_backend(),
+        'sts_region': config_obj.get_sts_endpoint_region(probe=probe_sts) if plan.profile_info else None,
+        'cache_assertions': plan.assertion_cache is not None,
+        'compact': config_obj.compaction_enabled(),
+        'pass_key': pass_key,
+        'pass_file': pass_file,
+        'db_path': config_obj.SamlDB,
+    }
+
+    now = datetime.now(timezone.utc)
+    expirations = TokenState.load_expirations(config_obj.SamlDB)
+    _plan_groups(plan, browser)
+    _schedule(plan, expirations, Scheduler.load_pinned(config_obj.SamlDB), now)
+    if plan.assertion_cache is not None:
+        for group in plan.groups:
+            group['cached_assertion'] = plan.assertion_cache.valid_until(group['provider_name'],
+                                                                         group['username']) is not None
+    _estimate_plan(plan, load_timings(config_obj.SamlDB))
+    _warn_late(plan, expirations, now, deadline_seconds)
+    return plan
@@ -2,6 +2,7 @@ import json
 import os
 import re
 import sys
+import threading
 from pathlib import Path
 import requests
 
@@ -22,6 +23,9 @@ operating_system_type = os_info.which_os_type()
 selenium_timeout = constants.__timeout__
 script_execute_path = Utilities.get_script_exec_path()
 
+# Batch logins start browsers concurrently; only one of them replaces a driver on disk at a time
+_driver_download_lock = threading.Lock()
+
 
 def gecko_from_snap():
     driver_loc = None
@@ -324,7 +328,8 @@ def setup_browser(user_browser, use_debug):
             # A stale or broken driver on disk still fails, so always fetch a
             # fresh one on the retry rather than reusing whatever is present
             log_stream.info('Attempting to download the latest geckodriver')
-            download_gecko_driver()
+            with _driver_download_lock:
+                download_gecko_driver()
             firefox_service = FirefoxService(executable_path=driver_executable)
             try:
                 driver = webdriver.Firefox(service=firefox_service, options=browser_options)
@@ -358,7 +363,8 @@ def setup_browser(user_browser, use_debug):
             # A stale or broken driver on disk still fails, so always fetch a
             # fresh one on the retry rather than reusing whatever is present
             log_stream.info('Attempting to download the latest chromedriver')
-            download_chromedriver()
+            with _driver_download_lock:
+                download_chromedriver()
             chrome_service = ChromeService(executable_path=driver_executable)
             try:
                 driver = webdriver.Chrome(service=chrome_service, options=browser_options)
@@ -390,7 +396,8 @@ def setup_browser(user_browser, use_debug):
             # A stale or broken driver on disk still fails, so always fetch a
             # fresh one on the retry rather than reusing whatever is present
             log_stream.info('Attempting to download the latest msedgedriver')
-            download_edgedriver()
+            with _driver_download_lock:
+                download_edgedriver()
             edge_service = EdgeService(executable_path=driver_executable)
             try:
                 driver = webdriver.Edge(service=edge_service, options=browser_options)
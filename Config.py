@@ -1,12 +1,24 @@
 # coding=utf-8
 import configparser
-import json
 import os
 import re
+import stat
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
 
+import AccountDirectory
+import AliasCache
+import AssertionCache
 import AWS
+import ConfigSnapshot
 import constants
+import CredentialsGC
+import FileLock
+import IniPatch
+import ProfileIndex
+import STSEndpoints
+import TokenState
 from Logging import Logging
 from typing import Dict, Tuple
 
@@ -38,6 +50,63 @@ def missing_config_file_message():
     raise SystemExit(1)
 
 
+def atomic_write_text(path, text: str, mode: int = 0o600, skip_unchanged: bool = True) -> bool:
+    """
+    Replace a file's contents atomically: write a temp file beside it, fsync, then rename over it.
+
+    A reader (or an interrupted run) sees either the old file or the new one, never a truncated one.
+    A symlink (e.g. a dotfiles-managed ~/.aws/config) is followed, so the file it points to is
+    replaced and the link kept, and an existing file keeps its permissions.
+
+    Args:
+        path (str | Path): File to replace
+        text (str): New contents
+        mode (int): Permissions when the file does not exist yet
+        skip_unchanged (bool): Read the file first and leave it alone if it already holds this text
+
+    Returns:
+        bool: False when the file already held exactly this text and was left alone
+    """
+    path = Path(os.path.realpath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        pass
+    try:
+        if skip_unchanged and path.read_text() == text:
+            return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    fd, temp_name = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'w') as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+        raise
+
+    # Persist the rename itself; not every platform lets a directory be opened
+    try:
+        dir_fd = os.open(str(path.parent), os.O_RDONLY)
+    except OSError:
+        return True
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+    return True
+
+
 def validate_aws_cred_format(aws_access_id, aws_secret_key, aws_session_token):
     valid_key_pattern = re.compile(r'^[a-zA-Z0-9]{16,128}$')
     valid_secret_pattern = re.compile(r'^[a-zA-Z0-9\/+]{30,100}$')
@@ -70,38 +139,106 @@ def get_aws_variables(conf_region, conf_duration, arg_aws_region, arg_session_du
 
 class Config:
     def __init__(self):
-        import stat
-        
+        """
+        Work out where the config files live; nothing is read or written here.
+
+        samlsts, credentials and config are each parsed on first access. Creating missing
+        files on a first run is bootstrap()'s job.
+        """
         self.executePath = str(Path(__file__).resolve().parents[0])
 
         home = str(Path.home())
         self.AWSRoot = f"{home}/.aws/"
-        
-        # Ensure .aws directory exists with secure permissions (0700 - owner only)
-        aws_dir = Path(self.AWSRoot)
-        aws_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
-        
         self.awsSAMLFile = f"{self.AWSRoot}samlsts"
+        self.awsCredentialsFile = f"{self.AWSRoot}credentials"
+        self.awsConfigFile = f"{self.AWSRoot}config"
+        self.PassFile = f"{self.AWSRoot}saml.pass"
+        self.PassKey = f"{self.AWSRoot}saml.key"
+        self.AccountMap = f"{self.AWSRoot}account-map.json"
+        self.SamlDB = f"{self.AWSRoot}aws_saml.db"
+        self._configSAML = None
+        self._configCredentials = None
+        self._configConfig = None
+        self._profile_index = None
+        self._alias_cache = None
+        self._account_directory = None
+        self._pending_accounts = {}
+        self._pending_expirations = {}
+        self._in_transaction = False
+        self._staged_sections = {}
+
+    @property
+    def configSAML(self) -> configparser.ConfigParser:
+        if self._configSAML is None:
+            if not Path(self.awsSAMLFile).is_file():
+                log_stream.warning(f'{self.awsSAMLFile} is missing, run getCredentials.py or samlstat init to create it')
+            self._configSAML = ConfigSnapshot.read_config(self.awsSAMLFile)
+        return self._configSAML
+
+    @configSAML.setter
+    def configSAML(self, parser):
+        self._configSAML = parser
+        self._profile_index = None
+
+    def profile_index(self) -> ProfileIndex.ProfileIndex:
+        """
+        The compiled profile table for configSAML, kept current by this instance's writes.
+
+        Until samlsts has been parsed here it is a copy of the compiled snapshot, which loads
+        without parsing the file at all.
+        """
+        if self._profile_index is None:
+            if self._configSAML is None:
+                self._profile_index = ConfigSnapshot.profile_index(self.awsSAMLFile).copy()
+            else:
+                self._profile_index = ProfileIndex.ProfileIndex(self.configSAML._sections)
+        return self._profile_index
+
+    @property
+    def configCredentials(self) -> configparser.ConfigParser:
+        if self._configCredentials is None:
+            self._configCredentials = ConfigSnapshot.read_config(self.awsCredentialsFile)
+        return self._configCredentials
+
+    @configCredentials.setter
+    def configCredentials(self, parser):
+        self._configCredentials = parser
+
+    @property
+    def configConfig(self) -> configparser.ConfigParser:
+        if self._configConfig is None:
+            self._configConfig = ConfigSnapshot.read_config(self.awsConfigFile)
+        return self._configConfig
+
+    @configConfig.setter
+    def configConfig(self, parser):
+        self._configConfig = parser
+
+    def bootstrap(self, interactive: bool = True) -> bool:
+        """
+        First-run setup: create ~/.aws (0700), and samlsts, credentials and config (0600) if missing.
+
+        Args:
+            interactive (bool): Ask for the IdP details when samlsts is missing; otherwise
+                explain what the file must contain and exit
+
+        Returns:
+            bool: True if anything was created
+        """
+        created = False
+        Path(self.AWSRoot).mkdir(mode=0o700, parents=True, exist_ok=True)
 
         if not Path(self.awsSAMLFile).is_file():
+            if not interactive:
+                missing_config_file_message()
             log_stream.warning('No SAML-STS file, one will be built for you using a series of questions')
-            idp_name: str = self.get_saml_info()
-            self.configSAML = configparser.ConfigParser()
-            self.configSAML.read(self.awsSAMLFile)
+            self.get_saml_info()
             # Set secure permissions on SAML config file
             os.chmod(self.awsSAMLFile, 0o600)
-        elif not Path(self.awsSAMLFile).is_file() and not Path('/.dockerenv').is_file():
-            missing_config_file_message()
-        else:
-            self.configSAML = configparser.ConfigParser()
-            self.configSAML.read(self.awsSAMLFile)
+            self._configSAML = None
+            created = True
 
-        # READ IN AWS CREDENTIALS
-        self.awsCredentialsFile = f"{self.AWSRoot}credentials"
-        if Path(self.awsCredentialsFile).is_file() is True:
-            self.configCredentials = configparser.ConfigParser()
-            self.configCredentials.read(self.awsCredentialsFile)
-        else:
+        if not Path(self.awsCredentialsFile).is_file():
             log_stream.warning(f'AWS credentials file {self.awsCredentialsFile} is missing, this must be the initial run')
             log_stream.info('This program will create an AWS credentials file for you.')
 
@@ -109,25 +246,21 @@ class Config:
                 creds.write("#This is your AWS credentials file\n")
             # Set secure permissions on credentials file (owner read/write only)
             os.chmod(self.awsCredentialsFile, 0o600)
+            self._configCredentials = None
+            created = True
 
-        self.awsConfigFile = f"{self.AWSRoot}config"
-        if Path(self.awsConfigFile).is_file() is True:
-            self.configConfig = configparser.ConfigParser()
-            self.configConfig.read(self.awsConfigFile)
-        else:
+        if not Path(self.awsConfigFile).is_file():
             log_stream.critical(f'AWS config file {self.awsConfigFile} is missing, this must be the initial run')
             log_stream.critical('This program will create an AWS config file for you.')
 
             self.create_aws_config()
-            self.configConfig = configparser.ConfigParser()
-            self.configConfig.read(self.awsConfigFile)
             # Set secure permissions on config file
             os.chmod(self.awsConfigFile, 0o600)
+            self._configConfig = None
             log_stream.info('Return to normal operations')
+            created = True
 
-        self.PassFile = f"{self.AWSRoot}saml.pass"
-        self.PassKey = f"{self.AWSRoot}saml.key"
-        self.AccountMap = f"{self.AWSRoot}account-map.json"
+        return created
 
     def get_saml_info(self):
         idp_name = "default"
@@ -152,53 +285,77 @@ class Config:
     def return_account_map_file(self):
         return self.AccountMap
 
-    def create_new_map_file(self):
-        with open(self.AccountMap, 'w') as mapfh:
-            mapfh.write('[]')
+    def get_account_directory(self) -> AccountDirectory.AccountDirectory:
+        """
+        The account number -> name directory in aws_saml.db, with account-map.json imported
+        into it whenever the file has changed since the last import.
+        """
+        if self._account_directory is None:
+            self._account_directory = AccountDirectory.AccountDirectory(self.SamlDB)
+            try:
+                self._account_directory.import_file(self.AccountMap)
+            except FileNotFoundError:
+                pass
+            except (ValueError, OSError) as e:
+                log_stream.warning(f'Ignoring account map file {self.AccountMap}: {str(e)}')
+        return self._account_directory
+
+    def export_account_map(self, path=None) -> int:
+        """
+        Write the account directory out as account-map.json.
 
-    def check_for_map_file(self):
-        if not Path(self.AccountMap).is_file():
-            log_stream.info('Starting a new accounts map file')
-            self.create_new_map_file()
+        Returns:
+            int: How many accounts were written
+        """
+        directory = self.get_account_directory()
+        path = path or self.AccountMap
+        with FileLock.locked(self.AWSRoot):
+            text = directory.export_text()
+            atomic_write_text(path, text, 0o644)
+            if str(path) == self.AccountMap:
+                # Our own export is not news to the next import
+                directory.import_file(path)
+        return len(directory)
+
+    def get_alias_cache(self) -> AliasCache.AliasCache:
+        if self._alias_cache is None:
+            self._alias_cache = AliasCache.from_saml_config(self.AWSRoot, self.configSAML)
+        return self._alias_cache
+
+    def get_assertion_cache(self):
+        """
+        Return the encrypted SAML assertion cache, or None when cacheAssertion = false
+        is set in the global block.
+        """
+        if str(self._get_config_value('global', 'cacheassertion', 'true')).lower() in ('false', 'no', '0'):
+            return None
+        return AssertionCache.AssertionCache(self.SamlDB, self.PassKey)
 
     def write_account_to_map_file(self, account_name, account_number):
-        with open(self.AccountMap, 'r') as mapfile:
-            account_map: list = json.loads(mapfile.read())
+        self.get_alias_cache().put(account_number, account_name)
 
-        account_map_entry = {"name": account_name, "number": account_number}
-        if account_map_entry not in account_map:
-            account_map.append(account_map_entry)
+        # Written now, or in one batch when the enclosing transaction() commits
+        self._pending_accounts[str(account_number)] = account_name
+        if not self._in_transaction:
+            self._flush_accounts()
 
-        with open(self.AccountMap, 'w') as mapfile:
-            mapfile.write(json.dumps(account_map))
+    def _flush_accounts(self):
+        if self._pending_accounts:
+            pending, self._pending_accounts = self._pending_accounts, {}
+            self.get_account_directory().upsert_many(pending)
 
-    def read_map_file(self):
-        account_map_file = self.return_account_map_file()
-        try:
-            with open(account_map_file, 'r') as mapfile:
-                account_map_data = json.loads(mapfile.read())
-            
-            # Validate that data is a list
-            if not isinstance(account_map_data, list):
-                log_stream.warning(f'Account map file has invalid format: expected list, got {type(account_map_data).__name__}')
-                log_stream.info('Recreating account map file with valid format')
-                self.create_new_map_file()
-                return []
-            
-            return account_map_data
-        except FileNotFoundError:
-            log_stream.warning('No map file found, using account numbers in display')
+    def read_map_file(self) -> Dict[str, str]:
+        """
+        Account number -> name for the text menu: the account directory, plus fresh cached
+        aliases for accounts it does not name yet.
+        """
+        account_map = self.get_account_directory().all()
+        if not account_map:
+            log_stream.info('No account names known yet, using account numbers in display')
             log_stream.info('The accounts map configuration can be provided to you by your AWS team')
-            self.check_for_map_file()
-            return []
-        except json.JSONDecodeError as e:
-            log_stream.warning(f'Account map file is corrupted (invalid JSON): {str(e)}')
-            log_stream.info('Recreating account map file with valid format')
-            self.create_new_map_file()
-            return []
-        except (IOError, OSError) as e:
-            log_stream.warning(f'Unable to read account map file: {str(e)}')
-            return []
+        for number, alias in self.get_alias_cache().fresh_aliases().items():
+            account_map.setdefault(number, alias)
+        return account_map
 
     def _get_config_value(self, section: str, key: str, default=None):
         """
@@ -220,104 +377,192 @@ class Config:
 
     def read_global_settings(self)-> Tuple[str, str, str, str, int, str]:
         log_stream.info('Read settings from global block')
-        
-        browser = self._get_config_value('global', 'browser')
-        session_duration = self._get_config_value('global', 'sessionduration', 0)
-        saved_password = self._get_config_value('global', 'savedpassword')
-        username = self._get_config_value('global', 'username')
-        aws_region = self._get_config_value('global', 'awsregion')
-        saml_provider = self._get_config_value('global', 'samlprovider')
 
-        return str(aws_region), str(username), str(saved_password), str(saml_provider), int(session_duration), str(browser)
+        settings = self.profile_index().global_settings()
+
+        return str(settings['aws_region']), str(settings['username']), str(settings['saved_password']), \
+            str(settings['saml_provider']), int(settings['session_duration']), str(settings['browser'])
+
+    def get_sts_backend(self) -> str:
+        """
+        Return the STS transport to use: 'boto3' (default) or 'query' for the boto3-free client.
+        Set with stsbackend in the global block; AWS_SAML_STS_BACKEND applies when it is absent.
+        """
+        backend = str(self._get_config_value('global', 'stsbackend', constants.__sts_backend__)).lower()
+        if backend not in AWS.STS_BACKENDS:
+            log_stream.warning(f'Unknown STS backend {backend}, using boto3')
+            backend = 'boto3'
+        return backend
+
+    def get_sts_endpoint_region(self, probe=True):
+        """
+        Return the region of the fastest regional STS endpoint when stsEndpointProbe is enabled
+        in the global block, otherwise None. Candidates come from stsRegions (comma separated)
+        and the ranking is reused for stsProbeTTL seconds. With probe=False only a stored
+        ranking is used, and None is returned when there is none yet.
+        """
+        if str(self._get_config_value('global', 'stsendpointprobe', 'false')).lower() not in ('true', 'yes', '1'):
+            return None
+        regions = [region.strip() for region in
+                   str(self._get_config_value('global', 'stsregions',
+                                              ','.join(STSEndpoints.DEFAULT_CANDIDATE_REGIONS))).split(',')
+                   if region.strip()]
+        try:
+            ttl = int(self._get_config_value('global', 'stsprobettl', STSEndpoints.DEFAULT_PROBE_TTL_SECONDS))
+        except ValueError:
+            ttl = STSEndpoints.DEFAULT_PROBE_TTL_SECONDS
+        return STSEndpoints.fastest_region(self.SamlDB, regions, ttl, probe=probe)
 
     def read_config(self, aws_profile_name, text_menu, use_idp, arg_username) -> Tuple[str, str, str, str, str, int, str, str, str, str, str, str, str]:
+        """
+        Resolve everything a login needs from the compiled profile table.
+
+        A profile with problems is rejected with all of them listed, not just the first.
+        """
+        index = self.profile_index()
+        settings = index.global_settings()
+        browser = settings['browser']
+        saved_password = settings['saved_password']
         account_number = None
         gui_name = None
-        session_duration = 0
         principle_arn = None
         role_arn = None
-        aws_region = None
-        browser = None
-        username = None
-        saml_provider = None
-        saved_password = None
-        dsso_url = None
-
-        # check for global variables. read if any, these will be overwritten by CLI and configuration in account blocks
-        aws_region, username, saved_password, saml_provider, session_duration, browser \
-            = self.read_global_settings()
 
         if text_menu is False and aws_profile_name is not None:
-            try:
-                self.configSAML.has_option(aws_profile_name, 'samlprovider')
-            except configparser.NoSectionError as e:
+            record = index.get(aws_profile_name)
+            if record is None:
                 log_stream.fatal(f'No such AWS profile {aws_profile_name}')
                 raise SystemExit(1)
 
             log_stream.info(f'Reading configuration info for profile {aws_profile_name}')
-            profile = self.configSAML[aws_profile_name]
-            try:
-                aws_region = profile.get('awsregion', fallback=aws_region)
-            except KeyError:
-                aws_region = None
-
-            if session_duration == 0:
-                session_duration = profile.get('sessionduration','3600')
-
-            try:
-                account_number = profile.get('accountnumber')
-                iam_role = profile.get('iamrole')
-                saml_provider = profile.get('samlprovider', fallback=saml_provider)
-                username = profile.get('username', fallback=username)
-                gui_name = profile.get('guiname')
-            except KeyError as missing_config_error:
-                missing_config_property: str = missing_config_error.args[0]
-                log_stream.fatal(f'Missing configuration property: {missing_config_property}')
+            if record['problems']:
+                for problem in record['problems']:
+                    log_stream.fatal(f'Profile {aws_profile_name}: {problem}')
                 raise SystemExit(1)
-            role_arn = f"arn:aws:iam::{account_number}:role/{iam_role}"
-            saml_provider_name = saml_provider.split('-', 1)[1]
-            principle_arn = f"arn:aws:iam::{account_number}:saml-provider/{saml_provider_name}"
+
+            aws_region = record['aws_region']
+            session_duration = record['session_duration']
+            account_number = record['account_number']
+            saml_provider = record['saml_provider']
+            username = record['username']
+            gui_name = record['gui_name']
+            role_arn = record['role_arn']
+            saml_provider_name = record['provider_name']
+            principle_arn = record['principal_arn']
+            first_page, idp_login_title, dsso_url = record['login_page'], record['login_title'], record['dsso_url']
         else:
+            aws_region = settings['aws_region'] or ProfileIndex.DEFAULT_REGION
+            session_duration = settings['session_duration'] or ProfileIndex.DEFAULT_SESSION_DURATION
             saml_provider = use_idp
             saml_provider_name = use_idp.split('-', 1)[1]
             username = arg_username
 
-        log_stream.info(f'Reading configuration for SAML provider {saml_provider_name}')
-        try:
-            self.configSAML.get(saml_provider, 'loginpage')
-        except configparser.NoSectionError:
-            log_stream.fatal(f'No such SAML provider {saml_provider_name}')
-            raise SystemExit(1)
-        try:
-            first_page = self.configSAML[saml_provider]['loginpage']
-            idp_login_title = str(self.configSAML[saml_provider]['loginTitle']).replace('"', '')
-        except KeyError as missing_saml_provider_error:
-            missing_saml_provider_property: str = missing_saml_provider_error.args[0]
-            log_stream.fatal(f'Missing SAML provider configuration property {missing_saml_provider_property}')
-            raise SystemExit(1)
+            log_stream.info(f'Reading configuration for SAML provider {saml_provider_name}')
+            provider = index.providers.get(saml_provider)
+            if provider is None:
+                log_stream.fatal(f'No such SAML provider {saml_provider_name}')
+                raise SystemExit(1)
+            missing = [key for key in ('loginpage', 'logintitle') if not provider.get(key)]
+            if missing:
+                log_stream.fatal(f'Missing SAML provider configuration property {", ".join(missing)}')
+                raise SystemExit(1)
+            first_page = provider['loginpage']
+            idp_login_title = provider['logintitle'].replace('"', '')
+            dsso_url = provider.get('dssourl')
 
-        try:
-            dsso_url = self.configSAML[saml_provider]['dssoUrl']
-        except KeyError as missing_dsso_url:
+        if dsso_url is None:
             log_stream.info('Not configured to use DSSO. If your organization has this feature enabled and it is not configured the request will timeout')
 
         return str(principle_arn), str(role_arn), str(username), str(aws_region), str(first_page), int(session_duration), \
             str(saml_provider_name), str(idp_login_title), str(gui_name), str(browser), str(saved_password), str(account_number), str(dsso_url)
 
+    @contextmanager
+    def transaction(self):
+        """
+        Stage credentials/config/samlsts updates in memory and write each file once, when the block ends.
+
+        Without a transaction every write_aws_config rewrites both files, so a batch of N
+        profiles does O(N^2) I/O. Inside one, the files are committed atomically on exit;
+        if the block raises, nothing is written and the in-memory state is reloaded from disk.
+        """
+        if self._in_transaction:
+            yield self
+            return
+        self._in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self._staged_sections.clear()
+            self._pending_accounts.clear()
+            self._pending_expirations.clear()
+            self._reload_config_files()
+            raise
+        finally:
+            self._in_transaction = False
+        self.commit()
+
+    def _ini_attributes(self) -> Dict[str, str]:
+        return {self.awsConfigFile: 'configConfig', self.awsCredentialsFile: 'configCredentials',
+                self.awsSAMLFile: 'configSAML'}
+
+    def _stage(self, file_name, *sections):
+        self._staged_sections.setdefault(file_name, set()).update(sections)
+        if not self._in_transaction:
+            self.commit()
+
+    def commit(self):
+        """
+        Write every staged file under the ~/.aws writer lock.
+
+        Each file is re-read under the lock and only the sections changed here are spliced
+        into it (IniPatch), so concurrent runs refreshing other profiles are not overwritten
+        and comments and untouched sections are kept byte for byte. Files whose content is
+        unchanged are skipped. Account names and token expirations learned
+        meanwhile are written to aws_saml.db in one batch each.
+        """
+        self._flush_accounts()
+        if self._pending_expirations:
+            pending, self._pending_expirations = self._pending_expirations, {}
+            TokenState.record_expirations(self.SamlDB, pending)
+        if not self._staged_sections:
+            return
+        attributes = self._ini_attributes()
+        with FileLock.locked(self.AWSRoot):
+            for file_name in sorted(self._staged_sections):
+                ours = getattr(self, attributes[file_name])
+                changes = {section: dict(ours._sections[section]) if ours.has_section(section) else None
+                           for section in self._staged_sections[file_name]}
+                if self._patch_file(file_name, changes):
+                    log_stream.debug(f'Wrote {file_name}')
+                else:
+                    log_stream.debug(f'{file_name} unchanged, not rewritten')
+        self._staged_sections.clear()
+
+    @staticmethod
+    def _patch_file(file_name, changes: dict) -> bool:
+        """Splice changed sections into a file's current text with IniPatch and replace it atomically."""
+        try:
+            text = Path(file_name).read_text()
+        except FileNotFoundError:
+            text = ''
+        patched, changed = IniPatch.apply(text, changes)
+        return changed and atomic_write_text(file_name, patched, skip_unchanged=False)
+
+    def _reload_config_files(self):
+        for file_name, attribute in self._ini_attributes().items():
+            setattr(self, attribute, ConfigSnapshot.read_config(file_name))
+
     def revoke_creds(self, profile_name):
         self.configCredentials[profile_name] = {}
         self.configConfig["profile " + profile_name] = {}
-        
-        # Batch write operations
-        with open(self.awsConfigFile, "w") as config:
-            self.configConfig.write(config)
-        with open(self.awsCredentialsFile, "w") as credentials:
-            self.configCredentials.write(credentials)
-        
+
+        self._stage(self.awsConfigFile, "profile " + profile_name)
+        self._stage(self.awsCredentialsFile, profile_name)
+
         log_stream.info(f'Revoked token for {profile_name}')
 
     def write_aws_config(self, access_key_id, secret_access_key, aws_session_token, aws_profile_name, aws_region,
-                         account_number, used_profile_name_param):
+                         account_number, used_profile_name_param, expiration=None):
 
         self.configCredentials[aws_profile_name] = {}
         self.configCredentials[aws_profile_name]['aws_access_key_id'] = access_key_id
@@ -337,20 +582,73 @@ class Config:
             self.configCredentials[clean_profile_name]['aws_secret_access_key'] = secret_access_key
             self.configCredentials[clean_profile_name]['aws_session_token'] = aws_session_token
 
-        # Batch write operations - write both files once instead of multiple times
-        with open(self.awsConfigFile, "w") as config:
-            self.configConfig.write(config)
+        if expiration is not None:
+            self._pending_expirations[clean_profile_name] = expiration
 
-        with open(self.awsCredentialsFile, "w") as credentials:
-            self.configCredentials.write(credentials)
+        # Written now, or once when the enclosing transaction() commits
+        self._stage(self.awsConfigFile, "profile " + aws_profile_name)
+        self._stage(self.awsCredentialsFile, aws_profile_name, clean_profile_name)
 
         return profile_block, clean_profile_name
 
+    def compaction_enabled(self) -> bool:
+        """True when compactCredentials = true is set in the global block."""
+        return str(self._get_config_value('global', 'compactcredentials', 'false')).lower() in ('true', 'yes', '1')
+
+    def compact_credentials(self, grace_seconds: int | None = None, dry_run: bool = False) -> dict:
+        """
+        Remove empty, expired, duplicate and orphaned sections from credentials and config.
+
+        Both files are re-read and patched atomically under the ~/.aws writer lock, and
+        only if something is removed; comments and other sections are kept as they are.
+        See CredentialsGC for what is removed.
+
+        Args:
+            grace_seconds (int, optional): Keep credentials this long after they expire
+            dry_run (bool): Report what would be removed without writing anything
+
+        Returns:
+            dict: credentials and config ({section: reason} removed from each), merged_headers,
+                  bytes_before and bytes_after
+        """
+        grace_seconds = constants.__compaction_grace__ if grace_seconds is None else grace_seconds
+        self.commit()
+        with FileLock.locked(self.AWSRoot):
+            credentials_text, credentials, credentials_repeats = CredentialsGC.read_lenient(self.awsCredentialsFile)
+            config_text, config, config_repeats = CredentialsGC.read_lenient(self.awsConfigFile)
+            samlsts_profiles = ConfigSnapshot.profile_index(self.awsSAMLFile).records
+            removed = CredentialsGC.plan(credentials, config, TokenState.load_expirations(self.SamlDB),
+                                         samlsts_profiles, grace_seconds=grace_seconds)
+
+            report = {'credentials': removed['credentials'], 'config': removed['config'],
+                      'merged_headers': sum(credentials_repeats.values()) + sum(config_repeats.values()),
+                      'bytes_before': 0, 'bytes_after': 0}
+            for file_name, text, parser, sections, repeats in (
+                    (self.awsCredentialsFile, credentials_text, credentials, removed['credentials'],
+                     credentials_repeats),
+                    (self.awsConfigFile, config_text, config, removed['config'], config_repeats)):
+                changes = {section: None for section in sections}
+                # Repeated headers are folded into one section holding the merged values
+                changes.update({section: dict(parser._sections[section]) for section in repeats
+                                if section not in sections})
+                patched, changed = IniPatch.apply(text, changes)
+                report['bytes_before'] += len(text.encode())
+                report['bytes_after'] += len(patched.encode())
+                if changed and not dry_run:
+                    atomic_write_text(file_name, patched, skip_unchanged=False)
+
+            if not dry_run:
+                TokenState.forget(self.SamlDB, [section for section in removed['credentials']
+                                                if section not in samlsts_profiles])
+                self._reload_config_files()
+        return report
+
     def create_profile_block(self, aws_profile_name, access_key_id, secret_access_key, aws_region, aws_session_token,
                              account_number, used_profile_name_param):
         if used_profile_name_param is False:
             aws_role = aws_profile_name.split('-', 1)[1]
-            account_name = AWS.IAM.get_account_alias(aws_profile_name)
+            account_name = AliasCache.lookup_alias(self.get_alias_cache(), account_number,
+                                                   lambda: AWS.IAM.get_account_alias(aws_profile_name))
             if account_name is not None:
                 profile_name: str = account_name + '-' + aws_role
                 self.write_account_to_map_file(account_name, account_number)
@@ -368,38 +666,23 @@ class Config:
                                      username: str):
 
         role_name = iam_role.split('/')[1]
-        run_time_setup = f"{account_number}-{role_name}-{username}"
 
-        profile_exists = False
-        for section in self.configSAML.sections():
-            try:
-                profile_setup = (f"{self.configSAML.get(section, 'accountnumber')}-"
-                                f"{self.configSAML.get(section, 'iamrole')}-"
-                                f"{self.configSAML.get(section, 'username')}")
-
-                if run_time_setup == profile_setup:
-                    profile_exists = True
-                    smlsts_profile_name = section
-                    break
-            except configparser.NoOptionError:
-                log_stream.debug(f'Section {section} missing expected config keys, skipping')
-
-        if profile_exists:
+        if self.profile_index().find_identity(account_number, role_name, username) is not None:
             return False
-        else:
-            log_stream.warning(f'profile {profile_name} missing, creating')
-            try:
-                self.configSAML.add_section(profile_name)
-                self.configSAML[profile_name]['awsregion'] = str(aws_region)
-                self.configSAML[profile_name]['username'] = str(username)
-                self.configSAML[profile_name]['samlprovider'] = str(saml_provider)
-                self.configSAML[profile_name]['iamrole'] = str(role_name)
-                self.configSAML[profile_name]['accountnumber'] = str(account_number)
-                with open(self.awsSAMLFile, 'w') as saml_file:
-                    self.configSAML.write(saml_file)
-                return True
-            except configparser.DuplicateSectionError:
-                log_stream.info('This profile already exists')
+
+        log_stream.warning(f'profile {profile_name} missing, creating')
+        try:
+            self.configSAML.add_section(profile_name)
+            self.configSAML[profile_name]['awsregion'] = str(aws_region)
+            self.configSAML[profile_name]['username'] = str(username)
+            self.configSAML[profile_name]['samlprovider'] = str(saml_provider)
+            self.configSAML[profile_name]['iamrole'] = str(role_name)
+            self.configSAML[profile_name]['accountnumber'] = str(account_number)
+            self.profile_index().add(profile_name, self.configSAML._sections[profile_name])
+            self._stage(self.awsSAMLFile, profile_name)
+            return True
+        except configparser.DuplicateSectionError:
+            log_stream.info('This profile already exists')
 
     def check_global_in_saml_config(self):
 
@@ -409,10 +692,8 @@ class Config:
         else:
             log_stream.warning('global section missing, creating')
             self.configSAML.add_section('global')
-
-            with open(self.awsSAMLFile, 'w') as saml_file:
-                self.configSAML.write(saml_file)
-            saml_file.close()
+            self._profile_index = None
+            self._stage(self.awsSAMLFile, 'global')
             return True
 
     def write_global_to_saml_config(self, browser_type, username, aws_region, aws_session_duration):
@@ -429,5 +710,6 @@ class Config:
         else:
             self.configSAML.add_section('global')
 
-        with open(self.awsSAMLFile, 'w') as saml_file:
-            self.configSAML.write(saml_file)
+        # Profiles resolved against the old global block must be resolved again
+        self._profile_index = None
+        self._stage(self.awsSAMLFile, 'global')
@@ -0,0 +1,255 @@
+# coding=utf-8
+"""
+Parsed snapshots of ~/.aws/samlsts, credentials and config, keyed by each file's
+(path, size, mtime_ns, inode).
+
+With thousands of profiles, configparser dominates start-up, and a single run parses
+the same files several times (Config, batch_auth, samlstat). A snapshot is parsed once,
+kept in memory for the rest of the process and stored in ~/.aws/aws_saml.db for the
+next process. Any change to a file changes its key, so a stale snapshot is never served.
+Snapshots that hold secrets (the credentials file, or any file with keys or session
+tokens in it) are kept in memory only and never written to the database, which is
+created readable by its owner only.
+Files modified within the last RACY_WINDOW_NS are parsed but not cached, because a
+second write in the same mtime tick could otherwise go unnoticed.
+
+samlsts is also compiled into a ProfileIndex, its resolved and validated profile table,
+which is cached the same way.
+"""
+
+import configparser
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import ProfileIndex
+
+RACY_WINDOW_NS = 2_000_000_000
+COMPILED_SUFFIX = '#compiled'
+DB_FILE_NAME = 'aws_saml.db'
+SECRET_FILE_NAMES = {'credentials'}
+SECRET_OPTIONS = {'aws_secret_access_key', 'aws_session_token', 'aws_security_token'}
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+
+class _LazyProxies(dict):
+    """Section proxies built on first access; creating thousands up front costs more than parsing."""
+
+    def __init__(self, parser):
+        super().__init__()
+        self._parser = parser
+
+    def __missing__(self, section):
+        proxy = configparser.SectionProxy(self._parser, section)
+        self[section] = proxy
+        return proxy
+
+    def __delitem__(self, section):
+        self.pop(section, None)
+
+
+class SnapshotConfigParser(configparser.ConfigParser):
+    """A ConfigParser populated from already-parsed sections instead of file text."""
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict):
+        parser = cls()
+        default_proxy = parser._proxies[parser.default_section]
+        parser._proxies = _LazyProxies(parser)
+        parser._proxies[parser.default_section] = default_proxy
+        parser._defaults.update(snapshot['defaults'])
+        # Each reader gets its own section dicts, so callers may modify the parser freely
+        parser._sections.update({name: dict(options) for name, options in snapshot['sections'].items()})
+        return parser
+
+
+def file_key(path):
+    """(path, size, mtime_ns, inode) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def _is_racy(key) -> bool:
+    return time.time_ns() - key[2] < RACY_WINDOW_NS
+
+
+def _parse(path) -> dict:
+    parser = configparser.ConfigParser()
+    parser.read(str(path))
+    return {'defaults': dict(parser._defaults),
+            'sections': {name: dict(options) for name, options in parser._sections.items()}}
+
+
+def _db_path(path) -> str:
+    return str(Path(path).parent / DB_FILE_NAME)
+
+
+def _holds_secrets(path, snapshot) -> bool:
+    if Path(path).name in SECRET_FILE_NAMES:
+        return True
+    sections = [snapshot['defaults'], *snapshot['sections'].values()]
+    return any(option in SECRET_OPTIONS for options in sections for option in options)
+
+
+def _connect_private(db_path):
+    """Connect to aws_saml.db, creating it (or narrowing it to) readable and writable by its owner only."""
+    try:
+        if not Path(db_path).exists():
+            os.close(os.open(db_path, os.O_CREAT | os.O_WRONLY, 0o600))
+        elif os.stat(db_path).st_mode & 0o077:
+            os.chmod(db_path, 0o600)
+    except OSError:
+        pass
+    return sqlite3.connect(db_path)
+
+
+def _ensure_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS config_snapshots "
+        "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+        "payload TEXT NOT NULL)"
+    )
+
+
+def _load_stored(key, row_path=None):
+    db_path = _db_path(key[0])
+    if not Path(db_path).is_file():
+        return None
+    try:
+        conn = sqlite3.connect(db_path)
+        _ensure_table(conn)
+        row = conn.execute("SELECT size, mtime_ns, inode, payload FROM config_snapshots WHERE path = ?",
+                           (row_path or key[0],)).fetchone()
+        conn.close()
+    except sqlite3.Error:
+        return None
+    if row is None or tuple(row[:3]) != key[1:]:
+        return None
+    try:
+        return json.loads(row[3])
+    except ValueError:
+        return None
+
+
+def _forget(key):
+    """Drop a stored snapshot, e.g. one of a file that now holds secrets."""
+    db_path = _db_path(key[0])
+    if not Path(db_path).is_file():
+        return
+    try:
+        conn = sqlite3.connect(db_path)
+        _ensure_table(conn)
+        conn.execute("DELETE FROM config_snapshots WHERE path = ?", (key[0],))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _store(key, snapshot, row_path=None):
+    try:
+        conn = _connect_private(_db_path(key[0]))
+        _ensure_table(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO config_snapshots (path, size, mtime_ns, inode, payload) VALUES (?, ?, ?, ?, ?)",
+            (row_path or key[0], key[1], key[2], key[3], json.dumps(snapshot, separators=(',', ':'))),
+        )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def load_snapshot(path) -> dict:
+    """
+    Return {'defaults': {...}, 'sections': {name: {option: value}}} for an INI file.
+
+    Served from memory, then from aws_saml.db, then by parsing the file; snapshots holding
+    secrets are only kept in memory. A missing file
+    gives an empty snapshot. The result is shared; use read_config for a copy to modify.
+    """
+    key = file_key(path)
+    if key is None:
+        return {'defaults': {}, 'sections': {}}
+
+    with _memory_lock:
+        cached = _memory.get(key[0])
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    racy = _is_racy(key)
+    secret = Path(path).name in SECRET_FILE_NAMES
+    snapshot = None if racy or secret else _load_stored(key)
+    if snapshot is None:
+        snapshot = _parse(path)
+        if not racy and _holds_secrets(path, snapshot):
+            _forget(key)
+        elif not racy:
+            _store(key, snapshot)
+    if not racy:
+        with _memory_lock:
+            _memory[key[0]] = (key, snapshot)
+    return snapshot
+
+
+def read_config(path) -> configparser.ConfigParser:
+    """Drop-in for ConfigParser().read(path), built from the snapshot."""
+    return SnapshotConfigParser.from_snapshot(load_snapshot(path))
+
+
+def profile_index(samlsts_path) -> ProfileIndex.ProfileIndex:
+    """
+    The compiled profile table for samlsts, shared; use copy() before modifying it.
+
+    The table is compiled once per samlsts version and stored beside the parsed snapshot,
+    under the same (size, mtime_ns, inode) key, so later runs load it with one read and
+    neither parse samlsts nor resolve a profile.
+    """
+    key = file_key(samlsts_path)
+    if key is None:
+        return ProfileIndex.ProfileIndex({})
+    compiled_key = f'{key[0]}{COMPILED_SUFFIX}'
+    with _memory_lock:
+        cached = _memory.get(compiled_key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    racy = _is_racy(key)
+    payload = None if racy else _load_stored(key, compiled_key)
+    if payload is not None and payload.get('version') == ProfileIndex.PAYLOAD_VERSION:
+        index = ProfileIndex.ProfileIndex.from_payload(payload)
+    else:
+        index = ProfileIndex.ProfileIndex(load_snapshot(samlsts_path)['sections'])
+        if not racy:
+            _store(key, index.to_payload(), compiled_key)
+
+    if not racy:
+        with _memory_lock:
+            _memory[compiled_key] = (key, index)
+    return index
+
+
+def profile_records(samlsts_path) -> dict[str, dict]:
+    """
+    Profiles from samlsts with global defaults resolved, in file order.
+
+    Returns:
+        dict: profile -> ProfileIndex record (saml_provider, username, account_number, iam_role,
+              aws_region, session_duration, gui_name, role_arn, principal_arn, login_page,
+              login_title, dsso_url, problems, ...)
+    """
+    return profile_index(samlsts_path).records
+
+
+def clear_memory_cache():
+    """Forget every in-memory snapshot; the on-disk copies are kept."""
+    with _memory_lock:
+        _memory.clear()
@@ -0,0 +1,125 @@
+# coding=utf-8
+"""
+Compaction plan for ~/.aws/credentials and ~/.aws/config.
+
+Every text-menu login adds an <alias>-<role> section and revoke_creds leaves empty ones
+behind, so both files only grow, and every AWS SDK and CLI call parses them. A plan
+removes:
+
+- empty sections
+- temporary credentials whose token_state expiration has passed
+- temporary credentials that repeat another section's access key, keeping the samlsts
+  profile (or else the first) copy
+- `profile X` config sections holding only the region this tool writes, for an X that
+  has neither credentials nor a samlsts profile
+
+Long-term credentials (no aws_session_token) and [default] are never removed. Headers
+that appear more than once are merged, later values winning, as the AWS CLI reads them.
+Config.compact_credentials applies the plan with IniPatch, so comments and untouched
+sections are kept as they are.
+"""
+
+import configparser
+import re
+from datetime import datetime, timedelta, timezone
+
+# Matches configparser's default SECTCRE
+_SECTION_HEADER = re.compile(r'^\s*\[(?P<header>.+)\]', re.MULTILINE)
+
+PROTECTED_SECTIONS = ('default', 'profile default')
+
+
+def read_lenient(path) -> tuple[str, configparser.ConfigParser, dict[str, int]]:
+    """
+    Parse an INI file, merging repeated section headers instead of failing on them.
+
+    Returns:
+        tuple: (file text, parser, section -> how many extra times its header appears)
+    """
+    try:
+        with open(path, 'r') as ini_file:
+            text = ini_file.read()
+    except FileNotFoundError:
+        return '', configparser.ConfigParser(), {}
+
+    parser = configparser.ConfigParser(strict=False)
+    parser.read_string(text)
+    repeated = {}
+    for header in _SECTION_HEADER.findall(text):
+        repeated[header] = repeated.get(header, -1) + 1
+    return text, parser, {header: extra for header, extra in repeated.items() if extra}
+
+
+def plan(credentials: configparser.ConfigParser, config: configparser.ConfigParser, expirations: dict,
+         samlsts_profiles, now: datetime | None = None, grace_seconds: int = 0) -> dict[str, dict[str, str]]:
+    """
+    Decide which sections to remove.
+
+    Args:
+        credentials (ConfigParser): ~/.aws/credentials
+        config (ConfigParser): ~/.aws/config
+        expirations (dict): profile -> expiration, from token_state
+        samlsts_profiles (Iterable[str]): Profiles defined in samlsts
+        now (datetime, optional): Current time, for tests
+        grace_seconds (int): Keep credentials for this long after they expire
+
+    Returns:
+        dict: {'credentials': {section: reason}, 'config': {section: reason}}
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=grace_seconds)
+    samlsts_profiles = set(samlsts_profiles)
+    drop_credentials = {}
+
+    owner_of_key = {}
+    for section in credentials.sections():
+        options = credentials._sections[section]
+        if section in PROTECTED_SECTIONS:
+            continue
+        if not options:
+            drop_credentials[section] = 'empty'
+            continue
+        if 'aws_session_token' not in options:
+            continue
+
+        expiration = expirations.get(section)
+        if expiration is not None and expiration <= cutoff:
+            drop_credentials[section] = 'expired'
+            continue
+
+        access_key = options.get('aws_access_key_id')
+        if not access_key:
+            continue
+        # samlsts profiles may share one session on purpose (a batch assumes a role once for
+        # every profile with the same STS call), so only copies outside samlsts are dropped
+        owner = owner_of_key.get(access_key)
+        if owner is None:
+            owner_of_key[access_key] = section
+        elif section not in samlsts_profiles:
+            drop_credentials[section] = f'duplicate of {owner}'
+        elif owner not in samlsts_profiles:
+            drop_credentials[owner] = f'duplicate of {section}'
+            owner_of_key[access_key] = section
+
+    remaining = set(credentials.sections()) - set(drop_credentials)
+    drop_config = {}
+    for section in config.sections():
+        options = config._sections[section]
+        if section in PROTECTED_SECTIONS:
+            continue
+        if not options:
+            drop_config[section] = 'empty'
+            continue
+        profile = section[len('profile '):] if section.startswith('profile ') else section
+        if set(options) == {'region'} and profile not in remaining and profile not in samlsts_profiles:
+            drop_config[section] = 'orphaned'
+
+    return {'credentials': drop_credentials, 'config': drop_config}
+
+
+def summary(report: dict) -> str:
+    """One line describing a Config.compact_credentials report."""
+    reclaimed = report['bytes_before'] - report['bytes_after']
+    return (f"Compaction removed {len(report['credentials'])} credentials and {len(report['config'])} config "
+            f"section(s), merged {report['merged_headers']} repeated header(s), reclaimed {reclaimed} bytes "
+            f"({report['bytes_before']} -> {report['bytes_after']})")
@@ -0,0 +1,119 @@
+# coding=utf-8
+"""
+Advisory cross-process lock for everything that rewrites files under ~/.aws.
+
+Several terminals, cron jobs and the samlstat UI may refresh profiles at the same time.
+Writers take this lock, re-read the file they are about to replace, merge their own
+changes into it and replace it atomically. Readers never take the lock: files are only
+ever replaced by rename, so a reader sees either the old or the new version.
+
+fcntl.flock is used on POSIX and msvcrt.locking on Windows; where neither exists the
+lock is a no-op.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import constants
+from Logging import Logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+log_stream = Logging('file_lock')
+
+LOCK_FILE_NAME = '.aws_saml.lock'
+_POLL_INTERVAL = 0.05
+
+# flock is per open file description, so threads of one process serialise on this first;
+# 'fd' is set while the owning thread holds the file lock
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(lock_path):
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(lock_path, {'lock': threading.RLock(), 'fd': None})
+
+
+def _try_lock(fd):
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    if msvcrt is not None:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    return True
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(directory, timeout: float | None = None):
+    """
+    Hold the exclusive writer lock for a directory such as ~/.aws.
+
+    Re-entrant within a thread, so a commit that writes several files can take it once.
+
+    Args:
+        directory (str | Path): Directory whose files are about to be rewritten
+        timeout (float, optional): Seconds to wait before raising TimeoutError
+
+    Raises:
+        TimeoutError: Another process held the lock for longer than the timeout
+    """
+    lock_path = os.path.join(str(directory), LOCK_FILE_NAME)
+    timeout = constants.__file_lock_timeout__ if timeout is None else timeout
+    state = _thread_lock(lock_path)
+    if not state['lock'].acquire(timeout=timeout):
+        raise TimeoutError(f'Timed out waiting for {lock_path}')
+
+    try:
+        # Already held further up this thread's stack
+        if state['fd'] is not None:
+            yield
+            return
+
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            deadline = time.monotonic() + timeout
+            waited = False
+            while not _try_lock(fd):
+                if not waited:
+                    log_stream.debug(f'Waiting for another process holding {lock_path}')
+                    waited = True
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'Timed out waiting for {lock_path}')
+                time.sleep(_POLL_INTERVAL)
+
+            state['fd'] = fd
+            try:
+                yield
+            finally:
+                state['fd'] = None
+                _unlock(fd)
+        finally:
+            os.close(fd)
+    finally:
+        state['lock'].release()
@@ -62,7 +62,13 @@ def get_saml_response(driver):
 
 
 def browser_login(username, password, first_page, use_debug, use_gui, browser, saml_provider_name,
-                  idp_login_title, iam_role, gui_name, dsso_url,use_okta_fastpass) -> str:
+                  idp_login_title, iam_role, gui_name, dsso_url,use_okta_fastpass, mfa_lock=None) -> str:
+    """
+    Sign in through the IdP in a new browser and return the SAML response, or a short failure string.
+
+    mfa_lock, when given, is held from the moment an MFA factor is selected until the IdP
+    login completes, so concurrent logins sharing an MFA device prompt one at a time.
+    """
 
     completed_login: bool = False
     keep_browser_open = False
@@ -88,7 +94,12 @@ def browser_login(username, password, first_page, use_debug, use_gui, browser, s
                 # if saml_provider_name == 'PING':
                 #     completed_login = Providers.UseIdP.ping_sign_in(wait, driver, username, password)
                 if saml_provider_name == 'OKTA':
-                    completed_login = Providers.UseIdP.okta_sign_in(wait, driver, username, password, dsso_url, use_okta_fastpass)
+                    mfa_gate = Providers.MFAGate(mfa_lock)
+                    try:
+                        completed_login = Providers.UseIdP.okta_sign_in(wait, driver, username, password, dsso_url,
+                                                                        use_okta_fastpass, mfa_gate)
+                    finally:
+                        mfa_gate.release()
             elif driver.title == "Amazon Web Services Sign-In":
                 completed_login = True
             else:
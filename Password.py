@@ -142,17 +142,16 @@ def generate_pass_store_key(pass_key):
     return key
 
 
-def store_password(password, pass_key, pass_file):
+def load_or_create_key(pass_key):
     """
-    Encrypt and store a password in a file using a key.
+    Return the Fernet key from the key file, generating a new one if it is missing or invalid.
+    Enforces owner-only permissions on the key file and its directory.
 
     Args:
-        password (str): The password to encrypt and store.
         pass_key (str): Path to the key file.
-        pass_file (str): Path to the password file.
 
     Returns:
-        None
+        bytes: The key.
     """
     # Check if the key file is writeable
     check_store_perms(pass_key)
@@ -169,14 +168,31 @@ def store_password(password, pass_key, pass_file):
             log_stream.debug('Reusing existing encryption key')
         except (FileNotFoundError, ValueError, InvalidToken):
             log_stream.debug('Existing key is invalid, generating new key')
-    
+
     # Generate or retrieve the key from the key file
     if key is None:
         key = generate_pass_store_key(pass_key)
-    
+
     # Set strict permissions on key file (owner read/write only)
     check_file_perms(pass_key)
 
+    return key
+
+
+def store_password(password, pass_key, pass_file):
+    """
+    Encrypt and store a password in a file using a key.
+
+    Args:
+        password (str): The password to encrypt and store.
+        pass_key (str): Path to the key file.
+        pass_file (str): Path to the password file.
+
+    Returns:
+        None
+    """
+    key = load_or_create_key(pass_key)
+
     # Encode the password to bytes using UTF-8 encoding
     encoded_pass = password.encode()
 
@@ -0,0 +1,211 @@
+# coding=utf-8
+"""
+The compiled profile table for ~/.aws/samlsts.
+
+Each profile is resolved once, with one set of fallback rules (profile value, then the
+[global] value, then the built-in default), and carries everything a login needs: region,
+session duration, browser, SAML provider and username, the provider's login page, title
+and DSSO URL, and the role and principal ARNs. Problems are collected per profile, so every
+broken profile can be reported at once. Records are indexed three ways:
+
+- by section name
+- by (account number, IAM role, username), the identity used to spot duplicate profiles
+- by (SAML provider, username), the login shared by a batch of profiles
+
+Lookups are O(1) and add() keeps the indexes current, so registering hundreds of new
+roles stays linear. to_payload()/from_payload() turn the table into plain JSON, which
+ConfigSnapshot stores so later runs load it in one read instead of compiling again.
+"""
+
+import re
+
+import constants
+
+DEFAULT_REGION = 'us-east-1'
+DEFAULT_SESSION_DURATION = 3600
+# samlstat and batch logins have always defaulted to four hours, getCredentials to one
+BATCH_SESSION_DURATION = 14400
+PAYLOAD_VERSION = 2
+
+_ACCOUNT_NUMBER = re.compile(r'^\d{12}$')
+
+
+def _to_int(value, default):
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
+
+
+def is_profile_section(name: str) -> bool:
+    """False for the IdP provider (Fed-*) and global sections."""
+    return not name.startswith('Fed-') and name.lower() != 'global'
+
+
+class ProfileIndex:
+    """Resolved samlsts profiles keyed by name, by identity and by login."""
+
+    def __init__(self, sections: dict):
+        """
+        Args:
+            sections (dict): section name -> {option: value}, as parsed from samlsts
+        """
+        self.global_block = next((options for name, options in sections.items() if name.lower() == 'global'), {})
+        self.providers = {name: options for name, options in sections.items() if name.startswith('Fed-')}
+        self.records = {}
+        self._by_identity = {}
+        self._by_login = {}
+        for name, options in sections.items():
+            if is_profile_section(name):
+                self.add(name, options)
+
+    @classmethod
+    def from_payload(cls, payload: dict):
+        """Rebuild a table from to_payload() output without resolving any profile again."""
+        index = cls({})
+        index.global_block = payload['global_block']
+        index.providers = payload['providers']
+        for name, record in payload['records'].items():
+            index._insert(name, record)
+        return index
+
+    def to_payload(self) -> dict:
+        return {'version': PAYLOAD_VERSION, 'global_block': self.global_block, 'providers': self.providers,
+                'records': self.records}
+
+    def copy(self):
+        """An independent table sharing the (never modified) records, for callers that add() to it."""
+        index = ProfileIndex({})
+        index.global_block = self.global_block
+        index.providers = self.providers
+        index.records = dict(self.records)
+        index._by_identity = dict(self._by_identity)
+        index._by_login = {login: list(names) for login, names in self._by_login.items()}
+        return index
+
+    def global_settings(self) -> dict:
+        """The [global] values that apply when neither a profile nor the command line sets them."""
+        global_block = self.global_block
+        return {
+            'browser': global_block.get('browser'),
+            'saved_password': global_block.get('savedpassword'),
+            'username': global_block.get('username'),
+            'aws_region': global_block.get('awsregion'),
+            'saml_provider': global_block.get('samlprovider'),
+            'session_duration': _to_int(global_block.get('sessionduration'), 0),
+        }
+
+    def batch_session_duration(self, name: str) -> int:
+        """A profile's session duration for samlstat and batch logins: profile, then [global], then BATCH_SESSION_DURATION."""
+        record = self.records.get(name)
+        if record is not None and _to_int(record['options'].get('sessionduration'), None) is not None:
+            return record['session_duration']
+        return self.global_settings()['session_duration'] or BATCH_SESSION_DURATION
+
+    def _resolve(self, options: dict) -> dict:
+        global_block = self.global_block
+        saml_provider = options.get('samlprovider', global_block.get('samlprovider'))
+        account_number = options.get('accountnumber')
+        iam_role = options.get('iamrole')
+        provider = self.providers.get(saml_provider, {}) if saml_provider else {}
+
+        username = options.get('username', global_block.get('username'))
+        problems = [f'missing {name}' for name, value in (('accountnumber', account_number), ('iamrole', iam_role),
+                                                         ('samlprovider', saml_provider), ('username', username))
+                    if not value]
+        if account_number and not _ACCOUNT_NUMBER.match(account_number):
+            problems.append(f'accountnumber {account_number} is not a 12 digit AWS account number')
+        for source in (options, global_block):
+            if source.get('sessionduration') and _to_int(source['sessionduration'], None) is None:
+                problems.append(f"sessionduration {source['sessionduration']} is not a number of seconds")
+        browser = options.get('browser', global_block.get('browser'))
+        if browser and browser not in constants.valid_browsers:
+            problems.append(f"browser {browser} is not one of {', '.join(constants.valid_browsers)}")
+        if saml_provider and saml_provider not in self.providers:
+            problems.append(f'no [{saml_provider}] provider section')
+        elif saml_provider:
+            problems.extend(f'provider {saml_provider} is missing {key}'
+                            for key in ('loginpage', 'logintitle') if not provider.get(key))
+
+        provider_name = role_arn = principal_arn = None
+        if saml_provider:
+            provider_name = saml_provider.split('-', 1)[1] if '-' in saml_provider else saml_provider
+        if account_number and iam_role:
+            role_arn = f'arn:aws:iam::{account_number}:role/{iam_role}'
+        if account_number and provider_name:
+            principal_arn = f'arn:aws:iam::{account_number}:saml-provider/{provider_name}'
+
+        return {
+            'saml_provider': saml_provider,
+            'provider_name': provider_name,
+            'username': username,
+            'account_number': account_number,
+            'iam_role': iam_role,
+            'aws_region': options.get('awsregion', global_block.get('awsregion', DEFAULT_REGION)),
+            'session_duration': _to_int(options.get('sessionduration'),
+                                        _to_int(global_block.get('sessionduration'), DEFAULT_SESSION_DURATION)),
+            'gui_name': options.get('guiname'),
+            'browser': browser,
+            'role_arn': role_arn,
+            'principal_arn': principal_arn,
+            'login_page': provider.get('loginpage'),
+            'login_title': provider['logintitle'].replace('"', '') if provider.get('logintitle') else None,
+            'dsso_url': provider.get('dssourl'),
+            'problems': problems,
+            'options': options,
+        }
+
+    def _insert(self, name: str, record: dict):
+        self.records[name] = record
+        identity = (record['account_number'], record['iam_role'], record['username'])
+        if all(identity):
+            self._by_identity.setdefault(identity, name)
+        if record['saml_provider'] and record['username']:
+            self._by_login.setdefault((record['saml_provider'], record['username']), []).append(name)
+
+    def add(self, name: str, options: dict) -> dict:
+        """Index (or re-index) one profile section and return its resolved record."""
+        if name in self.records:
+            self.remove(name)
+        record = self._resolve(options)
+        self._insert(name, record)
+        return record
+
+    def remove(self, name: str):
+        record = self.records.pop(name, None)
+        if record is None:
+            return
+        identity = (record['account_number'], record['iam_role'], record['username'])
+        if self._by_identity.get(identity) == name:
+            del self._by_identity[identity]
+            # Another section may carry the same identity
+            for other, other_record in self.records.items():
+                if (other_record['account_number'], other_record['iam_role'], other_record['username']) == identity:
+                    self._by_identity[identity] = other
+                    break
+        login = (record['saml_provider'], record['username'])
+        if login in self._by_login:
+            self._by_login[login].remove(name)
+            if not self._by_login[login]:
+                del self._by_login[login]
+
+    def get(self, name: str) -> dict | None:
+        return self.records.get(name)
+
+    def __contains__(self, name) -> bool:
+        return name in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def problems(self) -> dict[str, list[str]]:
+        """profile -> every problem found in it, for the profiles that have any."""
+        return {name: record['problems'] for name, record in self.records.items() if record['problems']}
+
+    def find_identity(self, account_number, iam_role, username) -> str | None:
+        """Name of the first profile for this (account, role, username), or None."""
+        return self._by_identity.get((str(account_number), str(iam_role), str(username)))
+
+    def profiles_for_login(self, saml_provider, username) -> list:
+        """Every profile that logs in as username through saml_provider, in file order."""
+        return list(self._by_login.get((saml_provider, username), []))
@@ -1,12 +1,13 @@
 # coding=utf-8
+import time
 import uuid
 
 from selenium.common import exceptions as se
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as ec
-from selenium.webdriver.support.ui import WebDriverWait
 
+import constants
 from Logging import Logging
 from ScreenshotRecorder import ScreenshotRecorder
 from SeleniumHelper import SeleniumHelper
@@ -18,6 +19,10 @@ mfa_screen_indicator = 'class="button select-factor link-button"'
 # Okta's own heading text for this screen (#95) - a more stable signal than guessing at
 # form/field markup we haven't observed in this tool's own driver against a real occurrence yet.
 forced_password_reset_indicator = "Reset your Okta password"
+# Any control select_mfa_factor acts on
+mfa_prompt_selector = ("input[name='autoChallenge'], "
+                       "a[aria-label='Select to get a push notification to the Okta Verify app.'], "
+                       "input[type='submit'][value='Send push'], a[aria-label='Select Okta Verify.']")
 xpath_locator = By.XPATH
 class_name_locator = By.CLASS_NAME
 id_locator = By.ID
@@ -25,109 +30,78 @@ link_text_locator = By.LINK_TEXT
 name_locator = By.NAME
 
 
-def check_for_mfa_screen(driver, wait, use_okta_fastpass):
+class MFAGate:
     """
-    Check if the MFA screen is already displayed (fully managed device scenario).
-    Uses the isMfa flag in Okta's modelDataBag to reliably detect MFA pages.
-    
-    Args:
-        driver: Selenium WebDriver instance
-        wait: WebDriverWait instance
-        use_okta_fastpass: Boolean indicating which MFA method to use
-        
-    Returns:
-        tuple: (is_mfa_screen, saml_response) where is_mfa_screen is bool and 
-               saml_response is the result if MFA was clicked
+    Serialises MFA prompts that go to one device while several logins run at once.
+
+    enter() takes the device's lock just before a factor is selected and the lock is held
+    until release(), after the login completes, so a second push never arrives while the
+    user is still answering the first. Without a lock both calls do nothing.
     """
-    short_wait = WebDriverWait(driver, 20)
-    # wait until the Okta Back to sign in element is present, which indicates the page has loaded enough to check for MFA
-    try:
-        short_wait.until(ec.presence_of_element_located((link_text_locator, "Back to sign in")))
-    except se.TimeoutException:
-        log_stream.warning('Timeout waiting for page to load while checking for MFA screen')
-        return False, None 
 
-    try:
-        # Check if page source contains the isMfa flag in modelDataBag.
-        # This is the most reliable indicator from Okta. Poll with backoff
-        # rather than checking once, since the factor-selection markup can
-        # render after "Back to sign in" is already present (seen on Firefox).
-        log_stream.debug('Checking for MFA screen indicators in page source')
-        helper = SeleniumHelper(driver, short_wait)
-        if helper.poll_page_source_with_backoff(mfa_screen_indicator, max_total_seconds=20, label="MFA screen indicator"):
-            log_stream.info('MFA screen detected - fully managed device, skipping username and password entry')
-            ScreenshotRecorder.capture(driver, "managed_device_mfa_screen")
-
-            # Click the appropriate MFA button
-            if use_okta_fastpass:
-                saml_response = click_okta_fastpass(wait, driver)
-            else:
-                saml_response = click_okta_mfa(wait, driver)
-                
-            return True, saml_response
-        
-        # Not on MFA screen
-        return False, None
-        
-    except Exception as e:
-        log_stream.warning(f'Error checking for MFA screen: {str(e)}')
-        # On any error, assume we're not on MFA screen and continue normal flow
-        return False, None
-
-def check_for_intermediate_verify_screen(driver, wait):
-
-    short_wait = WebDriverWait(driver, 8)
-    # wait until the Okta Back to sign in element is present, which indicates the page has loaded enough to check for intermediate screen
-    try:
-        short_wait.until(ec.presence_of_element_located((link_text_locator, "Back to sign in")))
-    except se.TimeoutException:
-        log_stream.warning('Timeout waiting for page to load while checking for intermediate screen')
-        return False, None 
+    def __init__(self, lock=None):
+        self._lock = lock
+        self._held = False
 
-    try:
-        log_stream.debug('Checking for intermediate screen indicators in page source')
-        helper = SeleniumHelper(driver, short_wait)
-        if helper.poll_page_source_with_backoff(mfa_screen_indicator, max_total_seconds=8, label="intermediate screen indicator"):
-            log_stream.info('Intermediate screen detected - select Password option')
-            ScreenshotRecorder.capture(driver, "managed_device_intermediate_screen")
+    def enter(self):
+        if self._lock is None or self._held:
+            return
+        if not self._lock.acquire(blocking=False):
+            log_stream.info('Waiting for another login to finish MFA on this device')
+            self._lock.acquire()
+        self._held = True
 
-            # Click the appropriate MFA button
-            click_use_password(wait, driver)
+    def release(self):
+        if self._held:
+            self._held = False
+            self._lock.release()
 
-            return True
 
-        return False
+def select_mfa_factor(wait, driver, use_okta_fastpass, mfa_gate=None):
+    """Select Okta FastPass or the push factor, once this login holds the MFA device."""
+    if mfa_gate is not None:
+        mfa_gate.enter()
+    if use_okta_fastpass:
+        return click_okta_fastpass(wait, driver)
+    return click_okta_mfa(wait, driver)
 
-    except Exception as e:
-        log_stream.warning(f'Error checking for intermediate screen: {str(e)}')
-        # On any error, assume we're not on intermediate screen and continue normal flow
-        return False, None
 
-def check_for_forced_password_reset_screen(driver, wait):
+def okta_screens(dsso_url=None):
     """
-    Check whether Okta interrupted the login with a forced "Reset your Okta password"
-    screen instead of proceeding to MFA (#95). Unlike check_for_mfa_screen /
-    check_for_intermediate_verify_screen, there's no known gating element to wait on
-    first, so this polls the page source directly for the screen's heading text.
+    Signatures of the screens okta_sign_in can land on, for SeleniumHelper.wait_for_screen.
+
+    The factor list ("Back to sign in" plus the select-factor markup) is the MFA screen
+    of a fully managed device before any credentials are entered, and the intermediate
+    verify screen once the username has been. The forced password-reset screen (#95) is
+    matched on Okta's heading text.
 
     Args:
-        driver: Selenium WebDriver instance
-        wait: WebDriverWait instance
+        dsso_url (str, optional): URL fragment of the DSSO path; without it DSSO is not detected
 
     Returns:
-        bool: True if the forced password-reset screen was detected
+        dict: screen name -> [(kind, value), ...] conditions that must all hold
     """
-    try:
-        helper = SeleniumHelper(driver, wait)
-        if helper.poll_page_source_with_backoff(forced_password_reset_indicator, max_total_seconds=5,
-                                                  label="forced password-reset screen indicator"):
-            log_stream.warning('Forced Okta password-reset screen detected after primary authentication')
-            ScreenshotRecorder.capture(driver, "forced_password_reset_screen")
-            return True
-        return False
-    except Exception as e:
-        log_stream.warning(f'Error checking for forced password-reset screen: {str(e)}')
-        return False
+    screens = {
+        'saml': [('title', saml_page_title)],
+        'factor_list': [('link_text', "Back to sign in"), ('text', mfa_screen_indicator)],
+        'password_reset': [('text', forced_password_reset_indicator)],
+        'mfa_prompt': [('css', mfa_prompt_selector)],
+        'password': [('css', '.password-with-toggle')],
+        'username': [('css', '[name="identifier"]')],
+    }
+    if dsso_url:
+        screens['dsso'] = [('url', dsso_url)]
+    return screens
+
+
+# The screens raced in each okta_sign_in state, most specific first
+okta_sign_in_states = {
+    'start': ['saml', 'dsso', 'factor_list', 'password', 'username'],
+    'username_sent': ['saml', 'factor_list', 'password'],
+    'password_chosen': ['saml', 'password'],
+    'password_sent': ['saml', 'password_reset', 'factor_list', 'mfa_prompt'],
+}
+
 
 def click_use_password(wait, driver):
     """Click the Okta FastPass button."""
@@ -196,10 +170,17 @@ def click_okta_fastpass(wait, driver):
 class UseIdP:
 
     @staticmethod
-    def okta_sign_in(wait, driver, username, password, dsso_url, use_okta_fastpass):
+    def okta_sign_in(wait, driver, username, password, dsso_url, use_okta_fastpass, mfa_gate=None):
         """
         Attempts to sign in to Okta using the given credentials.
 
+        The sign-in is a small state machine (okta_sign_in_states): each state waits in the
+        page for whichever screen that can follow it appears first - DSSO, a managed
+        device's MFA screen, the username or password field, the intermediate verify screen,
+        a forced password reset or the SAML page - so no screen costs the timeout of another.
+        Finding the screens shares one deadline of constants.__timeout__ seconds; waiting
+        for the MFA answer afterwards has wait's own.
+
         Args:
             use_okta_fastpass (bool): indicates whether to Use Okta FastPass for MFA
             dsso_url: (str): The url indicating DSSO is in use.
@@ -207,101 +188,105 @@ class UseIdP:
             driver (WebDriver): The WebDriver instance used to navigate to Okta login page.
             username (str): The username to log in with.
             password (str): The password to log in with.
+            mfa_gate (MFAGate, optional): Taken before any factor is selected; the caller releases it.
 
         Returns:
             bool: A flag to indicate whether the login was successful or not.
 
         Raises:
-            SystemExit: If the login times out waiting for MFA and cannot be completed.
+            SystemExit: If the login times out waiting for MFA and cannot be completed, or Okta
+                requires a password reset.
         """
-        global saml_page_title
-        use_dsso = False
         helper = SeleniumHelper(driver, wait)
-        short_wait = WebDriverWait(driver, 3)
-        short_helper = SeleniumHelper(driver, short_wait)        
         # Define XPath selectors for various page elements
         username_next_button = 'button-primary'
         password_next_button = 'button-primary'
         username_field = "identifier"
         password_field = "password-with-toggle"
-        
-        if driver.capabilities['browserName'] == 'chrome':
-            log_stream.info('Checking for DSSO')
-            ScreenshotRecorder.capture(driver, "dsso_check_start")
-            try:
-                short_helper.wait_for_url_contains(dsso_url)
-                log_stream.info('Follow DSSO Path')
-                ScreenshotRecorder.capture(driver, "dsso_detected")
-                if use_okta_fastpass is True:
-                    saml_response = click_okta_fastpass(wait, driver)
+
+        check_dsso = driver.capabilities['browserName'] == 'chrome'
+        screens = okta_screens(dsso_url if check_dsso else None)
+        deadline = time.monotonic() + constants.__timeout__
+        state = 'start'
+        log_stream.info('Checking for DSSO' if check_dsso else 'Use Okta Login')
+        ScreenshotRecorder.capture(driver, "okta_login_page")
+
+        # Each state races every screen that can follow it in one in-page wait, and acts on
+        # whichever appears first; all the states share one deadline.
+        while True:
+            screen = helper.wait_for_screen([(name, screens[name]) for name in okta_sign_in_states[state]
+                                             if name in screens],
+                                            max(0.0, deadline - time.monotonic()), label=f"Okta screen ({state})")
+            log_stream.debug(f'Okta sign-in state {state}: {screen or "no known screen"}')
+            if screen == 'saml':
+                break
+
+            if state == 'start' and screen in ('dsso', 'factor_list'):
+                if screen == 'dsso':
+                    log_stream.info('Follow DSSO Path')
+                    ScreenshotRecorder.capture(driver, "dsso_detected")
                 else:
-                    saml_response = click_okta_mfa(wait, driver)
-                use_dsso = True
+                    log_stream.info('MFA screen detected - fully managed device, skipping username and password entry')
+                    ScreenshotRecorder.capture(driver, "managed_device_mfa_screen")
+                saml_response = select_mfa_factor(wait, driver, use_okta_fastpass is True, mfa_gate)
                 if saml_response == "CouldNotEnterFormData":
                     return saml_response
-            except se.TimeoutException:
-                log_stream.info('Not using DSSO')
-                ScreenshotRecorder.capture(driver, "dsso_timeout")
-        
-        if not use_dsso:
-            log_stream.info('Use Okta Login')
-            ScreenshotRecorder.capture(driver, "okta_login_page")
-            
-            # Check if we're already on the MFA screen (fully managed device - both username and password pre-authenticated)
-            log_stream.info('Checking for pre-authenticated MFA screen (fully managed device scenario)')
-            is_mfa_screen, mfa_response = check_for_mfa_screen(driver, wait, use_okta_fastpass)
-            
-            if is_mfa_screen:
-                # Already on MFA screen, credentials were pre-authenticated
-                if mfa_response == "CouldNotEnterFormData":
-                    return mfa_response
-                # Skip to the completion check
-                use_dsso = True  # Reuse this flag to skip password entry
-            else:
-                # Not on MFA screen yet, check for password field (username pre-filled on managed devices)
+                break
+
+            if state == 'start' and screen == 'username':
                 try:
-                    short_helper.wait_for_element((class_name_locator, password_field), "password field")
+                    log_stream.debug('Entering username')  # Don't log the actual username
+                    helper.enter_text((name_locator, username_field), username, "username field")
+                    log_stream.debug('Clicking username next button')
+                    helper.click_element((class_name_locator, username_next_button), "username next button")
+                    ScreenshotRecorder.capture(driver, "after_username_entry")
+                except (se.NoSuchElementException, se.TimeoutException):
+                    ScreenshotRecorder.capture(driver, "username_entry_failed")
+                    return "CouldNotEnterFormData"
+                state = 'username_sent'
+
+            elif state == 'username_sent' and screen == 'factor_list':
+                log_stream.info('Intermediate screen detected - select Password option')
+                ScreenshotRecorder.capture(driver, "managed_device_intermediate_screen")
+                if click_use_password(wait, driver) == "CouldNotEnterFormData":
+                    return "CouldNotEnterFormData"
+                state = 'password_chosen'
+
+            elif screen == 'password':
+                if state == 'start':
                     log_stream.info('Password field already visible - username pre-filled, skipping username entry')
                     ScreenshotRecorder.capture(driver, "username_prefilled")
-                except se.TimeoutException:
-                    # Password field not visible, proceed with username entry
-                    log_stream.info('Username field required - proceeding with username entry')
-                    try:
-                        log_stream.debug('Entering username')  # Don't log the actual username
-                        helper.enter_text((name_locator, username_field), username, "username field")
-                        log_stream.debug('Clicking username next button')
-                        helper.click_element((class_name_locator, username_next_button), "username next button")
-                        ScreenshotRecorder.capture(driver, "after_username_entry")
-                    except (se.NoSuchElementException, se.TimeoutException):
-                        ScreenshotRecorder.capture(driver, "username_entry_failed")
-                        saml_response = "CouldNotEnterFormData"
-                        return saml_response
-
-        if not use_dsso:
-            try:
-                check_for_intermediate_verify_screen(driver, wait)
-                # Enter the password and click the "Next" button
-                log_stream.debug('Entering password')  # Don't log the actual password
-                helper.enter_text((class_name_locator, password_field), password, "password field")
-                log_stream.debug('Clicking password next button')
-                helper.click_element((class_name_locator, password_next_button), "password next button")
-                ScreenshotRecorder.capture(driver, "after_password_entry")
-            except (se.NoSuchElementException, se.TimeoutException):
-                ScreenshotRecorder.capture(driver, "password_entry_failed")
-                saml_response = "CouldNotEnterFormData"
-                return saml_response
-
-            if check_for_forced_password_reset_screen(driver, wait):
+                try:
+                    log_stream.debug('Entering password')  # Don't log the actual password
+                    helper.enter_text((class_name_locator, password_field), password, "password field")
+                    log_stream.debug('Clicking password next button')
+                    helper.click_element((class_name_locator, password_next_button), "password next button")
+                    ScreenshotRecorder.capture(driver, "after_password_entry")
+                except (se.NoSuchElementException, se.TimeoutException):
+                    ScreenshotRecorder.capture(driver, "password_entry_failed")
+                    return "CouldNotEnterFormData"
+                state = 'password_sent'
+
+            elif screen == 'password_reset':
+                log_stream.warning('Forced Okta password-reset screen detected after primary authentication')
+                ScreenshotRecorder.capture(driver, "forced_password_reset_screen")
                 log_stream.fatal('Your Okta password needs to be reset before you can sign in')
                 log_stream.info('Please log in to Okta via your browser to reset your password, then try again')
                 raise SystemExit(1)
 
-            if use_okta_fastpass is True:
-                saml_response = click_okta_fastpass(wait, driver)
+            elif state == 'password_sent':
+                # The factor prompt, or no known screen by the deadline, in which case
+                # select_mfa_factor waits for its controls itself
+                saml_response = select_mfa_factor(wait, driver, use_okta_fastpass is True, mfa_gate)
+                if saml_response == "CouldNotEnterFormData":
+                    return saml_response
+                break
+
             else:
-                saml_response = click_okta_mfa(wait, driver)
-            if saml_response == "CouldNotEnterFormData":
-                return saml_response
+                log_stream.warning(f'No Okta sign-in screen appeared within {constants.__timeout__}s')
+                ScreenshotRecorder.capture(driver, "username_entry_failed" if state == 'start'
+                                           else "password_entry_failed")
+                return "CouldNotEnterFormData"
 
         try:
             completed_login = wait.until(ec.title_is(saml_page_title))
@@ -1,6 +1,7 @@
 # coding=utf-8
 import base64
 import binascii
+import datetime
 
 import defusedxml.ElementTree as ET
 from selenium.webdriver.common.by import By
@@ -36,7 +37,57 @@ def select_role_from_saml_page(driver, gui_name, iam_role, design):
 
 
 
+def get_assertion_expiry(saml_response):
+    """
+    Return when a SAML response stops being usable for AssumeRoleWithSAML.
+
+    Both the SubjectConfirmationData and the Conditions of the assertion carry a
+    NotOnOrAfter; the earliest of them wins.
+
+    Args:
+        saml_response (str): Base64 encoded SAML response
+
+    Returns:
+        datetime: Timezone-aware expiry, or None if the response carries none or cannot be read
+    """
+    try:
+        root = ET.fromstring(base64.b64decode(saml_response).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ET.ParseError, TypeError, ValueError):
+        log_stream.debug('Unable to read NotOnOrAfter from SAML response')
+        return None
+
+    expiries = []
+    for tag in ('SubjectConfirmationData', 'Conditions'):
+        for element in root.iter(f'{{urn:oasis:names:tc:SAML:2.0:assertion}}{tag}'):
+            not_on_or_after = element.get('NotOnOrAfter')
+            if not not_on_or_after:
+                continue
+            try:
+                expiry = datetime.datetime.fromisoformat(not_on_or_after.replace('Z', '+00:00'))
+            except ValueError:
+                continue
+            if expiry.tzinfo is None:
+                expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+            expiries.append(expiry)
+
+    return min(expiries) if expiries else None
+
+
 def get_roles_from_saml_response(saml_response, account_map):
+    """
+    List the roles offered in a SAML response, named from the account map.
+
+    Args:
+        saml_response (str): Base64 SAML response
+        account_map (dict | list | None): account number -> name (Config.read_map_file), or the
+            account-map.json list of {"name", "number"} entries
+
+    Returns:
+        tuple: (roles for the selector, rows for the text menu table)
+    """
+    if isinstance(account_map, list):
+        account_map = {str(account['number']): account['name'] for account in account_map
+                       if account.get('number') and account.get('name')}
     try:
         decoded_saml_bytes = base64.b64decode(saml_response)
     except binascii.Error as decode_error:
@@ -80,10 +131,7 @@ def get_roles_from_saml_response(saml_response, account_map):
                     "rolename": f"{account_number}-{role_name}"
                 }
             else:
-                for account in account_map:
-                    if account['number'] == account_number:
-                        account_name = account['name']
-                        break
+                account_name = account_map.get(account_number, account_number)
                 table_object.append([role_id, account_number, account_name, role_name])
                 selector_object = {
                     "id": role_id,
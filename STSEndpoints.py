@@ -0,0 +1,173 @@
+# coding=utf-8
+"""
+Pick the regional STS endpoint with the lowest connection latency.
+
+STS credentials are valid in every region whichever regional endpoint issued them, so a
+user far from the profile's region can send AssumeRoleWithSAML to a closer endpoint.
+Candidates are probed once (TCP connect plus TLS handshake); the ranking is stored in
+~/.aws/aws_saml.db and reused until its TTL runs out.
+"""
+
+import socket
+import sqlite3
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from Logging import Logging
+
+log_stream = Logging('sts_endpoints')
+
+DEFAULT_CANDIDATE_REGIONS = ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2',
+                             'eu-west-1', 'eu-central-1', 'ap-southeast-1', 'ap-northeast-1']
+DEFAULT_PROBE_TTL_SECONDS = 24 * 3600
+DEFAULT_PROBE_TIMEOUT = 2.0
+
+
+def regional_endpoint(region):
+    """(host, port) of a region's STS endpoint."""
+    return f'sts.{region}.amazonaws.com', 443
+
+
+def probe_endpoint(host, port=443, timeout=DEFAULT_PROBE_TIMEOUT, use_tls=True, ssl_context=None):
+    """
+    Time a TCP connect and TLS handshake to an endpoint.
+
+    Args:
+        host (str): Endpoint host name
+        port (int): Endpoint port
+        timeout (float): Seconds before the endpoint is considered unhealthy
+        use_tls (bool): Include the TLS handshake in the measurement
+        ssl_context (ssl.SSLContext, optional): Context for the handshake; the default verifies certificates
+
+    Returns:
+        dict: {'connect': seconds, 'handshake': seconds, 'total': seconds}, or None if unreachable
+    """
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            connected = time.perf_counter()
+            if use_tls:
+                context = ssl_context or ssl.create_default_context()
+                with context.wrap_socket(sock, server_hostname=host):
+                    pass
+            finished = time.perf_counter()
+    except (OSError, ssl.SSLError) as e:
+        log_stream.debug(f'STS endpoint {host}:{port} unhealthy: {str(e)}')
+        return None
+
+    return {'connect': connected - start, 'handshake': finished - connected, 'total': finished - start}
+
+
+def rank_endpoints(candidates, timeout=DEFAULT_PROBE_TIMEOUT, use_tls=True, ssl_context=None):
+    """
+    Probe every candidate concurrently and rank the healthy ones, fastest first.
+
+    Args:
+        candidates (dict): name -> (host, port)
+
+    Returns:
+        list: [(name, total_seconds), ...] for healthy endpoints, fastest first
+    """
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        futures = {name: executor.submit(probe_endpoint, host, port, timeout, use_tls, ssl_context)
+                   for name, (host, port) in candidates.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    ranking = [(name, result['total']) for name, result in results.items() if result is not None]
+    return sorted(ranking, key=lambda item: item[1])
+
+
+def _ensure_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sts_endpoint_rank "
+        "(region TEXT PRIMARY KEY, latency_ms REAL, healthy INTEGER NOT NULL, probed_at TEXT NOT NULL)"
+    )
+
+
+def save_ranking(db_path, candidates, ranking):
+    """
+    Store a probe ranking; candidates missing from the ranking are stored as unhealthy.
+
+    Only the probed candidates are replaced, in one transaction, so rankings of regions
+    probed for another candidate set are kept.
+    """
+    now_str = datetime.now(timezone.utc).isoformat()
+    latencies = dict(ranking)
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO sts_endpoint_rank (region, latency_ms, healthy, probed_at) VALUES (?, ?, ?, ?)",
+            [(name, latencies[name] * 1000 if name in latencies else None, int(name in latencies), now_str)
+             for name in candidates],
+        )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        log_stream.warning(f'Unable to store STS endpoint ranking: {str(e)}')
+
+
+def load_ranking(db_path, candidates, ttl_seconds=DEFAULT_PROBE_TTL_SECONDS):
+    """
+    Return the stored ranking of these candidates if every one of them was probed within the TTL.
+
+    Returns:
+        list: [(name, total_seconds), ...] fastest first, or None when it must be probed again
+    """
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        rows = conn.execute("SELECT region, latency_ms, healthy, probed_at FROM sts_endpoint_rank").fetchall()
+        conn.close()
+    except sqlite3.Error:
+        return None
+
+    rows = [row for row in rows if row[0] in set(candidates)]
+    if not rows or {row[0] for row in rows} != set(candidates):
+        return None
+    try:
+        probed_at = min(datetime.fromisoformat(row[3]) for row in rows)
+    except ValueError:
+        return None
+    if datetime.now(timezone.utc) - probed_at >= timedelta(seconds=ttl_seconds):
+        return None
+
+    ranking = [(region, latency_ms / 1000) for region, latency_ms, healthy, _ in rows if healthy]
+    return sorted(ranking, key=lambda item: item[1])
+
+
+def fastest_region(db_path, regions, ttl_seconds=DEFAULT_PROBE_TTL_SECONDS, endpoint_for=regional_endpoint,
+                   probe=True, **probe_options):
+    """
+    Return the region whose STS endpoint answered fastest, probing only when the stored ranking is stale.
+
+    Args:
+        db_path (str | Path): Path to aws_saml.db
+        regions (list): Candidate regions
+        ttl_seconds (int): How long a ranking is reused
+        endpoint_for (callable): region -> (host, port); replaced by tests with local stand-ins
+        probe (bool): Probe when the stored ranking is stale; when False only the stored ranking is read
+        probe_options: Passed through to rank_endpoints
+
+    Returns:
+        str: The fastest healthy region, or None if none answered or, without probe, none is stored
+    """
+    candidates = {region: endpoint_for(region) for region in regions}
+    ranking = load_ranking(db_path, candidates, ttl_seconds)
+    if ranking is None and not probe:
+        return None
+    if ranking is None:
+        log_stream.info(f'Probing {len(candidates)} regional STS endpoint(s)')
+        ranking = rank_endpoints(candidates, **probe_options)
+        save_ranking(db_path, candidates, ranking)
+
+    if not ranking:
+        log_stream.warning('No regional STS endpoint answered the latency probe')
+        return None
+    region, latency = ranking[0]
+    log_stream.info(f'Using STS endpoint in {region} ({latency * 1000:.0f} ms connect)')
+    return region
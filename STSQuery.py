@@ -0,0 +1,184 @@
+# coding=utf-8
+"""
+Minimal AssumeRoleWithSAML client speaking the STS Query API directly.
+
+AssumeRoleWithSAML is an unsigned call authenticated by the SAML assertion itself, so it
+needs nothing more than an HTTPS POST. Using requests and defusedxml here avoids loading
+boto3/botocore at all, which is most of this tool's start-up time and memory. The parsed
+response has the same shape boto3 returns, so AWS.STS.get_sts_details works on either.
+"""
+
+import datetime
+import threading
+
+import defusedxml.ElementTree as ET
+import requests
+from requests.adapters import HTTPAdapter
+
+import constants
+from Logging import Logging
+
+log_stream = Logging('sts_query')
+
+STS_API_VERSION = '2011-06-15'
+STS_NAMESPACE = '{https://sts.amazonaws.com/doc/2011-06-15/}'
+
+_http_session = None
+_http_pool_size = 0
+_retired_sessions = []
+_http_session_lock = threading.Lock()
+
+
+class STSQueryError(Exception):
+    """An ErrorResponse returned by STS, carrying the AWS error code."""
+
+    def __init__(self, code, message, status_code=None):
+        super().__init__(f'{code}: {message}')
+        self.code = code
+        self.message = message
+        self.status_code = status_code
+
+
+def get_endpoint_url(region, endpoint_url=None):
+    """Return the STS endpoint for a region, or the explicit override when one is configured."""
+    if endpoint_url:
+        return endpoint_url
+    return f'https://sts.{region}.amazonaws.com/'
+
+
+def get_http_session(pool_size=None):
+    """
+    Return the shared requests session, sized to hold pool_size keep-alive connections per host.
+
+    Args:
+        pool_size (int, optional): Connections a batch needs; a smaller pool is replaced. Without
+            it the current session is returned whatever its size, and a new one gets
+            constants.__sts_pool_size__.
+
+    Returns:
+        requests.Session
+    """
+    global _http_session, _http_pool_size
+    with _http_session_lock:
+        if _http_session is not None and (pool_size is None or _http_pool_size >= int(pool_size)):
+            return _http_session
+        pool_size = max(int(pool_size or constants.__sts_pool_size__), 1)
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        # Calls of another group may still be using the smaller session; it is closed by
+        # reset_http_session rather than under them
+        if _http_session is not None:
+            _retired_sessions.append(_http_session)
+        _http_session = session
+        _http_pool_size = pool_size
+        return _http_session
+
+
+def reset_http_session():
+    """Close and drop the shared requests session and any it replaced."""
+    global _http_session, _http_pool_size
+    with _http_session_lock:
+        for session in _retired_sessions + ([_http_session] if _http_session is not None else []):
+            session.close()
+        _retired_sessions.clear()
+        _http_session = None
+        _http_pool_size = 0
+
+
+def _find_text(element, path):
+    found = element.find('/'.join(STS_NAMESPACE + part for part in path.split('/')))
+    return found.text if found is not None else None
+
+
+def parse_error_response(body, status_code=None):
+    """Turn an STS ErrorResponse document into an STSQueryError."""
+    try:
+        root = ET.fromstring(body)
+        code = _find_text(root, 'Error/Code') or 'Unknown'
+        message = _find_text(root, 'Error/Message') or ''
+    except ET.ParseError:
+        code, message = 'Unknown', body[:200]
+    return STSQueryError(code, message, status_code)
+
+
+def parse_assume_role_with_saml_response(body):
+    """
+    Parse an AssumeRoleWithSAMLResponse document into the dictionary shape boto3 returns.
+
+    Args:
+        body (str | bytes): XML response body
+
+    Returns:
+        dict: Credentials (with a timezone-aware Expiration), AssumedRoleUser, Subject,
+              SubjectType, Issuer, Audience, NameQualifier and PackedPolicySize
+    """
+    root = ET.fromstring(body)
+    result = root.find(f'{STS_NAMESPACE}AssumeRoleWithSAMLResult')
+    if result is None:
+        raise STSQueryError('MalformedResponse', 'AssumeRoleWithSAMLResult element missing from STS response')
+
+    expiration = _find_text(result, 'Credentials/Expiration')
+    if expiration is None:
+        raise STSQueryError('MalformedResponse', 'Credentials missing from STS response')
+
+    sts_object = {
+        'Credentials': {
+            'AccessKeyId': _find_text(result, 'Credentials/AccessKeyId'),
+            'SecretAccessKey': _find_text(result, 'Credentials/SecretAccessKey'),
+            'SessionToken': _find_text(result, 'Credentials/SessionToken'),
+            'Expiration': datetime.datetime.fromisoformat(expiration.replace('Z', '+00:00')),
+        },
+        'AssumedRoleUser': {
+            'AssumedRoleId': _find_text(result, 'AssumedRoleUser/AssumedRoleId'),
+            'Arn': _find_text(result, 'AssumedRoleUser/Arn'),
+        },
+    }
+    for key in ('Subject', 'SubjectType', 'Issuer', 'Audience', 'NameQualifier', 'SourceIdentity'):
+        value = _find_text(result, key)
+        if value is not None:
+            sts_object[key] = value
+    packed_policy_size = _find_text(result, 'PackedPolicySize')
+    if packed_policy_size is not None:
+        sts_object['PackedPolicySize'] = int(packed_policy_size)
+
+    return sts_object
+
+
+def assume_role_with_saml(region, role, principle, saml_assertion, duration, endpoint_url=None, timeout=None):
+    """
+    Call AssumeRoleWithSAML over the STS Query API.
+
+    Args:
+        region (str): Region whose STS endpoint is used
+        role (str): ARN of the role to assume
+        principle (str): ARN of the SAML provider
+        saml_assertion (str): Base64 encoded SAML response
+        duration (int): Session duration in seconds
+        endpoint_url (str, optional): Endpoint override, e.g. a local stand-in
+        timeout (float, optional): Socket timeout in seconds
+
+    Returns:
+        dict: The parsed response, shaped like boto3's assume_role_with_saml result
+
+    Raises:
+        STSQueryError: If STS answered with an ErrorResponse
+        requests.RequestException: If the endpoint could not be reached
+    """
+    form = {
+        'Action': 'AssumeRoleWithSAML',
+        'Version': STS_API_VERSION,
+        'RoleArn': role,
+        'PrincipalArn': principle,
+        'SAMLAssertion': saml_assertion,
+        'DurationSeconds': str(int(duration)),
+    }
+    response = get_http_session().post(
+        get_endpoint_url(region, endpoint_url),
+        data=form,
+        timeout=timeout or constants.__timeout__,
+    )
+    if response.status_code != 200:
+        raise parse_error_response(response.text, response.status_code)
+    return parse_assume_role_with_saml_response(response.content)
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""
+Deadline-aware ordering of batch re-authentication.
+
+A profile's urgency is the time left on its credentials, from token_state. Pinned profiles
+count as if that time were shorter (constants.__pin_weight__), and profiles that have
+expired or were never authenticated come first. ExpiryQueue is the priority queue behind
+the ordering: BatchPlan uses it to order the login groups, each by its most urgent
+profile, and the profiles within each group. perform_batch_auth hands the STS stage the
+most urgent of the waiting assertions first.
+
+lapses() compares each profile's expiry with when the plan's estimate says it will be
+refreshed, so a batch that cannot keep up is reported before it starts.
+"""
+
+import heapq
+import itertools
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import constants
+
+
+def load_pinned(db_path) -> set[str]:
+    """Profiles pinned with samlstat pin."""
+    try:
+        conn = sqlite3.connect(str(db_path))
+        pinned = {profile for profile, in conn.execute("SELECT profile_name FROM pinned_profiles")}
+        conn.close()
+    except sqlite3.Error:
+        return set()
+    return pinned
+
+
+def urgency(expiration: datetime | None, pinned: bool, now: datetime, pin_weight: float | None = None) -> tuple:
+    """
+    Sort key for a profile: smaller is more urgent.
+
+    Returns:
+        tuple: (weighted seconds left, 0 if pinned else 1); expired and unknown profiles have no time left
+    """
+    pin_weight = constants.__pin_weight__ if pin_weight is None else pin_weight
+    seconds_left = max(0.0, (expiration - now).total_seconds()) if expiration is not None else 0.0
+    return seconds_left * (pin_weight if pinned else 1.0), 0 if pinned else 1
+
+
+class ExpiryQueue:
+    """Min-heap of work ordered by urgency(), then by name, then by insertion."""
+
+    def __init__(self, now: datetime | None = None, pin_weight: float | None = None):
+        self.now = now or datetime.now(timezone.utc)
+        self.pin_weight = pin_weight
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def push(self, name: str, expiration: datetime | None, pinned: bool = False, item=None):
+        key = urgency(expiration, pinned, self.now, self.pin_weight) + (name,)
+        heapq.heappush(self._heap, (key, next(self._sequence), name, item))
+
+    def push_key(self, key: tuple, name: str, item=None):
+        """Queue work under an already computed key, e.g. a group's most urgent profile."""
+        heapq.heappush(self._heap, (key, next(self._sequence), name, item))
+
+    def pop(self) -> tuple:
+        """(key, name, item) of the most urgent entry."""
+        key, _, name, item = heapq.heappop(self._heap)
+        return key, name, item
+
+    def drain(self) -> list[tuple]:
+        return [self.pop() for _ in range(len(self._heap))]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def order(profiles, expirations: dict, pinned: set, now: datetime) -> list[tuple]:
+    """[(key, profile), ...] most urgent first."""
+    expiry_queue = ExpiryQueue(now)
+    for profile in profiles:
+        expiry_queue.push(profile, expirations.get(profile), profile in pinned)
+    return [(key, name) for key, name, _ in expiry_queue.drain()]
+
+
+def lapses(groups: list[dict], expirations: dict, now: datetime) -> dict[str, tuple[datetime, datetime]]:
+    """
+    Profiles whose credentials are valid now but expire before the plan refreshes them.
+
+    Args:
+        groups (list): BatchPlan groups carrying 'finish_seconds' from the estimate
+
+    Returns:
+        dict: profile -> (expiration, estimated refresh time)
+    """
+    late = {}
+    for group in groups:
+        refreshed_at = now + timedelta(seconds=group['finish_seconds'])
+        for profile in group['profiles']:
+            expiration = expirations.get(profile)
+            if expiration is not None and now < expiration < refreshed_at:
+                late[profile] = (expiration, refreshed_at)
+    return late
@@ -9,10 +9,86 @@ import time
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common import exceptions as se
+
+import constants
 from Logging import Logging
 
 log_stream = Logging('selenium_helper')
 
+# Screens are [name, [[kind, value], ...]] lists, most specific first; a screen matches
+# when all its conditions hold. Kinds: 'url' (substring of location.href), 'title' (exact
+# document.title), 'text' (substring of the serialized DOM, as in page_source), 'css'
+# (a selector matches) and 'link_text' (an anchor's visible text, as By.LINK_TEXT).
+_SCREEN_MATCHER = """
+function firstScreen(screens) {
+    var html = null;
+    function holds(kind, value) {
+        if (kind === 'url') { return location.href.indexOf(value) !== -1; }
+        if (kind === 'title') { return document.title === value; }
+        if (kind === 'css') { return document.querySelector(value) !== null; }
+        if (kind === 'link_text') {
+            return Array.prototype.some.call(document.querySelectorAll('a'), function (a) {
+                return (a.innerText || a.textContent || '').trim() === value;
+            });
+        }
+        if (kind === 'text') {
+            if (html === null) { html = document.documentElement ? document.documentElement.outerHTML : ''; }
+            return html.indexOf(value) !== -1;
+        }
+        return false;
+    }
+    for (var i = 0; i < screens.length; i++) {
+        if (screens[i][1].every(function (condition) { return holds(condition[0], condition[1]); })) {
+            return screens[i][0];
+        }
+    }
+    return null;
+}
+"""
+# One batched check of every screen; returns the first match's name or null
+_PROBE_SCREENS_SCRIPT = _SCREEN_MATCHER + "return firstScreen(arguments[0]);"
+# Resolves with the first matching screen as soon as one appears: checked straight away,
+# after each burst of DOM mutations (coalesced over 25 ms), and every arguments[2] ms for
+# changes no mutation reports, such as the URL. Resolves with the final check's result,
+# possibly null, once arguments[1] milliseconds have passed. Only the name crosses the
+# WebDriver wire.
+_WAIT_FOR_SCREEN_SCRIPT = _SCREEN_MATCHER + """
+var screens = arguments[0], timeoutMs = arguments[1], tickMs = arguments[2];
+var done = arguments[arguments.length - 1];
+var first = firstScreen(screens);
+if (first !== null) { done(first); return; }
+var settled = false, pending = null, ticker = null, deadline = null, observer = null;
+function finish(result) {
+    if (settled) { return; }
+    settled = true;
+    observer.disconnect();
+    clearTimeout(pending);
+    clearInterval(ticker);
+    clearTimeout(deadline);
+    done(result);
+}
+function check() {
+    var screen = firstScreen(screens);
+    if (screen !== null) { finish(screen); }
+}
+observer = new MutationObserver(function () {
+    if (pending !== null) { return; }
+    pending = setTimeout(function () { pending = null; check(); }, 25);
+});
+observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+ticker = setInterval(check, tickMs);
+deadline = setTimeout(function () { finish(firstScreen(screens)); }, timeoutMs);
+"""
+# Extra script timeout so the in-page deadline, not WebDriver's, ends a wait
+_SCRIPT_TIMEOUT_MARGIN = 5
+# In-page waits cut short (e.g. by a navigation) before falling back to probing per tick
+_MAX_WAIT_RESTARTS = 3
+
+
+def _as_script_arg(screens):
+    """Screens as nested lists, which WebDriver passes to scripts as arrays."""
+    return [[name, [list(condition) for condition in conditions]] for name, conditions in screens]
+
 
 class SeleniumHelper:
     """Helper class for common Selenium operations."""
@@ -163,6 +239,87 @@ class SeleniumHelper:
             time.sleep(min(delay, remaining))
             delay = min(delay * backoff_factor, max_delay)
 
+    def probe_screens(self, screens):
+        """
+        Check every screen signature in one round trip.
+
+        Args:
+            screens (list): (name, [(kind, value), ...]) pairs, most specific first
+
+        Returns:
+            str: Name of the first screen whose conditions all hold, or None
+        """
+        return self.driver.execute_script(_PROBE_SCREENS_SCRIPT, _as_script_arg(screens))
+
+    def wait_for_screen(self, screens, max_total_seconds: float, label: str = "", tick: float | None = None):
+        """
+        Wait in the page for the first of several screens to appear.
+
+        A MutationObserver injected with execute_async_script re-checks every signature as
+        the DOM changes, and on a tick for URL changes, so the wait ends within
+        milliseconds of a screen rendering and only its name is sent back. A navigation
+        destroys the observer; the wait is then restarted in the new document for the
+        remaining time. Drivers that cannot run the script are probed with probe_screens
+        once per tick instead.
+
+        Args:
+            screens (list): (name, [(kind, value), ...]) pairs, most specific first
+            max_total_seconds (float): Overall deadline, in seconds
+            label (str, optional): Description for logging
+            tick (float, optional): Seconds between checks that no mutation triggers
+
+        Returns:
+            str: Name of the screen found before the deadline, or None
+        """
+        tick = constants.__screen_probe_interval__ if tick is None else tick
+        deadline = time.monotonic() + max_total_seconds
+        restarts = 0
+        while True:
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                self.driver.set_script_timeout(remaining + _SCRIPT_TIMEOUT_MARGIN)
+                screen = self.driver.execute_async_script(_WAIT_FOR_SCREEN_SCRIPT, _as_script_arg(screens),
+                                                          int(remaining * 1000), max(1, int(tick * 1000)))
+            except se.TimeoutException:
+                screen = None
+            except se.WebDriverException as e:
+                restarts += 1
+                if restarts < _MAX_WAIT_RESTARTS and deadline > time.monotonic():
+                    log_stream.debug(f'In-page wait for {label} interrupted, restarting: {str(e).strip()}')
+                    continue
+                log_stream.debug(f'In-page wait for {label} unavailable, probing every {tick}s: {str(e).strip()}')
+                screen = self._probe_until(screens, deadline, tick)
+            if screen is not None:
+                log_stream.debug(f'Found {label}: {screen}')
+            else:
+                log_stream.warning(f'Timeout waiting for {label} in page')
+            return screen
+
+    def _probe_until(self, screens, deadline: float, tick: float):
+        while True:
+            try:
+                screen = self.probe_screens(screens)
+            except se.WebDriverException:
+                screen = None
+            remaining = deadline - time.monotonic()
+            if screen is not None or remaining <= 0:
+                return screen
+            time.sleep(min(tick, remaining))
+
+    def wait_for_page_text(self, needle: str, max_total_seconds: float, label: str = ""):
+        """
+        Wait in the page for a substring of the serialized DOM to appear (see wait_for_screen).
+
+        Args:
+            needle (str): Substring to search for, as in page_source
+            max_total_seconds (float): Overall deadline, in seconds
+            label (str, optional): Description for logging
+
+        Returns:
+            bool: True if the substring was found before the deadline, False otherwise
+        """
+        return self.wait_for_screen([(label or needle, [('text', needle)])], max_total_seconds, label) is not None
+
     def wait_for_url_contains(self, url_fragment: str):
         """
         Wait for URL to contain a specific fragment.
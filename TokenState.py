@@ -0,0 +1,73 @@
+# coding=utf-8
+"""
+When each credentials profile expires, kept in the token_state table of ~/.aws/aws_saml.db.
+
+samlstat reads this table for its status view. Config records the real STS expiration
+of every profile it writes, including text-menu profiles that samlsts does not list, and
+credentials compaction uses it to find sections whose session has ended.
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+
+from Logging import Logging
+
+log_stream = Logging('token_state')
+
+
+def _ensure_table(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS token_state "
+        "(profile_name TEXT PRIMARY KEY, expiration TEXT NOT NULL, created_at TEXT NOT NULL)"
+    )
+
+
+def load_expirations(db_path) -> dict[str, datetime]:
+    """profile -> expiration for every profile with readable token state."""
+    expirations = {}
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        for profile_name, expiration in conn.execute("SELECT profile_name, expiration FROM token_state"):
+            try:
+                expirations[profile_name] = datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+            except (AttributeError, ValueError):
+                pass
+        conn.close()
+    except sqlite3.Error:
+        pass
+    return expirations
+
+
+def record_expirations(db_path, expirations: dict[str, datetime]):
+    """Record many profile expirations in one transaction."""
+    if not expirations:
+        return
+    now_str = datetime.now().isoformat()
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO token_state (profile_name, expiration, created_at) VALUES (?, ?, ?)",
+            [(profile, expiration.astimezone(timezone.utc).isoformat(), now_str)
+             for profile, expiration in expirations.items()],
+        )
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        log_stream.warning(f'Unable to record token expirations: {str(e)}')
+
+
+def forget(db_path, profiles):
+    """Drop the token state of profiles whose credentials are gone."""
+    profiles = list(profiles)
+    if not profiles:
+        return
+    try:
+        conn = sqlite3.connect(str(db_path))
+        _ensure_table(conn)
+        conn.executemany("DELETE FROM token_state WHERE profile_name = ?", [(profile,) for profile in profiles])
+        conn.commit()
+        conn.close()
+    except sqlite3.Error:
+        pass
@@ -14,8 +14,16 @@ from OSInfo import OSInfo
 #additional line
 
 log_stream = Logging('utilities')
-config = Config.Config()
 os_info = OSInfo()
+_config = None
+
+
+def get_config() -> Config.Config:
+    """The shared Config, created on first use so importing this module touches no files."""
+    global _config
+    if _config is None:
+        _config = Config.Config()
+    return _config
 
 class Arguments:
     def __init__(self):
@@ -64,6 +72,8 @@ class Arguments:
                                  help="Directory to save screenshots (default: screenshots/{timestamp})")
         self.parser.add_argument("--show-credentials", type=bool, default=False, nargs='?', const=True,
                                  help="Display AWS credentials in plaintext after SAML assume (disabled by default)")
+        self.parser.add_argument("--verify-identity", type=bool, default=False, nargs='?', const=True,
+                                 help="Confirm the new credentials with a live GetCallerIdentity call in the background")
         if len(sys.argv) == 0:
             log_stream.fatal("Arguments required")
             self.parser.print_help()
@@ -133,7 +143,8 @@ class Arguments:
 
         return self.use_okta_fastpass, self.use_debug, self.use_gui, self.browser_type, self.aws_profile_name, \
             self.store_password, self.session_duration, self.aws_region, self.text_menu, self.use_idp, self.username, \
-            self.args.encrypted, self.args.enable_screenshots, self.args.screenshot_dir, self.args.show_credentials
+            self.args.encrypted, self.args.enable_screenshots, self.args.screenshot_dir, self.args.show_credentials, \
+            self.args.verify_identity
 
 
 def extract_zip_archive(archive_file_name):
@@ -248,21 +259,21 @@ def check_if_container():
 
 
 def get_user_name():
-    aws_region, username, *nonsense = config.read_global_settings()
+    aws_region, username, *nonsense = get_config().read_global_settings()
     while username is None:
         username = input('Please provide your username: ')
     return username
 
 
 def get_browser_type():
-    *nonsense, browser = config.read_global_settings()
+    *nonsense, browser = get_config().read_global_settings()
     while browser not in constants.valid_browsers:
         browser = input(f'Please specify a browser to use [{",".join(constants.valid_browsers)}] ')
     return browser
 
 
 def get_session_duration() -> int:
-    *nonsense, session_duration, browser = config.read_global_settings()
+    *nonsense, session_duration, browser = get_config().read_global_settings()
     if session_duration is None:
         session_duration = 0
     return int(session_duration)
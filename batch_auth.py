@@ -2,14 +2,21 @@
 Batch authentication: reuse one SAML assertion across profiles sharing the same
 (samlProvider, username) identity — one browser login per group instead of one per profile.
 
+BatchPlan resolves the groups, skipped profiles and settings up front; perform_batch_auth
+only runs the plan.
+
 Mirrors the Java UI feature from PR #126 (OurGiant/aws-idp-saml-ui).
 """
 
-import configparser
-import os
+import math
+import queue
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from collections import defaultdict
+from datetime import datetime, timezone
 
 # Add the script's directory to sys.path so we can import the existing modules
 _script_dir = Path(__file__).resolve().parent
@@ -17,85 +24,136 @@ if str(_script_dir) not in sys.path:
     sys.path.insert(0, str(_script_dir))
 
 import AWS
+import BatchJournal
+import BatchPlan
 import Config
+import constants
+import CredentialsGC
 import Login
 import Password
+import SAMLSelector
+import TokenState
 from Logging import Logging
 
 log_stream = Logging('batch_auth')
 
 
-def load_profile_identity(aws_dir: Path, profiles: list[str]) -> dict[str, dict]:
+class PipelineStats:
+    """Thread-safe timings of a batch's login stage, its STS stage and the assertions queued between them."""
+
+    def __init__(self):
+        self.logins = 0
+        self.login_seconds = 0.0
+        self.login_stage_seconds = 0.0
+        self.groups = 0
+        self.sts_stage_seconds = 0.0
+        self.sts_idle_seconds = 0.0
+        self.max_queue_depth = 0
+        self._started = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._started = time.monotonic()
+
+    def record_login(self, seconds):
+        with self._lock:
+            self.logins += 1
+            self.login_seconds += seconds
+            self.login_stage_seconds = time.monotonic() - self._started
+
+    def record_queued(self, depth):
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_consumed(self, idle_seconds, busy_seconds):
+        with self._lock:
+            self.groups += 1
+            self.sts_idle_seconds += idle_seconds
+            self.sts_stage_seconds += busy_seconds
+
+    def summary(self):
+        return (f'Pipeline: login stage {self.login_stage_seconds:.1f}s for {self.logins} browser login(s) '
+                f'({self.login_seconds:.1f}s of logins), STS stage {self.sts_stage_seconds:.1f}s busy and '
+                f'{self.sts_idle_seconds:.1f}s waiting over {self.groups} group(s), '
+                f'max {self.max_queue_depth} assertion(s) queued')
+
+
+def assume_group_roles(profile_info: dict[str, dict], group_profiles: list[str], saml_response: str,
+                       max_workers: int | None = None, backend: str | None = None, sts_region: str | None = None,
+                       deadline=None, rate_limiter=None, stats=None):
     """
-    Load profile config and return identity info for grouping.
-    Returns dict of profile_name -> {saml_provider, username, account_number, iam_role, aws_region, session_duration, ...}
+    Assume the role of every profile in a group concurrently with one shared SAML assertion.
+
+    Each AssumeRoleWithSAML call is independent, so the calls run on a bounded thread pool
+    and the group takes about as long as its slowest call. Results are yielded in
+    group_profiles order as they become available, so callers report a stable sequence.
+
+    When sts_region is set every call goes to that region's STS endpoint instead of the
+    profile's own region. deadline, rate_limiter and stats are passed to AWS.STS.aws_assume_role
+    so retries share one adaptive rate and stop when the assertion expires.
+
+    Yields (profile, sts_response, error); error is the exception raised for that profile
+    (SystemExit from AWS.STS.aws_assume_role included) and never stops the other profiles.
     """
-    config = configparser.ConfigParser()
-    config.read(str(aws_dir / "samlsts"))
-
-    # Read global defaults
-    global_username = None
-    global_provider = None
-    global_region = "us-east-1"
-    global_duration = 14400
-
-    if config.has_section("global"):
-        global_username = config.get("global", "username", fallback=None)
-        global_provider = config.get("global", "samlprovider", fallback=None)
-        global_region = config.get("global", "awsregion", fallback="us-east-1")
-        dur = config.get("global", "sessionduration", fallback=None)
-        if dur:
+    workers = max(1, min(len(group_profiles), max_workers or constants.__sts_max_workers__))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sts") as executor:
+        futures = []
+        for profile in group_profiles:
+            info = profile_info[profile]
+            future = executor.submit(
+                AWS.STS.aws_assume_role,
+                region=sts_region or info["aws_region"],
+                role=info["role_arn"],
+                principle=info["principal_arn"],
+                saml_assertion=saml_response,
+                duration=info["session_duration"],
+                backend=backend,
+                deadline=deadline,
+                rate_limiter=rate_limiter,
+                stats=stats,
+            )
+            futures.append((profile, future))
+
+        for profile, future in futures:
             try:
-                global_duration = int(dur)
-            except ValueError:
-                pass
-
-    profile_info = {}
-    for profile in profiles:
-        if not config.has_section(profile):
-            continue
-
-        section = config[profile]
-        saml_provider = section.get("samlprovider", fallback=global_provider)
-        username = section.get("username", fallback=global_username)
-        account_number = section.get("accountnumber", fallback=None)
-        iam_role = section.get("iamrole", fallback=None)
-        aws_region = section.get("awsregion", fallback=global_region)
-        gui_name = section.get("guiname", fallback=None)
-        dur = section.get("sessionduration", fallback=None)
-        session_duration = int(dur) if dur else global_duration
-
-        if not saml_provider or not account_number or not iam_role:
-            log_stream.warning(f"Skipping profile {profile}: missing provider/account/role")
-            continue
-
-        # Build ARNs
-        provider_name = saml_provider.split("-", 1)[1] if "-" in saml_provider else saml_provider
-        role_arn = f"arn:aws:iam::{account_number}:role/{iam_role}"
-        principal_arn = f"arn:aws:iam::{account_number}:saml-provider/{provider_name}"
-
-        profile_info[profile] = {
-            "saml_provider": saml_provider,
-            "username": username,
-            "account_number": account_number,
-            "iam_role": iam_role,
-            "aws_region": aws_region,
-            "session_duration": session_duration,
-            "role_arn": role_arn,
-            "principal_arn": principal_arn,
-            "gui_name": gui_name,
-        }
-
-    return profile_info
-
-
-def group_by_identity(profile_info: dict[str, dict]) -> dict[tuple, list[str]]:
-    """Group profiles by (samlProvider, username) for shared login."""
-    groups = defaultdict(list)
-    for profile, info in profile_info.items():
-        key = (info["saml_provider"], info["username"])
-        groups[key].append(profile)
-    return dict(groups)
+                yield profile, future.result(), None
+            except (SystemExit, Exception) as e:
+                yield profile, None, e
+
+
+def login_group(first_info: dict, password: str, browser_type: str, use_debug: bool = False,
+                use_fastpass: bool = False, mfa_lock=None) -> tuple[str, float]:
+    """
+    One headless browser login for a group, on behalf of all of its profiles.
+
+    Runs on the login pool, so a SystemExit from the IdP flow (an MFA timeout, a forced
+    password reset) fails this group only instead of ending the whole batch.
+
+    Returns:
+        tuple: (the SAML response or Login.browser_login's short failure string, seconds the login took)
+    """
+    saml_provider = first_info["saml_provider"]
+    provider_name = saml_provider.split("-", 1)[1] if "-" in saml_provider else saml_provider
+    start = time.monotonic()
+    try:
+        saml_response = Login.browser_login(
+            username=first_info["username"],
+            password=password,
+            first_page=first_info["login_page"],
+            use_debug=use_debug,
+            use_gui=False,
+            browser=browser_type,
+            saml_provider_name=provider_name,
+            idp_login_title=first_info["login_title"],
+            iam_role=first_info["iam_role"],
+            gui_name=first_info.get("gui_name"),
+            dsso_url=first_info["dsso_url"],
+            use_okta_fastpass=use_fastpass,
+            mfa_lock=mfa_lock,
+        )
+    except SystemExit:
+        saml_response = "LoginAborted"
+    return saml_response, time.monotonic() - start
 
 
 def perform_batch_auth(
@@ -104,141 +162,299 @@ def perform_batch_auth(
     use_debug: bool = False,
     show_encrypted: bool = False,
     status_callback=None,
+    browser: str | None = None,
+    plan: BatchPlan.BatchPlan | None = None,
+    resume: bool = False,
+    deadline_seconds: int | None = None,
 ) -> dict[str, bool]:
     """
     Authenticate multiple profiles with shared SAML login.
 
     Groups profiles by (samlProvider, username), performs one browser login per group,
-    then assumes roles for all profiles in the group using the same assertion.
+    then assumes roles for all profiles in the group using the same assertion. Group logins
+    run concurrently on up to constants.__login_max_workers__ headless browsers and queue
+    their assertions for the STS stage, which assumes and writes one group while the next
+    logs in. Profiles sharing an account and role within a group share one
+    AssumeRoleWithSAML call. Stage timings and queue depth are reported as a STATS event.
+
+    Everything is read up front by BatchPlan.build, or taken from plan when one is given;
+    nothing here reads samlsts again. Each profile's progress is checkpointed in a
+    BatchJournal. With resume, the last unfinished batch for the same profiles continues:
+    profiles it wrote that are still valid are skipped and its captured assertions are
+    reused while they last.
 
     Returns dict of profile_name -> success (bool).
     """
-    aws_dir = Path.home() / ".aws"
     config_obj = Config.Config()
+    if plan is None:
+        plan = BatchPlan.build(profiles, config_obj, browser=browser, deadline_seconds=deadline_seconds)
+    settings = plan.settings
+    profile_info = plan.profile_info
+    assertion_cache = plan.assertion_cache
+    sts_rate_limiter = AWS.AdaptiveRateLimiter()
+    sts_stats = AWS.AssumeRoleStats()
+    pipeline_stats = PipelineStats()
+    timings = []
     results = {}
 
-    # Load profile identity info
-    profile_info = load_profile_identity(aws_dir, profiles)
+    # Every broken profile is reported up front, with all of its problems
+    for p, problem in plan.skipped.items():
+        if status_callback:
+            status_callback("SKIP", p, problem)
+        results[p] = False
 
-    missing = [p for p in profiles if p not in profile_info]
-    if missing:
-        for p in missing:
+    # Profiles the batch will not reach before they expire, and a missed deadline
+    for warning in plan.warnings:
+        log_stream.warning(warning)
+        if status_callback:
+            status_callback("WARN", None, warning)
+
+    journal = None
+    if resume:
+        journal = BatchJournal.BatchJournal.resume(settings['db_path'], settings['pass_key'], plan.requested)
+        if journal is None and status_callback:
+            status_callback("INFO", None, "No interrupted batch for these profiles, starting a new one")
+    if journal is None:
+        journal = BatchJournal.BatchJournal.start(settings['db_path'], settings['pass_key'], plan.requested)
+    else:
+        # Written by the interrupted run and not yet expired: nothing left to do for these
+        states = journal.states()
+        expirations = TokenState.load_expirations(settings['db_path'])
+        now = datetime.now(timezone.utc)
+        done = [p for p in plan.profile_info
+                if states.get(p) == BatchJournal.WRITTEN and expirations.get(p) is not None and expirations[p] > now]
+        for p in done:
+            results[p] = True
             if status_callback:
-                status_callback(f"SKIP", p, "Missing or incomplete config")
-            results[p] = False
-
-    # Group by shared identity
-    groups = group_by_identity(profile_info)
+                status_callback("DONE", p, "Written by the interrupted batch")
+        plan.exclude(done)
 
     if status_callback:
-        status_callback("INFO", None, f"Batch auth: {len(profiles)} profiles in {len(groups)} login group(s)")
-
-    # Get password once for all groups
-    pass_key, pass_file = config_obj.return_stored_pass_config()
-    password = Password.retrieve_password(pass_key, pass_file)
-
-    for (saml_provider, username), group_profiles in groups.items():
-        provider_name = saml_provider.split("-", 1)[1] if "-" in saml_provider else saml_provider
+        status_callback("INFO", None, f"Batch auth: {len(plan.requested)} profiles in {len(plan.groups)} login group(s)")
 
+    # Groups with a still-valid cached assertion skip the browser
+    cached = []
+    to_login = []
+    for group in plan.groups:
         if status_callback:
-            status_callback("LOGIN", None, f"Logging in as {username} via {provider_name} for {len(group_profiles)} profile(s)")
+            status_callback("LOGIN", None, f"Logging in as {group['username']} via {group['provider_name']} "
+                                           f"for {len(group['profiles'])} profile(s)")
 
-        # Read provider config for login URL
-        samlsts_config = configparser.ConfigParser()
-        samlsts_config.read(str(aws_dir / "samlsts"))
+        saml_response = journal.assertion(group['provider_name'], group['username']) if journal.resumed else None
+        if saml_response is None and group['cached_assertion']:
+            saml_response = assertion_cache.get(group['provider_name'], group['username'])
+        if saml_response is not None:
+            cached.append((group, saml_response))
+        else:
+            to_login.append(group)
 
-        try:
-            first_page = samlsts_config.get(saml_provider, "loginpage")
-            idp_login_title = samlsts_config.get(saml_provider, "logintitle").replace('"', '')
-        except (configparser.NoSectionError, configparser.NoOptionError) as e:
-            log_stream.critical(f"Provider config error for {saml_provider}: {e}")
-            for p in group_profiles:
-                results[p] = False
-                if status_callback:
-                    status_callback("FAIL", p, f"Provider config error: {e}")
-            continue
+    def write_profile(profile, sts_response, error, staged):
+        """Stage a profile's credentials in the open transaction; OK is reported once it commits."""
+        info = profile_info[profile]
 
-        # Check for DSSO URL
         try:
-            dsso_url = samlsts_config.get(saml_provider, "dssourl")
-        except (configparser.NoSectionError, configparser.NoOptionError):
-            dsso_url = None
-
-        # Get browser type
-        browser_type = samlsts_config.get("global", "browser", fallback="chrome")
-
-        # Perform ONE browser login for the group
-        saml_response = Login.browser_login(
-            username=username,
-            password=password,
-            first_page=first_page,
-            use_debug=use_debug,
-            use_gui=False,
-            browser=browser_type,
-            saml_provider_name=provider_name,
-            idp_login_title=idp_login_title,
-            iam_role=profile_info[group_profiles[0]]["iam_role"],
-            gui_name=profile_info[group_profiles[0]].get("gui_name"),
-            dsso_url=dsso_url,
-            use_okta_fastpass=use_fastpass,
-        )
-
-        # Check if login succeeded
-        if len(saml_response) < 50:
-            log_stream.critical(f"Login failed for group ({provider_name}/{username}): {saml_response}")
-            for p in group_profiles:
-                results[p] = False
-                if status_callback:
-                    status_callback("FAIL", p, f"Login failed: {saml_response}")
-            continue
+            if error is not None:
+                raise error
 
-        log_stream.info(f"SAML assertion captured ({len(saml_response)} bytes), assuming roles for {len(group_profiles)} profile(s)")
-
-        # Assume role for each profile in the group using the shared assertion
-        for profile in group_profiles:
-            info = profile_info[profile]
+            aws_access_id, aws_secret_key, aws_session_token, sts_expiration = \
+                AWS.STS.get_sts_details(sts_response)
 
-            try:
-                sts_response = AWS.STS.aws_assume_role(
-                    region=info["aws_region"],
-                    role=info["role_arn"],
-                    principle=info["principal_arn"],
-                    saml_assertion=saml_response,
-                    duration=info["session_duration"],
+            if Config.validate_aws_cred_format(aws_access_id, aws_secret_key, aws_session_token):
+                config_obj.write_aws_config(
+                    aws_access_id, aws_secret_key, aws_session_token,
+                    profile, info["aws_region"], info["account_number"], True, sts_expiration
                 )
+                results[profile] = True
+                staged.append((profile, sts_expiration, (aws_access_id, aws_secret_key, aws_session_token)))
+            else:
+                results[profile] = False
+                if status_callback:
+                    status_callback("FAIL", profile, "Invalid credential format from STS")
 
-                aws_access_id, aws_secret_key, aws_session_token, sts_expiration = \
-                    AWS.STS.get_sts_details(sts_response)
-
-                if Config.validate_aws_cred_format(aws_access_id, aws_secret_key, aws_session_token):
-                    config_obj.write_aws_config(
-                        aws_access_id, aws_secret_key, aws_session_token,
-                        profile, info["aws_region"], info["account_number"], True
-                    )
-                    results[profile] = True
+        except SystemExit as e:
+            results[profile] = False
+            if status_callback:
+                reason = f": {e.__cause__.code}" if isinstance(e.__cause__, AWS.STSCallError) else ""
+                status_callback("FAIL", profile, f"AssumeRoleWithSAML failed{reason}")
+        except Exception as e:
+            results[profile] = False
+            if status_callback:
+                status_callback("FAIL", profile, str(e))
 
+    def report_written(staged):
+        for profile, sts_expiration, credentials in staged:
+            if status_callback:
+                status_callback("OK", profile, f"Expires {sts_expiration.strftime('%H:%M:%S')}")
+            if show_encrypted:
+                try:
+                    import Utilities
+                    encrypted = Utilities.encrypt_credentials(*credentials)
+                    print(f"\nEncrypted Credentials ({profile}):\n{encrypted}\n")
+                except Exception:
+                    pass
+
+    def assume_and_write(group, saml_response, used_cached_assertion):
+        provider_name, username = group['provider_name'], group['username']
+        group_profiles = group['profiles']
+
+        if used_cached_assertion:
+            log_stream.info(f"Reusing cached SAML assertion, assuming roles for {len(group_profiles)} profile(s)")
+        else:
+            # Check if login succeeded
+            if len(saml_response) < 50:
+                log_stream.critical(f"Login failed for group ({provider_name}/{username}): {saml_response}")
+                journal.mark(group_profiles, BatchJournal.FAILED)
+                for p in group_profiles:
+                    results[p] = False
                     if status_callback:
-                        status_callback("OK", profile, f"Expires {sts_expiration.strftime('%H:%M:%S')}")
-
-                    if show_encrypted:
-                        try:
-                            import Utilities
-                            encrypted = Utilities.encrypt_credentials(aws_access_id, aws_secret_key, aws_session_token)
-                            print(f"\nEncrypted Credentials ({profile}):\n{encrypted}\n")
-                        except Exception:
-                            pass
-                else:
-                    results[profile] = False
-                    if status_callback:
-                        status_callback("FAIL", profile, "Invalid credential format from STS")
-
-            except SystemExit:
-                results[profile] = False
+                        status_callback("FAIL", p, f"Login failed: {saml_response}")
+                return
+
+            log_stream.info(f"SAML assertion captured ({len(saml_response)} bytes), assuming roles for {len(group_profiles)} profile(s)")
+
+            if assertion_cache is not None:
+                assertion_cache.put(provider_name, username, saml_response)
+            journal.save_assertion(provider_name, username, saml_response)
+
+        journal.mark(group_profiles, BatchJournal.ASSERTION)
+        assertion_expiry = SAMLSelector.get_assertion_expiry(saml_response)
+
+        # Size each regional STS client's connection pool to the fan-out so every assume reuses warm connections
+        sts_workers = min(len(group['assume']), constants.__sts_max_workers__)
+        sts_regions = {settings['sts_region']} if settings['sts_region'] else \
+            {profile_info[p]["aws_region"] for p in group['assume']}
+        AWS.STS.prepare_sts_transport(sts_regions, sts_workers, backend=settings['sts_backend'])
+
+        # Assume every distinct role in the group in parallel with the shared assertion; profiles that
+        # share a role get the same session. Credentials are staged here, one profile at a time, in
+        # group order; credentials/config are written once, atomically, when the group's transaction
+        # commits, and only then are the staged profiles reported OK
+        copies_of = {}
+        for copy, source in group['copies'].items():
+            copies_of.setdefault(source, []).append(copy)
+        staged = []
+        start = time.monotonic()
+        try:
+            with config_obj.transaction():
+                for profile, sts_response, error in assume_group_roles(profile_info, group['assume'], saml_response,
+                                                                       max_workers=sts_workers,
+                                                                       backend=settings['sts_backend'],
+                                                                       sts_region=settings['sts_region'],
+                                                                       deadline=assertion_expiry,
+                                                                       rate_limiter=sts_rate_limiter, stats=sts_stats):
+                    for target in [profile] + copies_of.get(profile, []):
+                        write_profile(target, sts_response, error, staged)
+                journal.mark([p for p in group_profiles if results.get(p)], BatchJournal.ASSUMED)
+        except OSError as e:
+            log_stream.critical(f"Unable to write credentials for group ({provider_name}/{username}): {e}")
+            for p, _, _ in staged:
+                results[p] = False
                 if status_callback:
-                    status_callback("FAIL", profile, "AssumeRoleWithSAML failed")
+                    status_callback("FAIL", p, f"Unable to write credentials: {e}")
+        else:
+            report_written(staged)
+        journal.mark([p for p in group_profiles if results.get(p)], BatchJournal.WRITTEN)
+        journal.mark([p for p in group_profiles if not results.get(p)], BatchJournal.FAILED)
+        rounds = math.ceil(len(group['assume']) / sts_workers)
+        timings.append(("assume", group['saml_provider'], username, (time.monotonic() - start) / rounds))
+
+        # A cached assertion that no role in the group accepted is stale; drop it so the next run logs in
+        if used_cached_assertion and not any(results.get(p) for p in group_profiles):
+            log_stream.warning(f"Cached SAML assertion for {username} was rejected, discarding it")
+            if assertion_cache is not None:
+                assertion_cache.remove(provider_name, username)
+            journal.forget_assertion(provider_name, username)
+
+    # A two-stage pipeline. Stage one produces assertions: cached ones at once, and one headless
+    # browser login per remaining group on a bounded pool, with the password read once before
+    # any browser starts and MFA prompts serialised per device. Stage two, on this thread,
+    # consumes them in arrival order and assumes and writes each group's roles, so STS work on
+    # one group overlaps the logins of the next and status events stay ordered per profile.
+    # When several assertions are waiting, the group with the most urgent profile goes first
+    password = None
+    if to_login:
+        password = Password.retrieve_password(settings['pass_key'], settings['pass_file'])
+
+    assertions = queue.PriorityQueue()
+    pipeline_stats.start()
+
+    def produced(group, saml_response, used_cached_assertion):
+        assertions.put((group['rank'], group['username'], (group, saml_response, used_cached_assertion)))
+        pipeline_stats.record_queued(assertions.qsize())
+
+    def login_finished(group, future):
+        # The consumer takes exactly one assertion per group, so this always queues one: an
+        # exception here would otherwise be swallowed by concurrent.futures and hang the batch
+        saml_response = "LoginError"
+        try:
+            if future.cancelled():
+                saml_response = "LoginCancelled"
+                return
+            try:
+                result, seconds = future.result()
             except Exception as e:
-                results[profile] = False
-                if status_callback:
-                    status_callback("FAIL", profile, str(e))
+                log_stream.critical(f"Login for group ({group['provider_name']}/{group['username']}) raised: {e}")
+                return
+            if isinstance(result, str):
+                saml_response = result
+            pipeline_stats.record_login(seconds)
+            if len(saml_response) >= 50:
+                timings.append(("login", group['saml_provider'], group['username'], seconds))
+        finally:
+            produced(group, saml_response, False)
+
+    mfa_locks = defaultdict(threading.Lock)
+    login_workers = max(1, min(len(to_login), constants.__login_max_workers__))
+    login_executor = ThreadPoolExecutor(max_workers=login_workers, thread_name_prefix="login")
+    try:
+        for group in to_login:
+            mfa_lock = None if constants.__mfa_lock_scope__ == "none" else \
+                mfa_locks[group['username'] if constants.__mfa_lock_scope__ == "user" else None]
+            future = login_executor.submit(login_group, profile_info[group['profiles'][0]], password,
+                                           group['browser'], use_debug, use_fastpass, mfa_lock)
+            future.add_done_callback(lambda done, group=group: login_finished(group, done))
+
+        # Cached groups need no browser; their roles are assumed while the logins run
+        for group, saml_response in cached:
+            produced(group, saml_response, True)
+
+        for _ in range(len(cached) + len(to_login)):
+            waited = time.monotonic()
+            _, _, (group, saml_response, used_cached_assertion) = assertions.get()
+            started = time.monotonic()
+            assume_and_write(group, saml_response, used_cached_assertion)
+            pipeline_stats.record_consumed(started - waited, time.monotonic() - started)
+    except BaseException:
+        # Ctrl+C or a failure on this thread: logins not yet started are cancelled instead of
+        # opening one browser after another; those already running finish in the background
+        login_executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    login_executor.shutdown()
+
+    BatchPlan.record_timings(settings['db_path'], timings)
+
+    # A batch is finished once every profile that can be authenticated is written; until then
+    # its journal stays behind for --resume
+    unfinished = [p for p in plan.profile_info if not results.get(p)]
+    if not unfinished:
+        journal.finish()
+    elif status_callback:
+        status_callback("INFO", None, f"{len(unfinished)} profile(s) not refreshed; "
+                                      f"run samlstat auth --resume to continue this batch")
+
+    if status_callback and sts_stats.calls:
+        status_callback("STATS", None, sts_stats.summary())
+    if status_callback and plan.groups:
+        status_callback("STATS", None, pipeline_stats.summary())
+
+    # compactCredentials = true: drop what this and earlier batches left behind
+    if any(results.values()) and settings['compact']:
+        try:
+            report = config_obj.compact_credentials()
+        except OSError as e:
+            log_stream.warning(f"Credentials compaction skipped: {e}")
+        else:
+            if status_callback:
+                status_callback("GC", None, CredentialsGC.summary(report))
 
     return results
@@ -0,0 +1,206 @@
+# coding=utf-8
+"""
+End-to-end batch throughput: batch_auth.perform_batch_auth over 10, 100 and 1000
+synthetic profiles against a local fake STS (benchmarks/fake_sts.py) and a throwaway
+~/.aws fixture.
+
+The browser login and password store are replaced by a synthetic assertion, so the
+numbers cover what happens after the IdP: STS calls (AWS.STS), credential parsing and
+the credentials/config writes (Config.write_aws_config). This is the baseline for STS
+and config-write optimizations.
+
+    python benchmarks/bench_batch_auth.py --sizes 10 100 1000 --latency 0.05
+    python benchmarks/bench_batch_auth.py --backend boto3 --throttle-rate 0.05
+"""
+
+import argparse
+import base64
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+_repo_dir = Path(__file__).resolve().parents[1]
+_bench_dir = Path(__file__).resolve().parent
+for _path in (_repo_dir, _bench_dir):
+    if str(_path) not in sys.path:
+        sys.path.insert(0, str(_path))
+
+import AWS
+import Config
+import STSQuery
+import batch_auth
+from fake_sts import FakeSTSServer
+
+PROVIDER = 'Fed-OKTA'
+USERNAME = 'benchmark.user'
+IAM_ROLE = 'Fed-Benchmark'
+
+
+def synthetic_assertion(lifetime=timedelta(minutes=5)):
+    """A base64 SAML response carrying only what the tool reads after login: NotOnOrAfter."""
+    stamp = (datetime.now(timezone.utc) + lifetime).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    document = f"""<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol"
+                     xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion">
+      <saml2:Assertion>
+        <saml2:Subject>
+          <saml2:NameID>{USERNAME}</saml2:NameID>
+          <saml2:SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">
+            <saml2:SubjectConfirmationData NotOnOrAfter="{stamp}" Recipient="https://signin.aws.amazon.com/saml"/>
+          </saml2:SubjectConfirmation>
+        </saml2:Subject>
+        <saml2:Conditions NotOnOrAfter="{stamp}"/>
+      </saml2:Assertion>
+    </samlp:Response>"""
+    return base64.b64encode(document.encode()).decode()
+
+
+def build_fixture_home(root, profiles, backend):
+    """
+    Write a ~/.aws with one global block and `profiles` profiles that share one identity.
+
+    Returns:
+        list: The profile names
+    """
+    aws_dir = Path(root) / '.aws'
+    aws_dir.mkdir(mode=0o700, parents=True)
+    names = [f'bench-{index:05d}' for index in range(profiles)]
+
+    lines = [
+        '[global]', 'browser = chrome', f'username = {USERNAME}', f'samlProvider = {PROVIDER}',
+        'awsRegion = us-east-1', 'sessionDuration = 3600', 'savedPassword = true',
+        f'stsBackend = {backend}', 'cacheAssertion = false', '',
+        f'[{PROVIDER}]', 'loginpage = https://login.example.com/app/amazon_aws/sso/saml',
+        'loginTitle = Example - Sign In', '',
+    ]
+    for index, name in enumerate(names):
+        lines += [f'[{name}]', f'accountNumber = {100000000000 + index}', f'iamRole = {IAM_ROLE}',
+                  'awsRegion = us-east-1', '']
+    (aws_dir / 'samlsts').write_text('\n'.join(lines))
+    (aws_dir / 'credentials').write_text('#This is your AWS credentials file\n')
+    (aws_dir / 'config').write_text('')
+    for file_name in ('samlsts', 'credentials', 'config'):
+        os.chmod(aws_dir / file_name, 0o600)
+    return names
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def run_batch(profiles, server_url, backend):
+    """
+    Authenticate `profiles` synthetic profiles once and collect timings.
+
+    Returns:
+        dict: wall, ok, assume (per-profile seconds), writes (per write_aws_config seconds),
+              commits (per file commit seconds), stats
+    """
+    assume_timings, write_timings, commit_timings, stats_lines = [], [], [], []
+    timings_lock = threading.Lock()
+
+    def on_status(kind, profile, message):
+        if kind == 'STATS':
+            stats_lines.append(message)
+
+    with tempfile.TemporaryDirectory(prefix='aws-saml-bench-') as home, \
+         patch.dict(os.environ, {'HOME': home, 'USERPROFILE': home}):
+        names = build_fixture_home(home, profiles, backend)
+
+        real_assume = AWS.STS.aws_assume_role
+        real_write = Config.Config.write_aws_config
+        real_commit = Config.Config.commit
+
+        def timed_assume(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return real_assume(*args, **kwargs)
+            finally:
+                with timings_lock:
+                    assume_timings.append(time.perf_counter() - start)
+
+        def timed_write(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return real_write(self, *args, **kwargs)
+            finally:
+                write_timings.append(time.perf_counter() - start)
+
+        def timed_commit(self):
+            start = time.perf_counter()
+            try:
+                return real_commit(self)
+            finally:
+                commit_timings.append(time.perf_counter() - start)
+
+        AWS.STS.reset_sts_clients()
+        STSQuery.reset_http_session()
+        with patch.object(AWS.constants, '__sts_endpoint_url__', server_url), \
+             patch.object(AWS.STS, 'aws_assume_role', timed_assume), \
+             patch.object(Config.Config, 'write_aws_config', timed_write), \
+             patch.object(Config.Config, 'commit', timed_commit), \
+             patch.object(batch_auth.Login, 'browser_login', return_value=synthetic_assertion()), \
+             patch.object(batch_auth.Password, 'retrieve_password', return_value='benchmark'):
+            start = time.perf_counter()
+            results = batch_auth.perform_batch_auth(names, status_callback=on_status)
+            wall = time.perf_counter() - start
+
+    return {
+        'wall': wall,
+        'ok': sum(1 for succeeded in results.values() if succeeded),
+        'assume': assume_timings,
+        'writes': write_timings,
+        'commits': commit_timings,
+        'sts_stats': next((line for line in stats_lines if not line.startswith('Pipeline')), ''),
+        'pipeline_stats': next((line for line in stats_lines if line.startswith('Pipeline')), ''),
+    }
+
+
+def report(profiles, result):
+    assume, writes = result['assume'], result['writes']
+    print(f"{profiles:>6} profiles | {result['ok']:>6} ok | wall {result['wall']:8.2f} s"
+          f" | {profiles / result['wall']:8.1f} profiles/s"
+          f" | assume p50 {percentile(assume, 50) * 1000:7.1f} ms p95 {percentile(assume, 95) * 1000:7.1f} ms"
+          f" | writes {sum(writes) * 1000:9.1f} ms total, p95 {percentile(writes, 95) * 1000:6.2f} ms"
+          f" | commits {len(result['commits'])} taking {sum(result['commits']) * 1000:7.1f} ms")
+    if result['sts_stats']:
+        print(f"{'':>6}          | STS {result['sts_stats']}")
+    if result['pipeline_stats']:
+        print(f"{'':>6}          | {result['pipeline_stats']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch authentication against a local fake STS')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='profiles per batch')
+    parser.add_argument('--backend', choices=['query', 'boto3'], default='query')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake STS seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.01, help='fake STS random extra seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction answered AccessDenied')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction answered Throttling')
+    parser.add_argument('--max-rps', type=float, default=0.0, help='fake STS throttles above this rate')
+    parser.add_argument('--verbose', action='store_true', help='keep the per-profile INFO/DEBUG log lines')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    with FakeSTSServer(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.max_rps) as server:
+        print(f'Fake STS at {server.url} | backend {args.backend} | latency {args.latency * 1000:.0f} ms'
+              f' +0..{args.jitter * 1000:.0f} ms')
+        for profiles in args.sizes:
+            report(profiles, run_batch(profiles, server.url, args.backend))
+        print(f'Fake STS served {server.counts}')
+
+
+if __name__ == '__main__':
+    main()
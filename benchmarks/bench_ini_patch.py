@@ -0,0 +1,95 @@
+# coding=utf-8
+"""
+Cost of updating a few profiles in a large ~/.aws/credentials file: a configparser
+parse-modify-write of the whole file against IniPatch, which splices only the changed
+section spans into the file's text.
+
+Both paths read the file and write it back with Config.atomic_write_text, so the numbers
+include the I/O a real commit does.
+
+    python benchmarks/bench_ini_patch.py --sizes 1000 10000 50000 --changed 1 10 100
+"""
+
+import argparse
+import configparser
+import io
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_repo_dir = Path(__file__).resolve().parents[1]
+if str(_repo_dir) not in sys.path:
+    sys.path.insert(0, str(_repo_dir))
+
+import Config
+import IniPatch
+
+
+def credentials_text(sections: int) -> str:
+    """A credentials file with one comment and `sections` temporary-credential profiles."""
+    pieces = ['# This is your AWS credentials file\n']
+    token = secrets.token_urlsafe(600)
+    for index in range(sections):
+        pieces.append(f'[bench-{index:05d}]\naws_access_key_id = ASIA{index:016d}\n'
+                      f'aws_secret_access_key = {"s" * 40}\naws_session_token = {token}\n\n')
+    return ''.join(pieces)
+
+
+def fresh_options(index: int) -> dict:
+    return {'aws_access_key_id': f'ASIANEW{index:013d}', 'aws_secret_access_key': 'n' * 40,
+            'aws_session_token': secrets.token_urlsafe(600)}
+
+
+def full_rewrite(path: Path, changes: dict):
+    parser = configparser.ConfigParser()
+    parser.read(str(path))
+    for section, options in changes.items():
+        parser[section] = options
+    buffer = io.StringIO()
+    parser.write(buffer)
+    Config.atomic_write_text(path, buffer.getvalue(), skip_unchanged=False)
+
+
+def patch(path: Path, changes: dict):
+    patched, changed = IniPatch.apply(path.read_text(), changes)
+    if changed:
+        Config.atomic_write_text(path, patched, skip_unchanged=False)
+
+
+def measure(update, path: Path, sections: int, changed: int, repeats: int) -> float:
+    """Median seconds for one update of `changed` profiles spread through the file."""
+    step = max(1, sections // changed)
+    timings = []
+    for _ in range(repeats):
+        changes = {f'bench-{index:05d}': fresh_options(index) for index in range(0, sections, step)[:changed]}
+        start = time.perf_counter()
+        update(path, changes)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark full configparser rewrites against IniPatch')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='sections per file')
+    parser.add_argument('--changed', type=int, nargs='+', default=[1, 10, 100], help='profiles updated per write')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='aws-saml-bench-') as directory:
+        path = Path(directory) / 'credentials'
+        for sections in args.sizes:
+            path.write_text(credentials_text(sections))
+            size_mb = path.stat().st_size / 1e6
+            for changed in args.changed:
+                rewrite = measure(full_rewrite, path, sections, changed, args.repeats)
+                patched = measure(patch, path, sections, changed, args.repeats)
+                print(f'{sections:>6} sections ({size_mb:6.1f} MB) | {changed:>4} changed'
+                      f' | configparser rewrite {rewrite * 1000:9.1f} ms'
+                      f' | IniPatch {patched * 1000:8.1f} ms | {rewrite / patched:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
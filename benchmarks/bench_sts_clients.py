@@ -0,0 +1,95 @@
+# coding=utf-8
+"""
+Per-profile cost of AssumeRoleWithSAML client setup: a fresh boto3 Session and STS
+client for every profile (the old behaviour) versus the shared per-region registry
+in AWS.STS.get_sts_client.
+
+Network is stubbed out with botocore's Stubber so the numbers isolate client
+construction and request serialization, which is what the registry removes.
+
+    python benchmarks/bench_sts_clients.py --profiles 60
+"""
+
+import argparse
+import datetime
+import statistics
+import sys
+import time
+from pathlib import Path
+
+_repo_dir = Path(__file__).resolve().parents[1]
+if str(_repo_dir) not in sys.path:
+    sys.path.insert(0, str(_repo_dir))
+
+from boto3 import Session as BotoSession
+from botocore.stub import Stubber
+
+import AWS
+
+REGION = 'us-east-1'
+ROLE_ARN = 'arn:aws:iam::123456789012:role/Fed-Benchmark'
+PRINCIPAL_ARN = 'arn:aws:iam::123456789012:saml-provider/OKTA'
+SAML_ASSERTION = 'PHNhbWxwOlJlc3BvbnNlPg==' * 200
+
+
+def _stub_response():
+    return {
+        'Credentials': {
+            'AccessKeyId': 'ASIAEXAMPLEEXAMPLE01',
+            'SecretAccessKey': 'wJalrXUtnFEMIK7MDENGbPxRfiCYEXAMPLEKEY01',
+            'SessionToken': 'FwoGZXIvYXdzEXAMPLE' * 10,
+            'Expiration': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1),
+        },
+        'AssumedRoleUser': {
+            'AssumedRoleId': 'AROAEXAMPLEEXAMPLE:benchmark.user',
+            'Arn': 'arn:aws:sts::123456789012:assumed-role/Fed-Benchmark/benchmark.user',
+        },
+    }
+
+
+def _assume(sts):
+    stubber = Stubber(sts)
+    stubber.add_response('assume_role_with_saml', _stub_response())
+    with stubber:
+        sts.assume_role_with_saml(RoleArn=ROLE_ARN, PrincipalArn=PRINCIPAL_ARN,
+                                  SAMLAssertion=SAML_ASSERTION, DurationSeconds=3600)
+
+
+def per_profile_fresh_client(profiles):
+    timings = []
+    for _ in range(profiles):
+        start = time.perf_counter()
+        sts = BotoSession(region_name=REGION).client('sts')
+        _assume(sts)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def per_profile_shared_client(profiles):
+    AWS.STS.reset_sts_clients()
+    timings = []
+    for _ in range(profiles):
+        start = time.perf_counter()
+        sts = AWS.STS.get_sts_client(REGION, pool_size=profiles)
+        _assume(sts)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    total = sum(timings)
+    print(f'{label:<28} total {total * 1000:9.1f} ms | per profile mean {statistics.mean(timings) * 1000:7.2f} ms'
+          f' | median {statistics.median(timings) * 1000:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark STS client reuse for batch role assumption')
+    parser.add_argument('--profiles', type=int, default=60, help='number of profiles in the simulated group')
+    args = parser.parse_args()
+
+    report('fresh session per profile', per_profile_fresh_client(args.profiles))
+    report('shared regional client', per_profile_shared_client(args.profiles))
+
+
+if __name__ == '__main__':
+    main()
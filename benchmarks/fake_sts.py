@@ -0,0 +1,213 @@
+# coding=utf-8
+"""
+A local stand-in for the STS Query API that answers AssumeRoleWithSAML.
+
+Responses follow the real AssumeRoleWithSAMLResponse XML, with fresh credentials for
+each call and an Expiration of now + DurationSeconds. Latency, error rate, throttle
+rate and a request-per-second ceiling can all be set, so batch authentication can be
+measured without an IdP or an AWS account. Point the tool at it with
+AWS_SAML_STS_ENDPOINT (both the boto3 and query backends honour it).
+
+    python benchmarks/fake_sts.py --port 8765 --latency 0.05 --throttle-rate 0.02
+"""
+
+import argparse
+import base64
+import os
+import random
+import secrets
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STS_XMLNS = 'https://sts.amazonaws.com/doc/2011-06-15/'
+
+ASSUME_ROLE_RESPONSE = """<AssumeRoleWithSAMLResponse xmlns="{xmlns}">
+  <AssumeRoleWithSAMLResult>
+    <Issuer>https://login.example.com/app/exkbenchmark</Issuer>
+    <AssumedRoleUser>
+      <Arn>{assumed_role_arn}</Arn>
+      <AssumedRoleId>{role_id}:{subject}</AssumedRoleId>
+    </AssumedRoleUser>
+    <Credentials>
+      <AccessKeyId>{access_key_id}</AccessKeyId>
+      <SecretAccessKey>{secret_access_key}</SecretAccessKey>
+      <SessionToken>{session_token}</SessionToken>
+      <Expiration>{expiration}</Expiration>
+    </Credentials>
+    <Audience>https://signin.aws.amazon.com/saml</Audience>
+    <SubjectType>persistent</SubjectType>
+    <PackedPolicySize>6</PackedPolicySize>
+    <NameQualifier>SbdGOnUkh1i4+EXAMPLExL/jEvs=</NameQualifier>
+    <Subject>{subject}</Subject>
+  </AssumeRoleWithSAMLResult>
+  <ResponseMetadata><RequestId>{request_id}</RequestId></ResponseMetadata>
+</AssumeRoleWithSAMLResponse>"""
+
+ERROR_RESPONSE = """<ErrorResponse xmlns="{xmlns}">
+  <Error><Type>Sender</Type><Code>{code}</Code><Message>{message}</Message></Error>
+  <RequestId>{request_id}</RequestId>
+</ErrorResponse>"""
+
+
+def _random_key(prefix, length):
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'
+    return prefix + ''.join(secrets.choice(alphabet) for _ in range(length - len(prefix)))
+
+
+def assume_role_response(form):
+    """Build a successful AssumeRoleWithSAMLResponse body for a parsed request form."""
+    role_arn = form.get('RoleArn', 'arn:aws:iam::123456789012:role/Fed-Benchmark')
+    account_number = role_arn.split(':')[4] if role_arn.count(':') >= 5 else '123456789012'
+    role_name = role_arn.rsplit('/', 1)[-1]
+    subject = 'benchmark.user'
+    duration = int(form.get('DurationSeconds', 3600))
+    expiration = datetime.now(timezone.utc) + timedelta(seconds=duration)
+    return ASSUME_ROLE_RESPONSE.format(
+        xmlns=STS_XMLNS,
+        assumed_role_arn=f'arn:aws:sts::{account_number}:assumed-role/{role_name}/{subject}',
+        role_id=_random_key('AROA', 21),
+        subject=subject,
+        access_key_id=_random_key('ASIA', 20),
+        secret_access_key=base64.b64encode(os.urandom(30)).decode(),
+        session_token=base64.b64encode(os.urandom(300)).decode(),
+        expiration=expiration.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        request_id=uuid.uuid4(),
+    )
+
+
+def error_response(code, message):
+    return ERROR_RESPONSE.format(xmlns=STS_XMLNS, code=code, message=message, request_id=uuid.uuid4())
+
+
+class FakeSTSServer:
+    """
+    Threaded HTTP stand-in for STS.
+
+    Args:
+        latency (float): Seconds each request takes before it is answered
+        jitter (float): Uniform random extra latency, 0..jitter seconds
+        error_rate (float): Fraction of requests answered with 403 AccessDenied
+        throttle_rate (float): Fraction of requests answered with 400 Throttling
+        max_rps (float): Requests per second above which every request is throttled; 0 disables it
+        host (str): Listen address
+        port (int): Listen port; 0 picks a free one
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, max_rps=0.0,
+                 host='127.0.0.1', port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.counts = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def _over_rate(self):
+        if not self.max_rps:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start, self._window_requests = now, 0
+        self._window_requests += 1
+        return self._window_requests > self.max_rps
+
+    def _decide(self, form):
+        """Return (status, body) for a request, updating the counters."""
+        with self._lock:
+            self.counts['requests'] += 1
+            throttled = self._over_rate() or random.random() < self.throttle_rate
+            failed = not throttled and random.random() < self.error_rate
+            if throttled:
+                self.counts['throttled'] += 1
+            elif failed:
+                self.counts['errors'] += 1
+            else:
+                self.counts['ok'] += 1
+
+        if form.get('Action') != 'AssumeRoleWithSAML':
+            return 400, error_response('InvalidAction', f"Could not find operation {form.get('Action')}")
+        if throttled:
+            return 400, error_response('Throttling', 'Rate exceeded')
+        if failed:
+            return 403, error_response('AccessDenied', 'Not authorized to perform sts:AssumeRoleWithSAML')
+        return 200, assume_role_response(form)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+                delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                status, body = server._decide(form)
+                payload = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/xml')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in STS endpoint for AssumeRoleWithSAML')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction answered AccessDenied')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction answered Throttling')
+    parser.add_argument('--max-rps', type=float, default=0.0, help='throttle everything above this rate')
+    args = parser.parse_args()
+
+    server = FakeSTSServer(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.max_rps,
+                           host=args.host, port=args.port)
+    print(f'Fake STS listening on {server.url} (export AWS_SAML_STS_ENDPOINT={server.url})')
+    try:
+        server.start()._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+        print(f"\n{server.counts}")
+
+
+if __name__ == '__main__':
+    main()
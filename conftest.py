@@ -0,0 +1,21 @@
+# coding=utf-8
+"""
+Point the whole test session at a throwaway home directory so nothing under test
+reads or rewrites the real ~/.aws.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+_test_home = Path(tempfile.mkdtemp(prefix="aws-idp-saml-tests-"))
+_aws_dir = _test_home / ".aws"
+_aws_dir.mkdir(mode=0o700)
+(_aws_dir / "samlsts").write_text(
+    "[Fed-OKTA]\nloginpage = https://login.example.com/app/amazon_aws/sso/saml\nloginTitle = Example - Sign In\n\n"
+)
+(_aws_dir / "credentials").write_text("#This is your AWS credentials file\n")
+(_aws_dir / "config").write_text("")
+
+os.environ["HOME"] = str(_test_home)
+os.environ["USERPROFILE"] = str(_test_home)
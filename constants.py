@@ -4,6 +4,22 @@ import os
 
 __version__ = '2.2.2'
 __timeout__ = int(os.getenv('AWS_SAML_TIMEOUT', 45))  # Configurable timeout in seconds
+__sts_pool_size__ = int(os.getenv('AWS_SAML_STS_POOL_SIZE', 10))  # Keep-alive connections per regional STS client
+__sts_max_workers__ = int(os.getenv('AWS_SAML_STS_WORKERS', 16))  # Concurrent AssumeRoleWithSAML calls per login group
+__sts_backend__ = os.getenv('AWS_SAML_STS_BACKEND', 'boto3')  # 'boto3' or 'query' (boto3-free HTTPS transport)
+__sts_endpoint_url__ = os.getenv('AWS_SAML_STS_ENDPOINT') or None  # Override the STS endpoint, e.g. a local stand-in
+__sts_max_attempts__ = int(os.getenv('AWS_SAML_STS_MAX_ATTEMPTS', 8))  # Attempts per AssumeRoleWithSAML call
+__sts_retry_base_delay__ = float(os.getenv('AWS_SAML_STS_RETRY_BASE', 0.25))  # Seconds; doubled per retry, jittered
+__sts_retry_max_delay__ = float(os.getenv('AWS_SAML_STS_RETRY_MAX', 10))  # Cap on a single retry delay in seconds
+__sts_rate_limit__ = float(os.getenv('AWS_SAML_STS_RATE', 20))  # AssumeRoleWithSAML calls per second a batch drops to once STS throttles
+__login_max_workers__ = int(os.getenv('AWS_SAML_LOGIN_WORKERS', 4))  # Concurrent headless browser logins in a batch
+__mfa_lock_scope__ = os.getenv('AWS_SAML_MFA_LOCK', 'user')  # Serialise MFA prompts per 'user', across 'all' logins, or 'none'
+__pin_weight__ = float(os.getenv('AWS_SAML_PIN_WEIGHT', 0.5))  # Batches treat a pinned profile's remaining time as this fraction
+__screen_probe_interval__ = float(os.getenv('AWS_SAML_SCREEN_PROBE_INTERVAL', 0.25))  # Seconds between in-page checks for the next Okta screen
+__assertion_reuse_margin__ = int(os.getenv('AWS_SAML_ASSERTION_MARGIN', 30))  # Seconds; don't reuse a cached assertion closer to expiry
+__file_lock_timeout__ = float(os.getenv('AWS_SAML_LOCK_TIMEOUT', 30))  # Seconds to wait for another writer to finish with ~/.aws
+__verify_identity_timeout__ = float(os.getenv('AWS_SAML_VERIFY_TIMEOUT', 10))  # Seconds getCredentials waits at exit for --verify-identity to finish
+__compaction_grace__ = int(os.getenv('AWS_SAML_GC_GRACE', 0))  # Seconds to keep expired credentials before compaction removes them
 __snap_install_dir__ = '/snap/firefox/current/usr/lib/firefox'
 __mozilla_driver_url__ = 'https://api.github.com/repos/mozilla/geckodriver/releases'
 
@@ -3,6 +3,7 @@
 import sys
 import signal
 import AWS
+import constants
 import Config
 import Login
 import Password
@@ -23,11 +24,6 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-# Register the signal handler
-signal.signal(signal.SIGINT, signal_handler)
-
-args = Utilities.Arguments()
-config = Config.Config()
 
 
 def _validate_screenshot_dir(screenshot_dir):
@@ -74,9 +70,16 @@ def _validate_screenshot_dir(screenshot_dir):
 
 
 def main():
+    # Register the signal handler
+    signal.signal(signal.SIGINT, signal_handler)
+
+    args = Utilities.Arguments()
+    config = Utilities.get_config()
+    config.bootstrap()
+
     use_okta_fastpass, use_debug, use_gui, arg_browser_type, aws_profile_name, arg_store_password, \
         arg_session_duration, arg_aws_region, text_menu, use_idp, arg_username, arg_encrypted, \
-        enable_screenshots, screenshot_dir, show_credentials = args.parse_args()
+        enable_screenshots, screenshot_dir, show_credentials, verify_identity = args.parse_args()
 
     # Validate screenshot_dir to prevent path traversal attacks
     if screenshot_dir:
@@ -102,33 +105,43 @@ def main():
                          ' or in the global section in the config file')
         raise SystemExit(1)
 
-    pass_key, pass_file = config.return_stored_pass_config()
+    # A still-valid assertion captured earlier for this identity skips the browser and MFA entirely.
+    # --gui needs the live browser session, so it always logs in.
+    assertion_cache = config.get_assertion_cache() if use_gui is not True else None
+    saml_response = assertion_cache.get(saml_provider_name, username) if assertion_cache is not None else None
+    used_cached_assertion = saml_response is not None
 
-    log_stream.info(f'User requested stored password: {arg_store_password} | Config allows stored password: {config_store_password}')
+    if not used_cached_assertion:
+        pass_key, pass_file = config.return_stored_pass_config()
 
-    if arg_store_password is True:
-        password: str = Password.retrieve_password(pass_key, pass_file)
-    else:
-        password = Password.get_password()
-        confirm_store: str = input('Would you like to store this password for future use? [Y/N]')
-
-        if confirm_store == 'Y' or confirm_store == 'y':
-            Password.store_password(password, pass_key, pass_file)
-
-    saml_response = Login.browser_login(username,
-                                        password,
-                                        first_page,
-                                        use_debug,
-                                        use_gui,
-                                        browser_type,
-                                        saml_provider_name,
-                                        idp_login_title,
-                                        role_arn, gui_name, dsso_url,use_okta_fastpass)
-
-    log_stream.info('SAML Response Size: ' + str(len(saml_response)))
-    if len(saml_response) < 50:
-        log_stream.fatal("Issue with logging into Identity Provider: " + saml_response)
-        raise SystemExit(1)
+        log_stream.info(f'User requested stored password: {arg_store_password} | Config allows stored password: {config_store_password}')
+
+        if arg_store_password is True:
+            password: str = Password.retrieve_password(pass_key, pass_file)
+        else:
+            password = Password.get_password()
+            confirm_store: str = input('Would you like to store this password for future use? [Y/N]')
+
+            if confirm_store == 'Y' or confirm_store == 'y':
+                Password.store_password(password, pass_key, pass_file)
+
+        saml_response = Login.browser_login(username,
+                                            password,
+                                            first_page,
+                                            use_debug,
+                                            use_gui,
+                                            browser_type,
+                                            saml_provider_name,
+                                            idp_login_title,
+                                            role_arn, gui_name, dsso_url,use_okta_fastpass)
+
+        log_stream.info('SAML Response Size: ' + str(len(saml_response)))
+        if len(saml_response) < 50:
+            log_stream.fatal("Issue with logging into Identity Provider: " + saml_response)
+            raise SystemExit(1)
+
+        if assertion_cache is not None:
+            assertion_cache.put(saml_provider_name, username, saml_response)
 
     if text_menu is True:
 
@@ -151,7 +164,16 @@ def main():
         used_profile_name_param = True
         account_name = gui_name
 
-    get_sts = AWS.STS.aws_assume_role(aws_region, role_arn, principle_arn, saml_response, aws_session_duration)
+    sts_region = config.get_sts_endpoint_region() or aws_region
+    try:
+        get_sts = AWS.STS.aws_assume_role(sts_region, role_arn, principle_arn, saml_response, aws_session_duration,
+                                          backend=config.get_sts_backend(),
+                                          deadline=SAMLSelector.get_assertion_expiry(saml_response))
+    except SystemExit:
+        if used_cached_assertion:
+            assertion_cache.remove(saml_provider_name, username)
+            log_stream.warning('STS rejected the cached SAML assertion; it has been discarded, run again to log in')
+        raise
 
     if len(get_sts) > 0:
         aws_access_id, aws_secret_key, aws_session_token, sts_expiration \
@@ -160,12 +182,16 @@ def main():
         if Config.validate_aws_cred_format(aws_access_id, aws_secret_key, aws_session_token):
             profile_block, clean_profile_name = config.write_aws_config(aws_access_id, aws_secret_key,
                                                                         aws_session_token, profile_name, aws_region,
-                                                                        account_number, used_profile_name_param)
+                                                                        account_number, used_profile_name_param,
+                                                                        sts_expiration)
         else:
             log_stream.fatal('There seems to be an issue with one of the credentials generated, please try again')
             raise SystemExit(1)
 
-        aws_user_id = AWS.STS.get_aws_caller_id(clean_profile_name)
+        aws_user_id = AWS.STS.get_caller_id_from_sts(get_sts)
+        verification = None
+        if verify_identity:
+            verification = AWS.STS.verify_caller_id_async(aws_access_id, aws_secret_key, aws_session_token, aws_region, aws_user_id)
 
         sts_expires_local_time: str = sts_expiration.strftime("%c")
         log_stream.info(f'Token issued for {aws_user_id} in account {account_name}')
@@ -210,6 +236,12 @@ def main():
         print(profile_info)
         log_stream.info(f'Profile {clean_profile_name} configured successfully')
 
+        if verification is not None:
+            verification.join(timeout=constants.__verify_identity_timeout__)
+            if verification.is_alive():
+                log_stream.warning(f'Caller identity verification did not complete within '
+                                   f'{constants.__verify_identity_timeout__:g} seconds')
+
     else:
         log_stream.fatal("Corrupt or Unavailable STS Response")
         raise SystemExit(1)
@@ -11,7 +11,6 @@ Authentication uses the existing aws-idp-saml getCredentials flow.
 """
 
 import argparse
-import configparser
 import os
 import sqlite3
 import subprocess
@@ -60,21 +59,33 @@ def get_aws_dir() -> Path:
     return Path.home() / ".aws"
 
 
+def config_snapshot():
+    """The ConfigSnapshot module, which serves parsed ~/.aws files without re-parsing them."""
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import ConfigSnapshot
+    return ConfigSnapshot
+
+
+def batch_journal():
+    """The BatchJournal module, which checkpoints batch authentication in aws_saml.db."""
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import BatchJournal
+    return BatchJournal
+
+
 def load_samlsts_profiles(aws_dir: Path) -> list[str]:
     """Load profile names from ~/.aws/samlsts (excluding Fed-* and global sections)."""
     config_path = aws_dir / "samlsts"
     if not config_path.exists():
         return []
 
-    config = configparser.ConfigParser()
-    config.read(str(config_path))
-
-    profiles = []
-    for section in config.sections():
-        if not section.startswith("Fed-") and section.lower() != "global":
-            profiles.append(section)
-
-    return sorted(profiles, key=str.lower)
+    return sorted(config_snapshot().profile_records(config_path), key=str.lower)
 
 
 def load_credentials_profiles(aws_dir: Path) -> set[str]:
@@ -83,9 +94,7 @@ def load_credentials_profiles(aws_dir: Path) -> set[str]:
     if not creds_path.exists():
         return set()
 
-    config = configparser.ConfigParser()
-    config.read(str(creds_path))
-    return set(config.sections())
+    return set(config_snapshot().load_snapshot(creds_path)["sections"])
 
 
 def load_token_expirations(aws_dir: Path) -> dict[str, datetime]:
@@ -326,8 +335,7 @@ def cmd_creds(args):
         print(f"{c.RED}No credentials file found at {creds_path}{c.RESET}")
         sys.exit(1)
 
-    config = configparser.ConfigParser()
-    config.read(str(creds_path))
+    config = config_snapshot().read_config(creds_path)
 
     available_cred_profiles = set(config.sections())
 
@@ -430,56 +438,6 @@ def cmd_creds(args):
     print()
 
 
-# --- Auth command ---
-
-def save_token_expiration(aws_dir: Path, profile: str, duration_seconds: int):
-    """Write token expiration to the SQLite DB after successful auth."""
-    db_path = aws_dir / "aws_saml.db"
-    expiration = datetime.now(timezone.utc) + timedelta(seconds=duration_seconds)
-    now_str = datetime.now().isoformat()
-
-    try:
-        conn = sqlite3.connect(str(db_path))
-        conn.execute(
-            "CREATE TABLE IF NOT EXISTS token_state "
-            "(profile_name TEXT PRIMARY KEY, expiration TEXT NOT NULL, created_at TEXT NOT NULL)"
-        )
-        conn.execute(
-            "INSERT OR REPLACE INTO token_state (profile_name, expiration, created_at) VALUES (?, ?, ?)",
-            (profile, expiration.isoformat(), now_str),
-        )
-        conn.commit()
-        conn.close()
-    except sqlite3.Error:
-        pass
-
-
-def get_session_duration(aws_dir: Path, profile: str) -> int:
-    """Read session duration from samlsts config (profile or global), default 14400."""
-    config_path = aws_dir / "samlsts"
-    if not config_path.exists():
-        return 14400
-
-    config = configparser.ConfigParser()
-    config.read(str(config_path))
-
-    # Check profile section
-    if config.has_section(profile) and config.has_option(profile, "sessionduration"):
-        try:
-            return int(config.get(profile, "sessionduration"))
-        except ValueError:
-            pass
-
-    # Check global section
-    if config.has_section("global") and config.has_option("global", "sessionduration"):
-        try:
-            return int(config.get("global", "sessionduration"))
-        except ValueError:
-            pass
-
-    return 14400
-
-
 # --- Pin management ---
 
 def _ensure_pin_table(aws_dir: Path):
@@ -583,6 +541,162 @@ def cmd_pin(args):
             print(f"  {c.DIM}Unpinned: {p}{c.RESET}")
 
 
+def cmd_aliases(args):
+    """List cached account aliases, or warm the cache from profiles with valid credentials."""
+    if args.no_color or not supports_color():
+        c = NoColor
+    else:
+        c = Color
+
+    aws_dir = get_aws_dir()
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import AliasCache
+
+    samlsts = config_snapshot().read_config(aws_dir / "samlsts")
+    cache = AliasCache.from_saml_config(aws_dir, samlsts)
+
+    if args.warm:
+        import AWS
+
+        # Only profiles whose credentials are still valid can answer ListAccountAliases;
+        # expired ones would be cached as "no alias"
+        token_expirations = load_token_expirations(aws_dir)
+        credential_profiles = load_credentials_profiles(aws_dir)
+        now = datetime.now(timezone.utc)
+        profile_accounts = {
+            p: samlsts.get(p, "accountnumber", fallback=None)
+            for p in load_samlsts_profiles(aws_dir)
+            if p in credential_profiles and token_expirations.get(p) and token_expirations[p] > now
+        }
+        fetched = AliasCache.warm_alias_cache(cache, profile_accounts, AWS.IAM.get_account_alias, force=args.force)
+        found = sum(1 for alias in fetched.values() if alias)
+        print(f"{c.DIM}Looked up {len(fetched)} account(s): {found} alias(es), {len(fetched) - found} without{c.RESET}")
+
+    aliases = cache.fresh_aliases()
+    if not aliases:
+        print(f"{c.DIM}No cached account aliases.{c.RESET}")
+        return
+    width = max(len(number) for number in aliases)
+    print(f"{c.BOLD}{'Account':<{width}}  Alias{c.RESET}")
+    for number, alias in sorted(aliases.items(), key=lambda item: item[1].lower()):
+        print(f"{number:<{width}}  {alias}")
+
+
+def cmd_accounts(args):
+    """List the account directory, or import/export it as account-map.json."""
+    if args.no_color or not supports_color():
+        c = NoColor
+    else:
+        c = Color
+
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import Config
+
+    config = Config.Config()
+    directory = config.get_account_directory()
+
+    if args.import_path:
+        try:
+            changed = directory.import_file(args.import_path, force=True)
+        except (OSError, ValueError) as e:
+            print(f"{c.RED}Unable to import {args.import_path}: {e}{c.RESET}")
+            sys.exit(1)
+        print(f"{c.DIM}Imported {args.import_path}: {changed} account(s) added or renamed{c.RESET}")
+    exporting = args.export_path is not False
+    if exporting and args.export_path == "-":
+        sys.stdout.write(directory.export_text())
+    elif exporting:
+        written = config.export_account_map(args.export_path)
+        print(f"{c.DIM}Exported {written} account(s) to {args.export_path or config.AccountMap}{c.RESET}")
+    if args.import_path or exporting:
+        return
+
+    accounts = directory.all()
+    if not accounts:
+        print(f"{c.DIM}No accounts in the directory.{c.RESET}")
+        return
+    width = max(len(number) for number in accounts)
+    print(f"{c.BOLD}{'Account':<{width}}  Name{c.RESET}")
+    for number, name in sorted(accounts.items(), key=lambda item: item[1].lower()):
+        print(f"{number:<{width}}  {name}")
+
+
+def cmd_gc(args):
+    """Remove empty, expired, duplicate and orphaned sections from ~/.aws/credentials and config."""
+    if args.no_color or not supports_color():
+        c = NoColor
+    else:
+        c = Color
+
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import Config
+    import CredentialsGC
+
+    try:
+        report = Config.Config().compact_credentials(grace_seconds=args.grace, dry_run=args.dry_run)
+    except OSError as e:
+        print(f"{c.RED}Compaction failed: {e}{c.RESET}")
+        sys.exit(1)
+
+    for file_name in ("credentials", "config"):
+        for section, reason in sorted(report[file_name].items()):
+            print(f"  {c.DIM}{file_name}:{c.RESET} [{section}] {c.DIM}— {reason}{c.RESET}")
+    prefix = "Dry run: " if args.dry_run else ""
+    print(f"{c.BOLD}{prefix}{CredentialsGC.summary(report)}{c.RESET}")
+
+
+def cmd_check(args):
+    """Validate every profile in ~/.aws/samlsts and list all problems at once."""
+    if args.no_color or not supports_color():
+        c = NoColor
+    else:
+        c = Color
+
+    config_path = get_aws_dir() / "samlsts"
+    if not config_path.exists():
+        print(f"{c.RED}{config_path} does not exist; run samlstat init{c.RESET}")
+        sys.exit(1)
+
+    index = config_snapshot().profile_index(config_path)
+    problems = index.problems()
+    for profile in sorted(problems, key=str.lower):
+        print(f"{c.RED}✗ {profile}{c.RESET}")
+        for problem in problems[profile]:
+            print(f"    {problem}")
+    if problems:
+        print(f"\n{c.BOLD}{len(problems)} of {len(index)} profile(s) have problems{c.RESET}")
+        sys.exit(1)
+    print(f"{c.GREEN}All {len(index)} profile(s) are complete{c.RESET}")
+
+
+def cmd_init(args):
+    """First-run setup: create ~/.aws and the samlsts, credentials and config files if missing."""
+    if args.no_color or not supports_color():
+        c = NoColor
+    else:
+        c = Color
+
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import Config
+
+    if Config.Config().bootstrap(interactive=not args.non_interactive):
+        print(f"{c.GREEN}Configuration created in {get_aws_dir()}{c.RESET}")
+    else:
+        print(f"{c.DIM}Configuration already present in {get_aws_dir()}{c.RESET}")
+
+
 def cmd_auth(args):
     """Authenticate a profile using the existing getCredentials.py flow."""
     if args.no_color or not supports_color():
@@ -637,8 +751,15 @@ def cmd_auth(args):
     elif args.profile:
         # Single profile (positional)
         profiles_to_auth = [args.profile]
+    elif getattr(args, "resume", False):
+        # The profiles of the last batch that did not finish
+        profiles_to_auth = batch_journal().unfinished_profiles(aws_dir / "aws_saml.db")
+        if not profiles_to_auth:
+            print(f"{c.GREEN}No interrupted batch to resume.{c.RESET}")
+            sys.exit(0)
+        print(f"{c.DIM}Resuming a batch of {len(profiles_to_auth)} profile(s){c.RESET}")
     else:
-        print(f"{c.RED}Provide a profile name, -p <profiles>, -f <filter>, or -x{c.RESET}")
+        print(f"{c.RED}Provide a profile name, -p <profiles>, -f <filter>, -x or --resume{c.RESET}")
         sys.exit(1)
 
     # Validate all profiles exist
@@ -650,13 +771,67 @@ def cmd_auth(args):
             print(f"  {p}")
         sys.exit(1)
 
-    # Use batch auth (shared SAML login) when multiple profiles are requested
-    if len(profiles_to_auth) > 1:
+    if getattr(args, "plan", False):
+        _print_plan(profiles_to_auth, args, c)
+        return
+
+    # Use batch auth (shared SAML login) when multiple profiles are requested; only a batch can be resumed
+    if len(profiles_to_auth) > 1 or getattr(args, "resume", False):
         _batch_auth(profiles_to_auth, args, aws_dir, c)
     else:
         _single_auth(profiles_to_auth[0], args, aws_dir, c)
 
 
+def _print_plan(profiles: list[str], args, c):
+    """Show what an auth run would do — groups, browsers, shared roles, skips and an estimate — without logging in."""
+    script_dir = Path(__file__).resolve().parent
+    if str(script_dir) not in sys.path:
+        sys.path.insert(0, str(script_dir))
+
+    import BatchPlan
+    import Config
+
+    plan = BatchPlan.build(profiles, Config.Config(), browser=args.browser, deadline_seconds=args.deadline,
+                           probe_sts=False)
+    shared = plan.shared
+
+    print(f"{c.BOLD}Plan: {len(plan.profile_info)} profile(s) in {len(plan.groups)} login group(s){c.RESET}")
+    for group in plan.groups:
+        if group["cached_assertion"]:
+            login = "cached assertion, no browser"
+        else:
+            login = f"{group['browser']} login ~{group['login_seconds']:.0f}s"
+        print(f"\n  {c.BOLD}{c.CYAN}{group['username']} via {group['provider_name']}{c.RESET} "
+              f"{c.DIM}— {login}, {len(group['assume'])} STS call(s) ~{group['sts_seconds']:.1f}s{c.RESET}")
+        for profile in group["profiles"]:
+            note = f" {c.DIM}(shares {shared[profile]}'s role){c.RESET}" if profile in shared else ""
+            print(f"    {profile}{note}")
+
+    if plan.skipped:
+        print()
+        for profile, reason in plan.skipped.items():
+            print(f"  {c.YELLOW}⊘ {profile}{c.RESET} — {reason}")
+
+    if plan.warnings:
+        print()
+        for warning in plan.warnings:
+            print(f"  {c.YELLOW}⚠ {warning}{c.RESET}")
+
+    if plan.profile_info:
+        if plan.settings["sts_region"]:
+            endpoint = f"{plan.settings['sts_region']} {c.DIM}(fastest in the stored probe ranking){c.RESET}"
+        else:
+            regions = sorted({info["aws_region"] for info in plan.profile_info.values()})
+            endpoint = f"{', '.join(regions)} {c.DIM}(configured profile region){c.RESET}"
+        print(f"\n{c.BOLD}STS endpoint:{c.RESET} {endpoint}")
+
+    estimate = plan.estimate
+    source = "from earlier batches" if estimate["from_history"] else "default timings, no batch history yet"
+    print(f"\n{c.BOLD}Estimate:{c.RESET} {estimate['logins']} browser login(s), "
+          f"{estimate['cached_groups']} cached, {estimate['sts_calls']} STS call(s), "
+          f"~{estimate['seconds']:.0f}s {c.DIM}({source}){c.RESET}")
+
+
 def _batch_auth(profiles: list[str], args, aws_dir: Path, c):
     """Authenticate multiple profiles with shared SAML login (one MFA prompt per identity group)."""
     quiet = getattr(args, "quiet", False)
@@ -670,10 +845,13 @@ def _batch_auth(profiles: list[str], args, aws_dir: Path, c):
     if not quiet:
         print(f"{c.BOLD}{c.CYAN}Batch authenticating {len(profiles)} profile(s) (shared login per identity group){c.RESET}\n")
 
+    batch_stats = []
+
+    # Written profiles' expirations are recorded by Config.commit from the STS responses
     def status_cb(event, profile, message):
-        if event == "OK":
-            duration = get_session_duration(aws_dir, profile)
-            save_token_expiration(aws_dir, profile, duration)
+        if event == "STATS":
+            batch_stats.append(message)
+            return
         if quiet:
             return
         if event == "INFO":
@@ -686,6 +864,12 @@ def _batch_auth(profiles: list[str], args, aws_dir: Path, c):
             print(f"  {c.RED}✗ {profile}{c.RESET} — {message}")
         elif event == "SKIP":
             print(f"  {c.YELLOW}⊘ {profile}{c.RESET} — {message}")
+        elif event == "WARN":
+            print(f"{c.YELLOW}⚠ {message}{c.RESET}")
+        elif event == "DONE":
+            print(f"  {c.DIM}✓ {profile} — {message}{c.RESET}")
+        elif event == "GC":
+            print(f"{c.DIM}{message}{c.RESET}")
 
     try:
         results = perform_batch_auth(
@@ -694,6 +878,9 @@ def _batch_auth(profiles: list[str], args, aws_dir: Path, c):
             use_debug=args.debug,
             show_encrypted=args.encrypted,
             status_callback=status_cb,
+            browser=args.browser,
+            resume=getattr(args, "resume", False),
+            deadline_seconds=args.deadline,
         )
 
         # Summary
@@ -705,6 +892,8 @@ def _batch_auth(profiles: list[str], args, aws_dir: Path, c):
                 print(f", {c.RED}{failed} failed{c.RESET}")
             else:
                 print()
+            for stats_line in batch_stats:
+                print(f"{c.DIM}{stats_line}{c.RESET}")
             print()
 
         if failed:
@@ -745,11 +934,8 @@ def _single_auth(profile: str, args, aws_dir: Path, c):
         stdout_target = subprocess.DEVNULL if quiet else None
         result = subprocess.run(cmd, cwd=str(script_dir), stdout=stdout_target, stderr=stdout_target)
         if result.returncode == 0:
-            duration = get_session_duration(aws_dir, profile)
-            save_token_expiration(aws_dir, profile, duration)
             if not quiet:
-                if not quiet:
-                    print(f"\n{c.GREEN}✓ Authentication successful for: {profile}{c.RESET}\n")
+                print(f"\n{c.GREEN}✓ Authentication successful for: {profile}{c.RESET}\n")
         else:
             if not quiet:
                 print(f"\n{c.RED}✗ Authentication failed for: {profile} (exit code: {result.returncode}){c.RESET}\n")
@@ -863,7 +1049,9 @@ def main():
   samlstat auth -p natldev-tier1 natlprod-tier1   multiple profiles
   samlstat auth -f tier1                          all profiles matching filter
   samlstat auth -x                                re-auth expired/expiring pinned profiles
-  samlstat auth -f prod --encrypted               with encrypted output""",
+  samlstat auth -f prod --encrypted               with encrypted output
+  samlstat auth -f prod --plan                    show what a run would do, without logging in
+  samlstat auth --resume                          continue the last interrupted batch""",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
     auth_parser.add_argument(
@@ -915,6 +1103,22 @@ def main():
         action="store_true",
         help="Display encrypted credentials after auth",
     )
+    auth_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted batch (or the one for the given profiles), skipping finished work",
+    )
+    auth_parser.add_argument(
+        "--deadline",
+        type=int,
+        metavar="SECONDS",
+        help="Warn when a batch is estimated to take longer than this",
+    )
+    auth_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Show the login groups, STS calls and estimated time without authenticating",
+    )
     auth_parser.add_argument(
         "--quiet", "-q",
         action="store_true",
@@ -977,6 +1181,104 @@ def main():
         help="List all pinned profiles",
     )
 
+    # --- aliases ---
+    aliases_parser = subparsers.add_parser(
+        "aliases",
+        help="List or warm the cached IAM account aliases",
+        description="Show cached account aliases from ~/.aws/aws_saml.db, optionally refreshing them first.",
+        epilog="""examples:
+  samlstat aliases                            list cached aliases
+  samlstat aliases --warm                     look up aliases for accounts not cached yet
+  samlstat aliases --warm --force             refresh every account with valid credentials""",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    aliases_parser.add_argument(
+        "--warm", "-w",
+        action="store_true",
+        help="Look up aliases using every profile with valid credentials",
+    )
+    aliases_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --warm, refresh aliases that are still cached",
+    )
+
+    # --- accounts ---
+    accounts_parser = subparsers.add_parser(
+        "accounts",
+        help="List, import or export the account directory",
+        description="Show the account number -> name directory in ~/.aws/aws_saml.db used by the text menu.",
+        epilog="""examples:
+  samlstat accounts                           list every account name
+  samlstat accounts --import team-map.json    merge an account-map.json file in
+  samlstat accounts --export                  write ~/.aws/account-map.json
+  samlstat accounts --export backup.json      write the directory to another file
+  samlstat accounts --export -                write the directory to stdout""",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    accounts_parser.add_argument(
+        "--import",
+        dest="import_path",
+        metavar="FILE",
+        help="Merge an account-map.json file into the directory",
+    )
+    accounts_parser.add_argument(
+        "--export",
+        dest="export_path",
+        metavar="FILE",
+        nargs="?",
+        const=None,
+        default=False,
+        help="Write the directory as account-map.json (default ~/.aws/account-map.json, - for stdout)",
+    )
+
+    # --- gc ---
+    gc_parser = subparsers.add_parser(
+        "gc",
+        help="Compact ~/.aws/credentials and config",
+        description="Remove empty, expired, duplicate and orphaned profile sections from ~/.aws/credentials "
+                    "and ~/.aws/config, using the token expirations in ~/.aws/aws_saml.db.",
+        epilog="""examples:
+  samlstat gc                                 compact both files now
+  samlstat gc --dry-run                       show what would be removed
+  samlstat gc --grace 3600                    keep credentials for an hour after they expire
+
+Set compactCredentials = true in the samlsts global section to compact after every batch.""",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    gc_parser.add_argument(
+        "--dry-run", "-n",
+        action="store_true",
+        help="Report what would be removed without changing anything",
+    )
+    gc_parser.add_argument(
+        "--grace",
+        type=int,
+        default=None,
+        metavar="SECONDS",
+        help="Keep expired credentials this long after expiry (default AWS_SAML_GC_GRACE or 0)",
+    )
+
+    # --- check ---
+    subparsers.add_parser(
+        "check",
+        help="Validate every profile in ~/.aws/samlsts",
+        description="Resolve every samlsts profile against the global and provider sections and list every "
+                    "problem found, for all profiles at once. Exits 1 if any profile has a problem.",
+    )
+
+    # --- init ---
+    init_parser = subparsers.add_parser(
+        "init",
+        help="Create ~/.aws/samlsts, credentials and config on first run",
+        description="Create the files this tool needs in ~/.aws, asking for your IdP details if samlsts is missing.",
+    )
+    init_parser.add_argument(
+        "--non-interactive",
+        action="store_true",
+        help="Do not prompt; explain what samlsts must contain and exit if it is missing",
+    )
+
     args = parser.parse_args()
 
     # Determine pin action
@@ -994,6 +1296,16 @@ def main():
         cmd_creds(args)
     elif args.command == "pin":
         cmd_pin(args)
+    elif args.command == "aliases":
+        cmd_aliases(args)
+    elif args.command == "accounts":
+        cmd_accounts(args)
+    elif args.command == "gc":
+        cmd_gc(args)
+    elif args.command == "check":
+        cmd_check(args)
+    elif args.command == "init":
+        cmd_init(args)
     elif getattr(args, "creds", False):
         # Top-level -c flag
         cmd_creds(args)
@@ -13,11 +13,15 @@ _samlstat() {
     local cur prev words cword
     _init_completion || return
 
-    local subcommands="status auth creds pin"
+    local subcommands="status auth creds pin aliases accounts gc check init"
     local status_flags="-f -v -u -x -p -c --filter --valid --unknown --expired --profile --creds --json --no-color"
-    local auth_flags="-f -p -x --filter --profiles --expired --fastpass --stored-password --no-stored-password --debug --browser --encrypted --quiet"
+    local auth_flags="-f -p -x --filter --profiles --expired --fastpass --stored-password --no-stored-password --debug --browser --encrypted --plan --resume --deadline --quiet"
     local creds_flags="-f -p --filter --profiles"
     local pin_flags="-d -l --delete --list"
+    local aliases_flags="-w --warm --force"
+    local accounts_flags="--import --export"
+    local gc_flags="-n --dry-run --grace"
+    local init_flags="--non-interactive"
 
     # Determine if a subcommand has been given
     local subcmd=""
@@ -27,6 +31,11 @@ _samlstat() {
             auth|a) subcmd="auth"; break ;;
             creds|c) subcmd="creds"; break ;;
             pin) subcmd="pin"; break ;;
+            aliases) subcmd="aliases"; break ;;
+            accounts) subcmd="accounts"; break ;;
+            gc) subcmd="gc"; break ;;
+            check) subcmd="check"; break ;;
+            init) subcmd="init"; break ;;
         esac
     done
 
@@ -69,6 +78,43 @@ _samlstat() {
                 COMPREPLY=($(compgen -W "$(_samlstat_profiles)" -- "$cur"))
             fi
             ;;
+        aliases)
+            if [[ "$cur" == -* ]]; then
+                COMPREPLY=($(compgen -W "$aliases_flags" -- "$cur"))
+            fi
+            ;;
+        accounts)
+            case "$prev" in
+                --import)
+                    _filedir json
+                    return ;;
+                --export)
+                    # Without a file the export goes to ~/.aws/account-map.json; - writes to stdout
+                    if [[ "$cur" != -* ]]; then
+                        _filedir json
+                    fi
+                    COMPREPLY+=($(compgen -W "-" -- "$cur"))
+                    return ;;
+            esac
+            if [[ "$cur" == -* ]]; then
+                COMPREPLY=($(compgen -W "$accounts_flags" -- "$cur"))
+            fi
+            ;;
+        gc)
+            case "$prev" in
+                --grace) return ;;
+            esac
+            if [[ "$cur" == -* ]]; then
+                COMPREPLY=($(compgen -W "$gc_flags" -- "$cur"))
+            fi
+            ;;
+        check)
+            ;;
+        init)
+            if [[ "$cur" == -* ]]; then
+                COMPREPLY=($(compgen -W "$init_flags" -- "$cur"))
+            fi
+            ;;
         status)
             if [[ "$cur" == -* ]]; then
                 COMPREPLY=($(compgen -W "$status_flags" -- "$cur"))
@@ -0,0 +1,103 @@
+# coding=utf-8
+"""Unit tests for the account number -> name directory."""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+import AccountDirectory
+import Config
+
+
+def test_batched_upsert_and_lookups(tmp_path):
+    directory = AccountDirectory.AccountDirectory(tmp_path / "aws_saml.db")
+
+    added = directory.upsert_many({str(number): f"acct-{number}" for number in range(100000000000, 100000003000)})
+    unchanged = directory.upsert_many({"100000000001": "acct-100000000001"})
+    renamed = directory.upsert_many({"100000000001": "payments-prod"})
+
+    assert (added, unchanged, renamed) == (3000, 0, 1)
+    assert len(directory) == 3000
+    assert directory.get("100000000001") == "payments-prod"
+    assert directory.get("999999999999") is None
+    assert directory.lookup_many(str(number) for number in range(100000000000, 100000001200)) == {
+        str(number): "payments-prod" if number == 100000000001 else f"acct-{number}"
+        for number in range(100000000000, 100000001200)
+    }
+
+
+def test_import_skips_unchanged_file_and_export_round_trips(tmp_path):
+    directory = AccountDirectory.AccountDirectory(tmp_path / "aws_saml.db")
+    map_file = tmp_path / "account-map.json"
+    map_file.write_text(json.dumps([{"name": "productline-db", "number": "123456123456"},
+                                    {"name": "productline-app", "number": 123412341234}]))
+
+    assert directory.import_file(map_file) == 2
+    with patch.object(AccountDirectory, "parse_account_map") as parse:
+        assert directory.import_file(map_file) == 0
+    parse.assert_not_called()
+
+    assert AccountDirectory.parse_account_map(directory.export_text()) == {
+        "123456123456": "productline-db", "123412341234": "productline-app"}
+
+
+def test_import_rejects_malformed_map(tmp_path):
+    directory = AccountDirectory.AccountDirectory(tmp_path / "aws_saml.db")
+    map_file = tmp_path / "account-map.json"
+    map_file.write_text('{"name": "not-a-list"}')
+
+    with pytest.raises(ValueError):
+        directory.import_file(map_file)
+
+
+@pytest.fixture
+def aws_home(tmp_path, monkeypatch):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text("[Fed-OKTA]\nloginpage = https://login.example.com/\nloginTitle = Sign In\n")
+    (aws_dir / "account-map.json").write_text(json.dumps([{"name": "productline-db", "number": "123456123456"}]))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def test_new_names_are_written_once_per_transaction(aws_home):
+    config = Config.Config()
+
+    with patch.object(AccountDirectory.AccountDirectory, "upsert_many", autospec=True,
+                      side_effect=AccountDirectory.AccountDirectory.upsert_many) as upsert:
+        with config.transaction():
+            config.write_account_to_map_file("payments-prod", "111111111111")
+            config.write_account_to_map_file("payments-dev", "222222222222")
+            upsert_calls_inside = upsert.call_count
+
+    # Nothing is written until commit: then account-map.json is imported and both names go in one batch
+    assert upsert_calls_inside == 0
+    assert upsert.call_args_list[-1].args[1] == {"111111111111": "payments-prod", "222222222222": "payments-dev"}
+    assert upsert.call_count == 2
+    assert Config.Config().read_map_file() == {
+        "123456123456": "productline-db", "111111111111": "payments-prod", "222222222222": "payments-dev"}
+    assert json.loads((aws_home / "account-map.json").read_text()) == [
+        {"name": "productline-db", "number": "123456123456"}]
+
+
+def test_export_writes_account_map(aws_home):
+    config = Config.Config()
+    config.write_account_to_map_file("payments-prod", "111111111111")
+
+    assert config.export_account_map() == 2
+    assert AccountDirectory.parse_account_map((aws_home / "account-map.json").read_text()) == {
+        "123456123456": "productline-db", "111111111111": "payments-prod"}
+
+
+def test_export_dash_writes_to_stdout(aws_home, capsys):
+    import argparse
+    import samlstat
+
+    before = (aws_home / "account-map.json").read_text()
+    samlstat.cmd_accounts(argparse.Namespace(no_color=True, import_path=None, export_path="-"))
+
+    assert AccountDirectory.parse_account_map(capsys.readouterr().out) == {"123456123456": "productline-db"}
+    assert (aws_home / "account-map.json").read_text() == before
+    assert not (aws_home / "-").exists()
@@ -0,0 +1,90 @@
+# coding=utf-8
+"""Unit tests for the persistent IAM account alias cache."""
+
+import configparser
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import AliasCache
+
+
+def _age_entry(db_path, account_number, age):
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("UPDATE account_aliases SET fetched_at = ? WHERE account_number = ?",
+                 ((datetime.now(timezone.utc) - age).isoformat(), account_number))
+    conn.commit()
+    conn.close()
+
+
+def test_alias_served_from_cache_after_first_lookup(tmp_path):
+    cache = AliasCache.AliasCache(tmp_path / "aws_saml.db")
+    fetch = MagicMock(return_value="prod-payments")
+
+    first = AliasCache.lookup_alias(cache, "123456789012", fetch)
+    second = AliasCache.lookup_alias(cache, "123456789012", fetch)
+
+    assert first == second == "prod-payments"
+    fetch.assert_called_once()
+
+
+def test_account_without_alias_is_negatively_cached(tmp_path):
+    db_path = tmp_path / "aws_saml.db"
+    cache = AliasCache.AliasCache(db_path, ttl_seconds=3600, negative_ttl_seconds=60)
+    fetch = MagicMock(return_value=None)
+
+    assert AliasCache.lookup_alias(cache, "123456789012", fetch) is None
+    assert AliasCache.lookup_alias(cache, "123456789012", fetch) is None
+    fetch.assert_called_once()
+
+    _age_entry(db_path, "123456789012", timedelta(seconds=120))
+    assert cache.get("123456789012") == (False, None)
+
+
+def test_failed_lookup_is_not_cached(tmp_path):
+    cache = AliasCache.AliasCache(tmp_path / "aws_saml.db")
+    fetch = MagicMock(side_effect=[RuntimeError("AccessDenied"), "prod-payments"])
+
+    assert AliasCache.lookup_alias(cache, "123456789012", fetch) is None
+    assert cache.get("123456789012") == (False, None)
+    assert AliasCache.lookup_alias(cache, "123456789012", fetch) == "prod-payments"
+    assert fetch.call_count == 2
+
+
+def test_alias_expires_after_ttl(tmp_path):
+    db_path = tmp_path / "aws_saml.db"
+    cache = AliasCache.AliasCache(db_path, ttl_seconds=3600)
+    cache.put("123456789012", "prod-payments")
+
+    _age_entry(db_path, "123456789012", timedelta(hours=2))
+
+    assert cache.get("123456789012") == (False, None)
+    assert cache.fresh_aliases() == {}
+
+
+def test_warm_up_looks_up_each_uncached_account_once(tmp_path):
+    cache = AliasCache.AliasCache(tmp_path / "aws_saml.db")
+    cache.put("111111111111", "already-cached")
+    fetch = MagicMock(side_effect=lambda profile: f"alias-of-{profile}")
+
+    fetched = AliasCache.warm_alias_cache(cache, {
+        "dev-admin": "222222222222",
+        "dev-readonly": "222222222222",
+        "shared-admin": "111111111111",
+        "prod-admin": "333333333333",
+    }, fetch)
+
+    assert fetched == {"222222222222": "alias-of-dev-admin", "333333333333": "alias-of-prod-admin"}
+    assert fetch.call_count == 2
+    assert cache.fresh_aliases()["111111111111"] == "already-cached"
+
+
+def test_ttls_read_from_global_settings(tmp_path):
+    config_saml = configparser.ConfigParser()
+    config_saml.read_string("[global]\naliasCacheTTL = 120\naliasNegativeTTL = 30\n")
+
+    cache = AliasCache.from_saml_config(tmp_path, config_saml)
+
+    assert cache.ttl == timedelta(seconds=120)
+    assert cache.negative_ttl == timedelta(seconds=30)
+    assert cache.db_path == f"{tmp_path}/aws_saml.db"
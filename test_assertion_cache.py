@@ -0,0 +1,66 @@
+# coding=utf-8
+"""Unit tests for the encrypted SAML assertion cache."""
+
+import base64
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import AssertionCache
+
+
+def _saml_response(not_on_or_after):
+    stamp = not_on_or_after.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    document = f"""<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol"
+                     xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion">
+      <saml2:Assertion>
+        <saml2:Subject>
+          <saml2:SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">
+            <saml2:SubjectConfirmationData NotOnOrAfter="{stamp}"/>
+          </saml2:SubjectConfirmation>
+        </saml2:Subject>
+        <saml2:Conditions NotOnOrAfter="{stamp}"/>
+      </saml2:Assertion>
+    </samlp:Response>"""
+    return base64.b64encode(document.encode()).decode()
+
+
+def _cache(tmp_path, margin=30):
+    return AssertionCache.AssertionCache(tmp_path / "aws_saml.db", str(tmp_path / "pass.key"), margin)
+
+
+def test_assertion_reused_until_expiry_and_encrypted_at_rest(tmp_path):
+    cache = _cache(tmp_path)
+    saml_response = _saml_response(datetime.now(timezone.utc) + timedelta(minutes=5))
+
+    assert cache.put("OKTA", "jane.doe", saml_response) is True
+    assert cache.get("OKTA", "jane.doe") == saml_response
+    assert cache.get("OKTA", "john.doe") is None
+
+    conn = sqlite3.connect(str(tmp_path / "aws_saml.db"))
+    stored = conn.execute("SELECT assertion FROM saml_assertions").fetchone()[0]
+    conn.close()
+    assert saml_response.encode() not in stored
+
+
+def test_assertion_inside_reuse_margin_is_not_handed_out(tmp_path):
+    cache = _cache(tmp_path, margin=120)
+
+    cache.put("OKTA", "jane.doe", _saml_response(datetime.now(timezone.utc) + timedelta(seconds=60)))
+
+    assert cache.get("OKTA", "jane.doe") is None
+
+
+def test_expired_assertion_is_not_stored(tmp_path):
+    cache = _cache(tmp_path)
+
+    assert cache.put("OKTA", "jane.doe", _saml_response(datetime.now(timezone.utc) - timedelta(seconds=1))) is False
+    assert cache.put("OKTA", "jane.doe", "CouldNotCompleteMFA") is False
+
+
+def test_removed_assertion_forces_new_login(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("OKTA", "jane.doe", _saml_response(datetime.now(timezone.utc) + timedelta(minutes=5)))
+
+    cache.remove("OKTA", "jane.doe")
+
+    assert cache.get("OKTA", "jane.doe") is None
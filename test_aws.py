@@ -0,0 +1,181 @@
+# coding=utf-8
+"""Unit tests for the AWS STS helpers."""
+
+import datetime
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import AWS
+
+
+@pytest.fixture(autouse=True)
+def fresh_sts_registry():
+    AWS.STS.reset_sts_clients()
+    yield
+    AWS.STS.reset_sts_clients()
+
+
+def test_sts_client_is_reused_per_region():
+    first = AWS.STS.get_sts_client('us-east-1')
+    second = AWS.STS.get_sts_client('us-east-1')
+    other_region = AWS.STS.get_sts_client('us-west-2')
+
+    assert first is second
+    assert other_region is not first
+    assert other_region.meta.region_name == 'us-west-2'
+
+
+def test_sts_client_rebuilt_when_batch_needs_a_bigger_pool():
+    small = AWS.STS.get_sts_client('us-east-1', pool_size=2)
+    large = AWS.STS.get_sts_client('us-east-1', pool_size=40)
+    again = AWS.STS.get_sts_client('us-east-1', pool_size=10)
+
+    assert large is not small
+    assert large.meta.config.max_pool_connections == 40
+    assert again is large
+
+
+def test_presized_sts_client_is_reused_by_calls_without_a_size():
+    AWS.STS.prepare_sts_transport(['eu-central-1'], 3, backend='boto3')
+    presized = AWS.STS.get_sts_client('eu-central-1', pool_size=3)
+
+    assert AWS.STS.get_sts_client('eu-central-1') is presized
+    assert presized.meta.config.max_pool_connections == 3
+
+
+def test_caller_id_taken_from_assume_role_response():
+    sts_object = {
+        'AssumedRoleUser': {
+            'AssumedRoleId': 'AROAEXAMPLEROLEID0001:jane.doe@example.com',
+            'Arn': 'arn:aws:sts::123456789012:assumed-role/Fed-Admin/jane.doe@example.com',
+        },
+    }
+
+    assert AWS.STS.get_caller_id_from_sts(sts_object) == 'jane.doe@example.com'
+
+
+def test_caller_id_verification_runs_off_the_calling_thread():
+    release = threading.Event()
+    session = MagicMock()
+
+    def get_caller_identity():
+        release.wait(5)
+        return {'UserId': 'AROAEXAMPLEROLEID0001:jane.doe'}
+
+    session.return_value.client.return_value.get_caller_identity.side_effect = get_caller_identity
+
+    with patch('boto3.Session', session), patch.object(AWS.log_stream, 'warning') as warning:
+        verification = AWS.STS.verify_caller_id_async('ASIA', 'secret', 'token', 'us-east-1', 'jane.doe')
+        assert verification.is_alive() and verification.daemon
+        release.set()
+        verification.join(5)
+
+    assert not verification.is_alive()
+    warning.assert_not_called()
+
+
+def test_throttled_call_is_retried_and_counted():
+    limiter = AWS.AdaptiveRateLimiter(rate=100)
+    stats = AWS.AssumeRoleStats()
+    outcomes = [AWS.STSCallError('Throttling', 'Rate exceeded'),
+                AWS.STSCallError('RequestLimitExceeded', 'Rate exceeded'),
+                {'Credentials': {}}]
+
+    def assume_once(*args):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with patch.object(AWS.STS, '_assume_once', side_effect=assume_once), patch.object(AWS.time, 'sleep'):
+        sts_object = AWS.STS.aws_assume_role('us-east-1', 'role', 'principal', 'assertion', 3600,
+                                             rate_limiter=limiter, stats=stats)
+
+    assert sts_object == {'Credentials': {}}
+    assert (stats.calls, stats.retries, stats.throttles) == (3, 2, 2)
+    assert limiter.rate < 100
+
+
+def test_terminal_error_is_not_retried():
+    stats = AWS.AssumeRoleStats()
+
+    with patch.object(AWS.STS, '_assume_once', side_effect=AWS.STSCallError('InvalidIdentityToken', 'bad')), \
+         patch.object(AWS.time, 'sleep') as sleep, pytest.raises(SystemExit) as raised:
+        AWS.STS.aws_assume_role('us-east-1', 'role', 'principal', 'assertion', 3600, stats=stats)
+
+    assert raised.value.code == 2
+    assert raised.value.__cause__.code == 'InvalidIdentityToken'
+    assert stats.calls == 1
+    sleep.assert_not_called()
+
+
+def test_retries_stop_at_assertion_expiry():
+    stats = AWS.AssumeRoleStats()
+    deadline = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(milliseconds=1)
+
+    with patch.object(AWS.STS, '_assume_once', side_effect=AWS.STSCallError('Throttling', 'Rate exceeded')), \
+         patch.object(AWS, 'backoff_delay', return_value=5), patch.object(AWS.time, 'sleep') as sleep, \
+         pytest.raises(SystemExit):
+        AWS.STS.aws_assume_role('us-east-1', 'role', 'principal', 'assertion', 3600, deadline=deadline, stats=stats)
+
+    assert stats.calls == 1
+    sleep.assert_not_called()
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [AWS.backoff_delay(attempt, base=0.5, cap=4) for attempt in range(10) for _ in range(20)]
+
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_rate_limiter_halves_on_throttle_and_recovers():
+    limiter = AWS.AdaptiveRateLimiter(rate=8, max_rate=10, increase=1)
+
+    limiter.on_throttle()
+    assert limiter.rate == 4
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.rate == 10
+
+
+def test_rate_limiter_is_unthrottled_until_sts_throttles():
+    limiter = AWS.AdaptiveRateLimiter()
+
+    assert limiter.rate is None
+    with patch.object(AWS.time, 'sleep') as sleep:
+        for _ in range(1000):
+            limiter.acquire()
+    sleep.assert_not_called()
+
+    limiter.on_throttle()
+    assert limiter.rate == AWS.constants.__sts_rate_limit__
+
+
+def test_server_errors_are_retried_whatever_the_body():
+    error = AWS.STSCallError('Unknown', '<html>502 Bad Gateway</html>', status_code=502)
+
+    assert error.retryable and not error.throttled
+    assert not AWS.STSCallError('Unknown', 'bad request', status_code=400).retryable
+    assert AWS.STSCallError('Unknown', 'slow down', status_code=429).throttled
+
+
+def test_account_alias_is_none_only_when_the_account_has_none():
+    from botocore.exceptions import ClientError
+
+    session = MagicMock()
+    list_aliases = session.return_value.client.return_value.list_account_aliases
+
+    with patch('boto3.Session', session):
+        list_aliases.return_value = {'AccountAliases': ['prod-payments']}
+        assert AWS.IAM.get_account_alias('prod-admin') == 'prod-payments'
+
+        list_aliases.return_value = {'AccountAliases': []}
+        assert AWS.IAM.get_account_alias('prod-admin') is None
+
+        list_aliases.side_effect = ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'denied'}},
+                                               'ListAccountAliases')
+        with pytest.raises(ClientError):
+            AWS.IAM.get_account_alias('prod-admin')
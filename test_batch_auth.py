@@ -0,0 +1,238 @@
+# coding=utf-8
+"""Unit tests for batch role assumption with a shared SAML assertion."""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+import Providers
+import batch_auth
+
+
+def _profile_info(count):
+    return {
+        f"profile-{i:02d}": {
+            "aws_region": "us-east-1",
+            "role_arn": f"arn:aws:iam::1234567890{i:02d}:role/Fed-Admin",
+            "principal_arn": f"arn:aws:iam::1234567890{i:02d}:saml-provider/OKTA",
+            "session_duration": 3600,
+        }
+        for i in range(count)
+    }
+
+
+def test_group_roles_assumed_concurrently_in_stable_order():
+    profile_info = _profile_info(20)
+    group = list(profile_info)
+
+    def slow_assume(region, role, principle, saml_assertion, duration, **kwargs):
+        # Later profiles finish first, so any ordering comes from the fan-out and not from timing
+        time.sleep(0.2 - 0.005 * int(role.split("::")[1][10:12]))
+        return {"role": role}
+
+    start = time.monotonic()
+    with patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=slow_assume):
+        results = list(batch_auth.assume_group_roles(profile_info, group, "assertion", max_workers=20))
+    elapsed = time.monotonic() - start
+
+    assert [profile for profile, _, _ in results] == group
+    assert all(error is None for _, _, error in results)
+    assert elapsed < 1.0
+
+
+def test_one_profile_failure_does_not_stop_the_group():
+    profile_info = _profile_info(4)
+    group = list(profile_info)
+
+    def assume(region, role, principle, saml_assertion, duration, **kwargs):
+        if "123456789001" in role:
+            raise SystemExit(2)
+        if "123456789002" in role:
+            raise RuntimeError("boom")
+        return {"role": role}
+
+    with patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=assume):
+        results = {profile: (response, error) for profile, response, error in
+                   batch_auth.assume_group_roles(profile_info, group, "assertion", max_workers=4)}
+
+    assert isinstance(results["profile-01"][1], SystemExit)
+    assert isinstance(results["profile-02"][1], RuntimeError)
+    assert results["profile-00"] == ({"role": profile_info["profile-00"]["role_arn"]}, None)
+    assert results["profile-03"][1] is None
+
+
+@pytest.fixture
+def two_group_home(tmp_path, monkeypatch):
+    """A ~/.aws with one profile for each of two usernames, so a batch has two login groups."""
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text(
+        "[global]\nbrowser = chrome\nsamlProvider = Fed-OKTA\nsavedPassword = true\ncacheAssertion = false\n\n"
+        "[Fed-OKTA]\nloginpage = https://login.example.com/app/amazon_aws/sso/saml\nloginTitle = Example - Sign In\n\n"
+        "[alpha]\naccountNumber = 123456789001\niamRole = Fed-Admin\nusername = alice\n\n"
+        "[beta]\naccountNumber = 123456789002\niamRole = Fed-Admin\nusername = bob\n"
+    )
+    (aws_dir / "credentials").write_text("#This is your AWS credentials file\n")
+    (aws_dir / "config").write_text("")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def _sts_response(**kwargs):
+    return {"Credentials": {"AccessKeyId": "ASIA" + "A" * 16, "SecretAccessKey": "s" * 40,
+                            "SessionToken": "t" * 120,
+                            "Expiration": datetime.now(timezone.utc) + timedelta(hours=1)}}
+
+
+def test_group_logins_run_concurrently(two_group_home):
+    login_threads = set()
+
+    def slow_login(**kwargs):
+        login_threads.add(threading.current_thread().name)
+        time.sleep(0.5)
+        return "A" * 64
+
+    start = time.monotonic()
+    with patch.object(batch_auth.Login, "browser_login", side_effect=slow_login) as login, \
+         patch.object(batch_auth.Config.Config, "return_stored_pass_config", return_value=(None, None)), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret") as password, \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=_sts_response):
+        results = batch_auth.perform_batch_auth(["alpha", "beta"])
+    elapsed = time.monotonic() - start
+
+    assert results == {"alpha": True, "beta": True}
+    assert sorted(call.kwargs["username"] for call in login.call_args_list) == ["alice", "bob"]
+    assert password.call_count == 1
+    assert len(login_threads) == 2
+    assert elapsed < 0.9
+
+
+def test_sequential_logins_overlap_sts_work(two_group_home, monkeypatch):
+    monkeypatch.setattr(batch_auth.constants, "__login_max_workers__", 1)
+
+    def login(**kwargs):
+        time.sleep(0.4)
+        return "A" * 64
+
+    def slow_assume(**kwargs):
+        time.sleep(0.4)
+        return _sts_response()
+
+    events = []
+    start = time.monotonic()
+    with patch.object(batch_auth.Login, "browser_login", side_effect=login), \
+         patch.object(batch_auth.Config.Config, "return_stored_pass_config", return_value=(None, None)), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=slow_assume):
+        results = batch_auth.perform_batch_auth(["alpha", "beta"],
+                                                status_callback=lambda *event: events.append(event))
+    elapsed = time.monotonic() - start
+
+    assert results == {"alpha": True, "beta": True}
+    # One login after the other, the second overlapping the first group's STS call: 0.4 + 0.4 + 0.4
+    assert elapsed < 1.45
+    pipeline = [message for kind, _, message in events if kind == "STATS" and message.startswith("Pipeline")]
+    assert len(pipeline) == 1
+    assert "2 browser login(s)" in pipeline[0] and "over 2 group(s)" in pipeline[0]
+
+
+def test_failed_group_login_does_not_stop_the_other_group(two_group_home):
+    def login(**kwargs):
+        if kwargs["username"] == "alice":
+            raise SystemExit(1)
+        return "A" * 64
+
+    events = []
+    with patch.object(batch_auth.Login, "browser_login", side_effect=login), \
+         patch.object(batch_auth.Config.Config, "return_stored_pass_config", return_value=(None, None)), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=_sts_response):
+        results = batch_auth.perform_batch_auth(["alpha", "beta"],
+                                                status_callback=lambda *event: events.append(event))
+
+    assert results == {"alpha": False, "beta": True}
+    assert ("FAIL", "alpha", "Login failed: LoginAborted") in events
+
+
+def test_mfa_gate_serialises_prompts_on_one_device():
+    lock = threading.Lock()
+    holding = []
+    overlap = []
+
+    def login():
+        gate = Providers.MFAGate(lock)
+        try:
+            gate.enter()
+            gate.enter()  # Selecting a second factor in the same login does not deadlock
+            holding.append(1)
+            overlap.append(len(holding))
+            time.sleep(0.05)
+            holding.pop()
+        finally:
+            gate.release()
+
+    threads = [threading.Thread(target=login) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlap == [1, 1, 1, 1]
+    assert not lock.locked()
+    Providers.MFAGate().enter()  # No lock: nothing to wait for
+
+
+def test_profiles_reported_ok_only_after_the_write_commits(two_group_home):
+    events = []
+    with patch.object(batch_auth.Login, "browser_login", return_value="A" * 64), \
+         patch.object(batch_auth.Config.Config, "return_stored_pass_config", return_value=(None, None)), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=_sts_response), \
+         patch.object(batch_auth.Config.Config, "commit", side_effect=OSError("disk full")):
+        results = batch_auth.perform_batch_auth(["alpha", "beta"],
+                                                status_callback=lambda *event: events.append(event))
+
+    assert results == {"alpha": False, "beta": False}
+    assert [kind for kind, profile, _ in events if profile in ("alpha", "beta")] == ["FAIL", "FAIL"]
+
+
+def test_login_returning_no_assertion_fails_its_group_without_hanging(two_group_home):
+    def login(**kwargs):
+        return None if kwargs["username"] == "alice" else "A" * 64
+
+    events = []
+    with patch.object(batch_auth.Login, "browser_login", side_effect=login), \
+         patch.object(batch_auth.Config.Config, "return_stored_pass_config", return_value=(None, None)), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=_sts_response):
+        results = batch_auth.perform_batch_auth(["alpha", "beta"],
+                                                status_callback=lambda *event: events.append(event))
+
+    assert results == {"alpha": False, "beta": True}
+    assert ("FAIL", "alpha", "Login failed: LoginError") in events
+
+
+def test_interrupted_batch_cancels_logins_not_yet_started(two_group_home, monkeypatch):
+    monkeypatch.setattr(batch_auth.constants, "__login_max_workers__", 1)
+
+    def login(**kwargs):
+        time.sleep(0.2)
+        return "A" * 64
+
+    def ctrl_c_while_waiting(*args, **kwargs):
+        time.sleep(0.05)
+        raise KeyboardInterrupt
+
+    with patch.object(batch_auth.Login, "browser_login", side_effect=login) as browser_login, \
+         patch.object(batch_auth.Config.Config, "return_stored_pass_config", return_value=(None, None)), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.queue.PriorityQueue, "get", side_effect=ctrl_c_while_waiting):
+        with pytest.raises(KeyboardInterrupt):
+            batch_auth.perform_batch_auth(["alpha", "beta"])
+        time.sleep(0.4)
+
+    assert browser_login.call_count == 1
@@ -0,0 +1,116 @@
+# coding=utf-8
+"""Unit tests for the batch checkpoint journal and resuming an interrupted batch."""
+
+import base64
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+import BatchJournal
+import batch_auth
+
+
+def _assertion(lifetime=timedelta(minutes=5)):
+    stamp = (datetime.now(timezone.utc) + lifetime).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    document = (f'<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol" '
+                f'xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion"><saml2:Assertion>'
+                f'<saml2:Conditions NotOnOrAfter="{stamp}"/></saml2:Assertion></samlp:Response>')
+    return base64.b64encode(document.encode()).decode()
+
+
+def _sts_response(**kwargs):
+    return {"Credentials": {"AccessKeyId": "ASIA" + "A" * 16, "SecretAccessKey": "s" * 40,
+                            "SessionToken": "t" * 120,
+                            "Expiration": datetime.now(timezone.utc) + timedelta(hours=1)}}
+
+
+@pytest.fixture
+def journal_home(tmp_path, monkeypatch):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text(
+        "[global]\nbrowser = chrome\nsamlProvider = Fed-OKTA\nsavedPassword = true\ncacheAssertion = false\n\n"
+        "[Fed-OKTA]\nloginpage = https://login.example.com/app/amazon_aws/sso/saml\nloginTitle = Example - Sign In\n\n"
+        "[alpha]\naccountNumber = 123456789001\niamRole = Fed-Admin\nusername = alice\n\n"
+        "[beta]\naccountNumber = 123456789002\niamRole = Fed-Admin\nusername = bob\n"
+    )
+    (aws_dir / "credentials").write_text("#This is your AWS credentials file\n")
+    (aws_dir / "config").write_text("")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def test_journal_tracks_states_and_encrypted_assertions(journal_home):
+    db_path, pass_key = journal_home / "aws_saml.db", str(journal_home / "saml.key")
+    journal = BatchJournal.BatchJournal.start(db_path, pass_key, ["alpha", "beta"])
+    journal.mark(["alpha"], BatchJournal.WRITTEN)
+    saml_response = _assertion()
+    journal.save_assertion("OKTA", "bob", saml_response)
+
+    resumed = BatchJournal.BatchJournal.resume(db_path, pass_key, ["beta", "alpha"])
+    assert resumed.batch_id == journal.batch_id and resumed.resumed
+    assert resumed.states() == {"alpha": BatchJournal.WRITTEN, "beta": BatchJournal.PLANNED}
+    assert resumed.assertion("OKTA", "bob") == saml_response
+    assert resumed.assertion("OKTA", "alice") is None
+    assert BatchJournal.BatchJournal.resume(db_path, pass_key, ["alpha"]) is None
+    assert BatchJournal.unfinished_profiles(db_path) == ["alpha", "beta"]
+
+    stored = sqlite3.connect(db_path).execute("SELECT assertion FROM batch_journal_assertions").fetchone()[0]
+    assert saml_response.encode() not in stored
+
+    resumed.finish()
+    assert BatchJournal.unfinished_profiles(db_path) is None
+
+
+def test_expired_assertion_is_not_reused(journal_home):
+    journal = BatchJournal.BatchJournal.start(journal_home / "aws_saml.db", str(journal_home / "saml.key"), ["beta"])
+    journal.save_assertion("OKTA", "bob", _assertion(lifetime=timedelta(seconds=5)))
+
+    assert journal.assertion("OKTA", "bob") is None
+
+
+def _run(logins, assume=_sts_response, resume=False):
+    with patch.object(batch_auth.Login, "browser_login", side_effect=logins) as login, \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=assume):
+        events = []
+        results = batch_auth.perform_batch_auth(["alpha", "beta"], resume=resume,
+                                                status_callback=lambda *event: events.append(event))
+    return results, login, events
+
+
+def test_resume_skips_written_profiles_and_logs_in_for_the_rest(journal_home):
+    def mfa_timeout_for_bob(**kwargs):
+        if kwargs["username"] == "bob":
+            raise SystemExit(1)
+        return _assertion()
+
+    results, _, events = _run(mfa_timeout_for_bob)
+    assert results == {"alpha": True, "beta": False}
+    assert any("--resume" in message for kind, _, message in events if kind == "INFO")
+
+    results, login, events = _run(lambda **kwargs: _assertion(), resume=True)
+
+    assert results == {"alpha": True, "beta": True}
+    assert [call.kwargs["username"] for call in login.call_args_list] == ["bob"]
+    assert ("DONE", "alpha", "Written by the interrupted batch") in events
+    assert BatchJournal.unfinished_profiles(journal_home / "aws_saml.db") is None
+
+
+def test_resume_reuses_the_captured_assertion(journal_home):
+    def sts_fails_for_beta(role, **kwargs):
+        if "123456789002" in role:
+            raise SystemExit(2)
+        return _sts_response()
+
+    results, login, _ = _run(lambda **kwargs: _assertion(), assume=sts_fails_for_beta)
+    assert results == {"alpha": True, "beta": False}
+    assert login.call_count == 2
+
+    results, login, _ = _run(lambda **kwargs: _assertion(), resume=True)
+
+    assert results == {"alpha": True, "beta": True}
+    login.assert_not_called()
@@ -0,0 +1,126 @@
+# coding=utf-8
+"""Unit tests for batch planning: groups, shared roles, skips and estimates from recorded timings."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+import BatchPlan
+import Config
+import ConfigSnapshot
+import batch_auth
+
+
+@pytest.fixture
+def plan_home(tmp_path, monkeypatch):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text(
+        "[global]\nbrowser = chrome\nsamlProvider = Fed-OKTA\nusername = alice\nsavedPassword = true\n"
+        "cacheAssertion = false\n\n"
+        "[Fed-OKTA]\nloginpage = https://login.example.com/app/amazon_aws/sso/saml\nloginTitle = Example - Sign In\n\n"
+        "[prod-a]\naccountNumber = 123456789001\niamRole = Admin\n\n"
+        "[prod-a-eu]\naccountNumber = 123456789001\niamRole = Admin\nawsRegion = eu-west-1\n\n"
+        "[prod-b]\naccountNumber = 123456789002\niamRole = Admin\nusername = bob\nbrowser = firefox\n\n"
+        "[prod-bad]\naccountNumber = 12345\n"
+    )
+    (aws_dir / "credentials").write_text("#This is your AWS credentials file\n")
+    (aws_dir / "config").write_text("")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def test_plan_groups_shares_roles_and_skips(plan_home):
+    plan = BatchPlan.build(["prod-a", "prod-a-eu", "prod-b", "prod-bad", "missing", "prod-a"], Config.Config())
+
+    assert plan.requested == ["prod-a", "prod-a-eu", "prod-b", "prod-bad", "missing"]
+    assert set(plan.skipped) == {"prod-bad", "missing"}
+    assert "missing iamrole" in plan.skipped["prod-bad"]
+
+    alice = plan.group_for("Fed-OKTA", "alice")
+    assert alice["profiles"] == ["prod-a", "prod-a-eu"]
+    assert alice["assume"] == ["prod-a"]
+    assert plan.shared == {"prod-a-eu": "prod-a"}
+    assert alice["browser"] == "chrome"
+    assert plan.group_for("Fed-OKTA", "bob")["browser"] == "firefox"
+    assert plan.estimate["logins"] == 2
+    assert plan.estimate["sts_calls"] == 2
+    assert plan.estimate["from_history"] is False
+
+
+def test_browser_override_applies_to_every_group(plan_home):
+    plan = BatchPlan.build(["prod-a", "prod-b"], Config.Config(), browser="edge")
+
+    assert {group["browser"] for group in plan.groups} == {"edge"}
+
+
+def test_estimate_uses_recorded_timings(plan_home):
+    db_path = plan_home / "aws_saml.db"
+    BatchPlan.record_timings(db_path, [("login", "Fed-OKTA", "alice", 8.0), ("login", "Fed-OKTA", "alice", 12.0),
+                                       ("login", "Fed-OKTA", "carol", 40.0), ("assume", "Fed-OKTA", "alice", 0.2)])
+
+    plan = BatchPlan.build(["prod-a", "prod-b"], Config.Config())
+
+    assert plan.group_for("Fed-OKTA", "alice")["login_seconds"] == 10.0
+    # No history of bob's own: everyone's logins stand in
+    assert plan.group_for("Fed-OKTA", "bob")["login_seconds"] == 12.0
+    assert plan.estimate["from_history"] is True
+    # Both logins run at once; alice's STS round overlaps bob's login, which finishes at 12s
+    assert plan.estimate["seconds"] == pytest.approx(12.0 + 0.2)
+
+
+def test_timings_keep_only_the_newest_rows(plan_home, monkeypatch):
+    db_path = plan_home / "aws_saml.db"
+    monkeypatch.setattr(BatchPlan, "_TIMINGS_KEPT", 3)
+    for seconds in range(6):
+        BatchPlan.record_timings(db_path, [("login", "Fed-OKTA", "alice", float(seconds))])
+
+    assert [seconds for _, _, seconds in BatchPlan.load_timings(db_path)["login"]] == [5.0, 4.0, 3.0]
+
+
+def test_running_a_plan_reads_no_config_and_shares_one_call_per_role(plan_home):
+    plan = BatchPlan.build(["prod-a", "prod-a-eu"], Config.Config())
+
+    def assume(region, role, **kwargs):
+        return {"Credentials": {"AccessKeyId": "ASIA" + "A" * 16, "SecretAccessKey": "s" * 40,
+                                "SessionToken": "t" * 120,
+                                "Expiration": datetime.now(timezone.utc) + timedelta(hours=1)}}
+
+    with patch.object(ConfigSnapshot, "profile_index", side_effect=AssertionError("samlsts read")), \
+         patch.object(Config.Config, "_get_config_value", side_effect=AssertionError("global read")), \
+         patch.object(batch_auth.Login, "browser_login", return_value="A" * 64), \
+         patch.object(batch_auth.Password, "retrieve_password", return_value="secret"), \
+         patch.object(batch_auth.AWS.STS, "aws_assume_role", side_effect=assume) as sts:
+        results = batch_auth.perform_batch_auth(["prod-a", "prod-a-eu"], plan=plan)
+
+    assert results == {"prod-a": True, "prod-a-eu": True}
+    assert sts.call_count == 1
+    credentials = Config.ConfigSnapshot.read_config(str(plan_home / "credentials"))
+    assert credentials["prod-a"]["aws_access_key_id"] == credentials["prod-a-eu"]["aws_access_key_id"]
+    assert set(BatchPlan.load_timings(plan_home / "aws_saml.db")) == {"login", "assume"}
+
+
+def test_profiles_share_a_session_only_when_the_sts_call_matches():
+    role = {"role_arn": "arn:aws:iam::123456789001:role/Admin",
+            "principal_arn": "arn:aws:iam::123456789001:saml-provider/OKTA"}
+    profile_info = {"short": dict(role, session_duration=3600), "copy": dict(role, session_duration=3600),
+                    "long": dict(role, session_duration=14400)}
+
+    assert BatchPlan._split_shared(profile_info, ["short", "copy", "long"]) == (["short", "long"], {"copy": "short"})
+
+
+def test_plan_reads_only_the_stored_sts_ranking(plan_home):
+    import STSEndpoints
+
+    config_text = (plan_home / "samlsts").read_text().replace(
+        "cacheAssertion = false\n", "cacheAssertion = false\nstsEndpointProbe = true\nstsRegions = us-east-1,eu-west-1\n")
+    (plan_home / "samlsts").write_text(config_text)
+
+    with patch.object(STSEndpoints, "rank_endpoints", side_effect=AssertionError("probed")):
+        assert BatchPlan.build(["prod-a"], Config.Config(), probe_sts=False).settings["sts_region"] is None
+
+        candidates = {region: STSEndpoints.regional_endpoint(region) for region in ("us-east-1", "eu-west-1")}
+        STSEndpoints.save_ranking(plan_home / "aws_saml.db", candidates, [("eu-west-1", 0.02), ("us-east-1", 0.05)])
+        assert BatchPlan.build(["prod-a"], Config.Config(), probe_sts=False).settings["sts_region"] == "eu-west-1"
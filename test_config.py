@@ -0,0 +1,148 @@
+# coding=utf-8
+"""Unit tests for Config's credentials/config writer."""
+
+import os
+import stat
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import Config
+
+ACCESS_KEY = "ASIAEXAMPLEEXAMPLE01"
+SECRET_KEY = "wJalrXUtnFEMIK7MDENGbPxRfiCYEXAMPLEKEY01"
+SESSION_TOKEN = "FwoGZXIvYXdzEXAMPLETOKEN" * 6
+REPO_DIR = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def aws_home(tmp_path, monkeypatch):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text("[Fed-OKTA]\nloginpage = https://login.example.com/\nloginTitle = Sign In\n")
+    (aws_dir / "credentials").write_text("[untouched]\naws_access_key_id = AKIAKEEPME\n\n")
+    os.chmod(aws_dir / "credentials", 0o600)
+    (aws_dir / "config").write_text("")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def _write(config, profile):
+    config.write_aws_config(ACCESS_KEY, SECRET_KEY, SESSION_TOKEN, profile, "us-east-1", "123456789012", True)
+
+
+def test_transaction_commits_each_file_once(aws_home):
+    config = Config.Config()
+
+    with patch.object(Config.os, "replace", wraps=os.replace) as replace:
+        with config.transaction():
+            for index in range(25):
+                _write(config, f"profile-{index}")
+        assert replace.call_count == 2
+
+    credentials = (aws_home / "credentials").read_text()
+    assert "[profile-24]" in credentials and "[untouched]" in credentials
+    assert stat.S_IMODE(os.stat(aws_home / "credentials").st_mode) == 0o600
+    assert not [p for p in aws_home.iterdir() if p.name.endswith(".tmp")]
+
+
+def test_unchanged_content_is_not_rewritten(aws_home):
+    config = Config.Config()
+    _write(config, "profile-a")
+
+    with patch.object(Config.os, "replace", wraps=os.replace) as replace:
+        _write(config, "profile-a")
+
+    replace.assert_not_called()
+
+
+def test_failed_transaction_leaves_files_untouched(aws_home):
+    config = Config.Config()
+    before = (aws_home / "credentials").read_text()
+
+    with pytest.raises(KeyboardInterrupt):
+        with config.transaction():
+            _write(config, "profile-a")
+            raise KeyboardInterrupt
+
+    assert (aws_home / "credentials").read_text() == before
+    assert not config.configCredentials.has_section("profile-a")
+
+
+def test_interrupted_write_keeps_previous_file(aws_home):
+    before = (aws_home / "credentials").read_text()
+
+    with patch.object(Config.os, "fsync", side_effect=OSError("disk full")), pytest.raises(OSError):
+        Config.atomic_write_text(aws_home / "credentials", "[new]\n")
+
+    assert (aws_home / "credentials").read_text() == before
+    assert not [p for p in aws_home.iterdir() if p.name.endswith(".tmp")]
+
+
+def test_construction_touches_no_files(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+
+    config = Config.Config()
+
+    assert list(tmp_path.iterdir()) == []
+    assert config.configCredentials.sections() == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_importing_modules_touches_no_files(tmp_path):
+    script = "import Config, Utilities, batch_auth, getCredentials, samlstat; Config.Config()"
+    environment = {"HOME": str(tmp_path), "USERPROFILE": str(tmp_path), "PATH": os.environ.get("PATH", "")}
+
+    result = subprocess.run([sys.executable, "-c", script], cwd=str(REPO_DIR), env=environment,
+                            capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_bootstrap_creates_missing_files(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    answers = iter(["okta", "https://login.example.com/", "Example - Sign In"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    config = Config.Config()
+
+    assert config.bootstrap() is True
+    assert config.bootstrap() is False
+
+    aws_dir = tmp_path / ".aws"
+    assert stat.S_IMODE(os.stat(aws_dir).st_mode) == 0o700
+    for name in ("samlsts", "credentials", "config"):
+        assert stat.S_IMODE(os.stat(aws_dir / name).st_mode) == 0o600
+    assert config.configSAML.has_section("Fed-OKTA")
+
+
+def test_non_interactive_bootstrap_without_samlsts_exits(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+
+    with pytest.raises(SystemExit):
+        Config.Config().bootstrap(interactive=False)
+
+
+def test_atomic_write_follows_symlinks_and_keeps_the_mode(tmp_path):
+    dotfiles = tmp_path / "dotfiles"
+    dotfiles.mkdir()
+    target = dotfiles / "config"
+    target.write_text("[default]\n")
+    os.chmod(target, 0o644)
+    link = tmp_path / "config"
+    link.symlink_to(target)
+
+    Config.atomic_write_text(link, "[profile dev]\nregion = eu-west-1\n")
+
+    assert link.is_symlink()
+    assert target.read_text() == "[profile dev]\nregion = eu-west-1\n"
+    assert stat.S_IMODE(os.stat(target).st_mode) == 0o644
+    Config.atomic_write_text(tmp_path / "credentials", "[new]\n")
+    assert stat.S_IMODE(os.stat(tmp_path / "credentials").st_mode) == 0o600
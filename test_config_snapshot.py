@@ -0,0 +1,173 @@
+# coding=utf-8
+"""Unit tests for the parsed-config snapshot cache."""
+
+import configparser
+import io
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+import ConfigSnapshot
+
+SAMLSTS = """[global]
+username = jane.doe
+samlProvider = Fed-OKTA
+awsRegion = eu-west-1
+sessionDuration = 7200
+
+[Fed-OKTA]
+loginpage = https://login.example.com/
+
+[dev-admin]
+accountNumber = 111111111111
+iamRole = Fed-Admin
+
+[prod-readonly]
+accountNumber = 222222222222
+iamRole = Fed-ReadOnly
+awsRegion = us-west-2
+sessionDuration = 3600
+"""
+
+
+def _write(path, text, age=60):
+    path.write_text(text)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+@pytest.fixture(autouse=True)
+def fresh_memory():
+    ConfigSnapshot.clear_memory_cache()
+    yield
+    ConfigSnapshot.clear_memory_cache()
+
+
+def test_file_is_parsed_once_per_process(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+
+    with patch.object(ConfigSnapshot, "_parse", wraps=ConfigSnapshot._parse) as parse:
+        ConfigSnapshot.read_config(samlsts)
+        ConfigSnapshot.read_config(samlsts)
+        ConfigSnapshot.profile_records(samlsts)
+
+    parse.assert_called_once()
+
+
+def test_snapshot_reused_across_processes_from_disk(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+    ConfigSnapshot.load_snapshot(samlsts)
+    ConfigSnapshot.clear_memory_cache()
+
+    with patch.object(ConfigSnapshot, "_parse", side_effect=AssertionError("parsed again")):
+        assert ConfigSnapshot.read_config(samlsts).get("dev-admin", "iamrole") == "Fed-Admin"
+
+
+def test_changed_file_invalidates_snapshot(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS, age=120)
+    ConfigSnapshot.load_snapshot(samlsts)
+
+    _write(samlsts, SAMLSTS.replace("Fed-Admin", "Fed-PowerUser"), age=60)
+
+    assert ConfigSnapshot.read_config(samlsts).get("dev-admin", "iamrole") == "Fed-PowerUser"
+    ConfigSnapshot.clear_memory_cache()
+    assert ConfigSnapshot.profile_records(samlsts)["dev-admin"]["iam_role"] == "Fed-PowerUser"
+
+
+def test_recently_modified_file_is_not_cached(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS, age=0)
+
+    with patch.object(ConfigSnapshot, "_parse", wraps=ConfigSnapshot._parse) as parse:
+        ConfigSnapshot.load_snapshot(samlsts)
+        ConfigSnapshot.load_snapshot(samlsts)
+
+    assert parse.call_count == 2
+
+
+def test_read_config_behaves_like_a_parsed_file(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+    expected = configparser.ConfigParser()
+    expected.read(samlsts)
+
+    first = ConfigSnapshot.read_config(samlsts)
+    first["dev-admin"]["iamrole"] = "changed"
+    first.remove_section("prod-readonly")
+    second = ConfigSnapshot.read_config(samlsts)
+
+    assert second.sections() == expected.sections()
+    assert dict(second["prod-readonly"]) == dict(expected["prod-readonly"])
+    rendered, original = io.StringIO(), io.StringIO()
+    second.write(rendered)
+    expected.write(original)
+    assert rendered.getvalue() == original.getvalue()
+
+
+def test_profile_records_resolve_globals(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+
+    records = ConfigSnapshot.profile_records(samlsts)
+
+    assert list(records) == ["dev-admin", "prod-readonly"]
+    assert {key: records["dev-admin"][key] for key in ("saml_provider", "username", "account_number", "iam_role",
+                                                         "aws_region", "session_duration", "gui_name")} == {
+        "saml_provider": "Fed-OKTA", "username": "jane.doe", "account_number": "111111111111",
+        "iam_role": "Fed-Admin", "aws_region": "eu-west-1", "session_duration": 7200, "gui_name": None,
+    }
+    assert records["prod-readonly"]["aws_region"] == "us-west-2"
+    assert records["prod-readonly"]["session_duration"] == 3600
+
+
+def test_compiled_profiles_loaded_without_parsing_or_resolving(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+    compiled = ConfigSnapshot.profile_index(samlsts)
+    ConfigSnapshot.clear_memory_cache()
+
+    with patch.object(ConfigSnapshot, "_parse") as parse, \
+         patch.object(ConfigSnapshot.ProfileIndex.ProfileIndex, "_resolve") as resolve:
+        loaded = ConfigSnapshot.profile_index(samlsts)
+
+    parse.assert_not_called()
+    resolve.assert_not_called()
+    assert loaded.records == compiled.records
+    assert loaded.find_identity("111111111111", "Fed-Admin", "jane.doe") == "dev-admin"
+    assert loaded.global_settings()["session_duration"] == 7200
+
+
+def test_compiled_profiles_recompiled_after_edit(tmp_path):
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+    assert ConfigSnapshot.profile_index(samlsts).problems() == {
+        "dev-admin": ["provider Fed-OKTA is missing logintitle"],
+        "prod-readonly": ["provider Fed-OKTA is missing logintitle"],
+    }
+
+    _write(samlsts, SAMLSTS.replace("loginpage = https://login.example.com/\n",
+                                    "loginpage = https://login.example.com/\nloginTitle = Sign In\n"), age=30)
+
+    assert ConfigSnapshot.profile_index(samlsts).problems() == {}
+
+
+def test_credentials_are_kept_in_memory_only(tmp_path):
+    credentials = tmp_path / "credentials"
+    _write(credentials, "[dev]\naws_access_key_id = AKIAEXAMPLE\naws_secret_access_key = not-for-disk\n")
+    samlsts = tmp_path / "samlsts"
+    _write(samlsts, SAMLSTS)
+
+    assert ConfigSnapshot.read_config(credentials).get("dev", "aws_secret_access_key") == "not-for-disk"
+    ConfigSnapshot.load_snapshot(samlsts)
+
+    db_path = tmp_path / ConfigSnapshot.DB_FILE_NAME
+    assert b"not-for-disk" not in db_path.read_bytes()
+    assert os.stat(db_path).st_mode & 0o077 == 0
+    with patch.object(ConfigSnapshot, "_parse", wraps=ConfigSnapshot._parse) as parse:
+        ConfigSnapshot.read_config(credentials)
+    parse.assert_not_called()
@@ -0,0 +1,100 @@
+# coding=utf-8
+"""Cross-process tests for the ~/.aws writer lock and merge-on-write."""
+
+import configparser
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import FileLock
+
+REPO_DIR = Path(__file__).resolve().parent
+
+WRITER = """
+import sys
+import Config
+config = Config.Config()
+worker, count = sys.argv[1], int(sys.argv[2])
+for index in range(count):
+    config.write_aws_config('ASIAEXAMPLEEXAMPLE01', 'wJalrXUtnFEMIK7MDENGbPxRfiCYEXAMPLEKEY01',
+                            'FwoGZXIvYXdzEXAMPLETOKEN' * 6, f'worker{worker}-{index}', 'us-east-1',
+                            '123456789012', True)
+"""
+
+HOLDER = """
+import sys, time
+import FileLock
+with FileLock.locked(sys.argv[1]):
+    print('locked', flush=True)
+    time.sleep(float(sys.argv[2]))
+"""
+
+
+@pytest.fixture
+def aws_home(tmp_path):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text("[Fed-OKTA]\nloginpage = https://login.example.com/\nloginTitle = Sign In\n")
+    (aws_dir / "credentials").write_text("#This is your AWS credentials file\n")
+    (aws_dir / "config").write_text("")
+    return tmp_path
+
+
+def _environment(home):
+    return {"HOME": str(home), "USERPROFILE": str(home), "PATH": "", "PYTHONPATH": str(REPO_DIR)}
+
+
+def test_parallel_writers_keep_every_profile(aws_home):
+    workers, per_worker = 12, 6
+    processes = [subprocess.Popen([sys.executable, "-c", WRITER, str(worker), str(per_worker)],
+                                  cwd=str(REPO_DIR), env=_environment(aws_home),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                 for worker in range(workers)]
+
+    # Readers never take the lock and must never see a truncated file
+    credentials_file = aws_home / ".aws" / "credentials"
+    seen = 0
+    while any(process.poll() is None for process in processes):
+        reader = configparser.ConfigParser()
+        reader.read_string(credentials_file.read_text())
+        assert len(reader.sections()) >= seen
+        seen = len(reader.sections())
+
+    for process in processes:
+        assert process.wait() == 0, process.stderr.read().decode()
+
+    credentials = configparser.ConfigParser()
+    credentials.read(credentials_file)
+    config = configparser.ConfigParser()
+    config.read(aws_home / ".aws" / "config")
+    expected = {f"worker{worker}-{index}" for worker in range(workers) for index in range(per_worker)}
+    assert set(credentials.sections()) == expected
+    assert set(config.sections()) == {f"profile {name}" for name in expected}
+
+
+def test_lock_waits_for_other_process_then_times_out(tmp_path):
+    holder = subprocess.Popen([sys.executable, "-c", HOLDER, str(tmp_path), "2"], cwd=str(REPO_DIR),
+                              env=_environment(tmp_path), stdout=subprocess.PIPE)
+    try:
+        assert holder.stdout.readline().strip() == b"locked"
+
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            with FileLock.locked(tmp_path, timeout=0.3):
+                pass
+        assert time.monotonic() - start >= 0.3
+
+        with FileLock.locked(tmp_path, timeout=10):
+            assert time.monotonic() - start >= 1.5
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+def test_lock_is_reentrant_within_a_thread(tmp_path):
+    with FileLock.locked(tmp_path, timeout=1):
+        with FileLock.locked(tmp_path, timeout=1):
+            pass
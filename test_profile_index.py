@@ -0,0 +1,155 @@
+# coding=utf-8
+"""Unit tests for the samlsts profile index."""
+
+import configparser
+import json
+
+import pytest
+
+import Config
+import ProfileIndex
+
+SECTIONS = {
+    "global": {"username": "jane.doe", "samlprovider": "Fed-OKTA", "awsregion": "eu-west-1"},
+    "Fed-OKTA": {"loginpage": "https://login.example.com/", "logintitle": "Sign In"},
+    "dev-admin": {"accountnumber": "111111111111", "iamrole": "Fed-Admin"},
+    "dev-admin-copy": {"accountnumber": "111111111111", "iamrole": "Fed-Admin"},
+    "prod-readonly": {"accountnumber": "222222222222", "iamrole": "Fed-ReadOnly", "username": "john.doe"},
+}
+
+
+def test_records_resolve_globals_and_arns():
+    index = ProfileIndex.ProfileIndex(SECTIONS)
+
+    record = index.get("dev-admin")
+
+    assert "Fed-OKTA" not in index and "global" not in index
+    assert record["username"] == "jane.doe"
+    assert record["aws_region"] == "eu-west-1"
+    assert record["role_arn"] == "arn:aws:iam::111111111111:role/Fed-Admin"
+    assert record["principal_arn"] == "arn:aws:iam::111111111111:saml-provider/OKTA"
+
+
+def test_identity_and_login_lookups():
+    index = ProfileIndex.ProfileIndex(SECTIONS)
+
+    assert index.find_identity("111111111111", "Fed-Admin", "jane.doe") == "dev-admin"
+    assert index.find_identity("111111111111", "Fed-Admin", "john.doe") is None
+    assert index.profiles_for_login("Fed-OKTA", "jane.doe") == ["dev-admin", "dev-admin-copy"]
+    assert index.profiles_for_login("Fed-OKTA", "john.doe") == ["prod-readonly"]
+
+
+def test_add_and_remove_keep_indexes_current():
+    index = ProfileIndex.ProfileIndex(SECTIONS)
+
+    index.remove("dev-admin")
+    assert index.find_identity("111111111111", "Fed-Admin", "jane.doe") == "dev-admin-copy"
+
+    index.add("prod-readonly", {"accountnumber": "333333333333", "iamrole": "Fed-ReadOnly"})
+    assert index.find_identity("222222222222", "Fed-ReadOnly", "john.doe") is None
+    assert index.find_identity("333333333333", "Fed-ReadOnly", "jane.doe") == "prod-readonly"
+    assert index.profiles_for_login("Fed-OKTA", "john.doe") == []
+
+
+@pytest.fixture
+def aws_home(tmp_path, monkeypatch):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text(
+        "[global]\nusername = jane.doe\n\n[Fed-OKTA]\nloginpage = https://login.example.com/\nloginTitle = Sign In\n\n"
+        "[dev-admin]\naccountNumber = 111111111111\niamRole = Fed-Admin\nsamlProvider = Fed-OKTA\n"
+    )
+    (aws_dir / "credentials").write_text("")
+    (aws_dir / "config").write_text("")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def test_existing_profile_detected_through_global_username(aws_home):
+    config = Config.Config()
+
+    created = config.write_profile_to_saml_config("another-name", "us-east-1", "111111111111", "role/Fed-Admin",
+                                                  "Fed-OKTA", "jane.doe")
+
+    assert created is False
+
+
+def test_bulk_registration_writes_every_new_role_once(aws_home):
+    config = Config.Config()
+
+    with config.transaction():
+        results = [config.write_profile_to_saml_config(f"acct{number}-Fed-Admin", "us-east-1", str(number),
+                                                       "role/Fed-Admin", "Fed-OKTA", "jane.doe")
+                   for number in range(300000000000, 300000000500)]
+        again = config.write_profile_to_saml_config("dupe", "us-east-1", "300000000007", "role/Fed-Admin",
+                                                    "Fed-OKTA", "jane.doe")
+
+    samlsts = configparser.ConfigParser()
+    samlsts.read(aws_home / "samlsts")
+    assert all(results) and again is False
+    assert len(samlsts.sections()) == 503
+
+
+def test_read_config_uses_resolved_profile(aws_home):
+    config = Config.Config()
+
+    principle_arn, role_arn, username, *_ = config.read_config("dev-admin", False, None, None)
+
+    assert role_arn == "arn:aws:iam::111111111111:role/Fed-Admin"
+    assert principle_arn == "arn:aws:iam::111111111111:saml-provider/OKTA"
+    assert username == "jane.doe"
+    with pytest.raises(SystemExit):
+        config.read_config("no-such-profile", False, None, None)
+
+
+def test_every_problem_reported_per_profile():
+    sections = {
+        "Fed-OKTA": {"loginpage": "https://login.example.com/"},
+        "broken": {"accountnumber": "12345", "samlprovider": "Fed-OKTA", "sessionduration": "forever"},
+        "unknown-idp": {"accountnumber": "111111111111", "iamrole": "Fed-Admin", "samlprovider": "Fed-PING",
+                        "username": "jane.doe"},
+    }
+
+    problems = ProfileIndex.ProfileIndex(sections).problems()
+
+    assert problems == {
+        "broken": ["missing iamrole", "missing username", "accountnumber 12345 is not a 12 digit AWS account number",
+                   "sessionduration forever is not a number of seconds", "provider Fed-OKTA is missing logintitle"],
+        "unknown-idp": ["no [Fed-PING] provider section"],
+    }
+
+
+def test_payload_round_trip_and_copy_isolation():
+    index = ProfileIndex.ProfileIndex(SECTIONS)
+
+    loaded = ProfileIndex.ProfileIndex.from_payload(json.loads(json.dumps(index.to_payload())))
+    copied = loaded.copy()
+    copied.add("new-role", {"accountnumber": "444444444444", "iamrole": "Fed-Admin"})
+
+    assert loaded.records == index.records
+    assert loaded.get("dev-admin")["login_title"] == "Sign In"
+    assert "new-role" in copied and "new-role" not in loaded
+    assert loaded.profiles_for_login("Fed-OKTA", "jane.doe") == ["dev-admin", "dev-admin-copy"]
+
+
+def test_read_config_lists_all_problems_before_exiting(aws_home, caplog):
+    with open(aws_home / "samlsts", "a") as samlsts:
+        samlsts.write("\n[broken]\nsamlProvider = Fed-OKTA\n")
+    config = Config.Config()
+
+    with pytest.raises(SystemExit):
+        config.read_config("broken", False, None, None)
+
+    assert "missing accountnumber" in caplog.text and "missing iamrole" in caplog.text
+
+
+def test_batch_session_duration_defaults_to_four_hours():
+    index = ProfileIndex.ProfileIndex(dict(SECTIONS, **{
+        "long": {"accountnumber": "333333333333", "iamrole": "Fed-Admin", "sessionduration": "7200"}}))
+
+    assert index.get("dev-admin")["session_duration"] == ProfileIndex.DEFAULT_SESSION_DURATION
+    assert index.batch_session_duration("dev-admin") == 14400
+    assert index.batch_session_duration("long") == 7200
+    sections = dict(SECTIONS, **{"global": dict(SECTIONS["global"], sessionduration="1800")})
+    assert ProfileIndex.ProfileIndex(sections).batch_session_duration("dev-admin") == 1800
@@ -1,45 +1,93 @@
 # coding=utf-8
-"""Unit tests for the forced Okta password-reset screen detection (#95)."""
+"""Unit tests for Okta screen detection: the sign-in state machine, its in-page wait and the forced password-reset screen (#95)."""
 
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, PropertyMock, patch
+
+import pytest
+from selenium.common import exceptions as se
 
 import Providers
 from SeleniumHelper import SeleniumHelper
 
 
-def test_forced_password_reset_screen_detected():
+def _sign_in(screens, browser="firefox"):
+    """Run okta_sign_in against a mocked driver on which the given screens appear in turn."""
     driver = MagicMock()
+    driver.capabilities = {"browserName": browser}
     wait = MagicMock()
-
-    with patch.object(SeleniumHelper, "poll_page_source_with_backoff", return_value=True) as poll, \
+    with patch.object(SeleniumHelper, "wait_for_screen", side_effect=screens) as wait_for_screen, \
+         patch.object(SeleniumHelper, "enter_text") as enter_text, \
+         patch.object(SeleniumHelper, "click_element"), \
+         patch.object(Providers, "select_mfa_factor", return_value=None) as select_mfa_factor, \
+         patch.object(Providers, "click_use_password", return_value=None) as click_use_password, \
          patch.object(Providers.ScreenshotRecorder, "capture") as capture:
-        detected = Providers.check_for_forced_password_reset_screen(driver, wait)
+        result = Providers.UseIdP.okta_sign_in(wait, driver, "alice", "secret", "login/sso_iwa", False)
+    raced = [[name for name, _ in call.args[0]] for call in wait_for_screen.call_args_list]
+    entered = [call.args[1] for call in enter_text.call_args_list]
+    shots = [call.args[1] for call in capture.call_args_list]
+    return result, raced, entered, select_mfa_factor, click_use_password, shots
 
-    assert detected is True
-    assert poll.call_args.args[0] == Providers.forced_password_reset_indicator
-    capture.assert_called_once_with(driver, "forced_password_reset_screen")
 
+def test_username_intermediate_and_password_screens_in_turn():
+    result, raced, entered, select_mfa_factor, click_use_password, shots = _sign_in(
+        ["username", "factor_list", "password", "mfa_prompt"])
 
-def test_forced_password_reset_screen_not_detected():
-    driver = MagicMock()
-    wait = MagicMock()
+    assert result is not None
+    assert raced == [[name for name in Providers.okta_sign_in_states[state] if name != "dsso"]
+                     for state in ("start", "username_sent", "password_chosen", "password_sent")]
+    assert entered == ["alice", "secret"]
+    click_use_password.assert_called_once()
+    select_mfa_factor.assert_called_once()
+    assert "managed_device_intermediate_screen" in shots
 
-    with patch.object(SeleniumHelper, "poll_page_source_with_backoff", return_value=False), \
-         patch.object(Providers.ScreenshotRecorder, "capture") as capture:
-        detected = Providers.check_for_forced_password_reset_screen(driver, wait)
 
-    assert detected is False
-    capture.assert_not_called()
+def test_managed_device_mfa_screen_skips_credentials():
+    result, raced, entered, select_mfa_factor, _, shots = _sign_in(["factor_list"])
 
+    assert len(raced) == 1 and entered == []
+    select_mfa_factor.assert_called_once()
+    assert "managed_device_mfa_screen" in shots
 
-def test_forced_password_reset_screen_swallows_errors():
-    driver = MagicMock()
-    wait = MagicMock()
 
-    with patch.object(SeleniumHelper, "poll_page_source_with_backoff", side_effect=RuntimeError("boom")):
-        detected = Providers.check_for_forced_password_reset_screen(driver, wait)
+def test_dsso_is_raced_on_chrome_only():
+    _, raced, entered, select_mfa_factor, _, shots = _sign_in(["dsso"], browser="chrome")
+
+    assert "dsso" in raced[0] and entered == []
+    select_mfa_factor.assert_called_once()
+    assert "dsso_detected" in shots
+    assert "dsso" not in _sign_in(["saml"])[1][0]
+
+
+def test_prefilled_username_goes_straight_to_the_password():
+    result, raced, entered, select_mfa_factor, _, shots = _sign_in(["password", None])
+
+    assert entered == ["secret"] and "username_prefilled" in shots
+    select_mfa_factor.assert_called_once()
+
+
+def test_forced_password_reset_screen_stops_the_login():
+    with pytest.raises(SystemExit):
+        _sign_in(["username", "password", "password_reset"])
+
+
+def test_missing_screen_fails_the_form():
+    result, _, _, _, _, shots = _sign_in(["username", None])
+
+    assert result == "CouldNotEnterFormData"
+    assert shots[-1] == "password_entry_failed"
+
 
-    assert detected is False
+def test_states_share_one_deadline():
+    driver = MagicMock()
+    driver.capabilities = {"browserName": "firefox"}
+    with patch.object(Providers.constants, "__timeout__", 30), \
+         patch.object(SeleniumHelper, "wait_for_screen", side_effect=["username", "password", "saml"]) as wait_for_screen, \
+         patch.object(SeleniumHelper, "enter_text"), patch.object(SeleniumHelper, "click_element"), \
+         patch.object(Providers.ScreenshotRecorder, "capture"):
+        Providers.UseIdP.okta_sign_in(MagicMock(), driver, "alice", "secret", None, False)
+
+    budgets = [call.args[1] for call in wait_for_screen.call_args_list]
+    assert budgets == sorted(budgets, reverse=True) and budgets[0] <= 30
 
 
 def test_indicator_matches_realistic_password_reset_markup():
@@ -66,3 +114,40 @@ def test_indicator_does_not_match_mfa_selection_markup():
     assert helper.poll_page_source_with_backoff(
         Providers.forced_password_reset_indicator, max_total_seconds=0.05, label="test"
     ) is False
+
+
+def test_page_text_wait_runs_in_the_page():
+    driver = MagicMock()
+    driver.execute_async_script.return_value = "test"
+    type(driver).page_source = page_source = PropertyMock(return_value="")
+    helper = SeleniumHelper(driver, wait=MagicMock())
+
+    assert helper.wait_for_page_text(Providers.mfa_screen_indicator, max_total_seconds=20, label="test") is True
+    script, screens, timeout_ms, tick_ms = driver.execute_async_script.call_args.args
+    assert "MutationObserver" in script
+    assert screens == [["test", [["text", Providers.mfa_screen_indicator]]]]
+    assert 19000 <= timeout_ms <= 20000 and tick_ms == 250
+    assert driver.set_script_timeout.call_args.args[0] > 20
+    page_source.assert_not_called()
+
+
+def test_page_text_wait_restarts_after_navigation_and_times_out():
+    driver = MagicMock()
+    driver.execute_async_script.side_effect = [se.JavascriptException("document unloaded while waiting for result"),
+                                               se.TimeoutException("script timeout")]
+    helper = SeleniumHelper(driver, wait=MagicMock())
+
+    assert helper.wait_for_page_text(Providers.mfa_screen_indicator, max_total_seconds=1, label="test") is False
+    assert driver.execute_async_script.call_count == 2
+
+
+def test_screen_wait_falls_back_to_probing_per_tick():
+    driver = MagicMock()
+    driver.execute_async_script.side_effect = se.WebDriverException("async scripts unsupported")
+    driver.execute_script.side_effect = [None, "password"]
+    helper = SeleniumHelper(driver, wait=MagicMock())
+    screens = [(name, Providers.okta_screens()[name]) for name in Providers.okta_sign_in_states["username_sent"]]
+
+    assert helper.wait_for_screen(screens, max_total_seconds=1, label="test", tick=0.01) == "password"
+    assert driver.execute_script.call_count == 2
+    assert [name for name, _ in driver.execute_script.call_args.args[1]] == ["saml", "factor_list", "password"]
@@ -0,0 +1,53 @@
+# coding=utf-8
+"""Unit tests for reading SAML responses."""
+
+import base64
+import datetime
+
+import SAMLSelector
+
+
+def _saml_response(subject_not_on_or_after, conditions_not_on_or_after):
+    document = f"""<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol"
+                     xmlns:saml2="urn:oasis:names:tc:SAML:2.0:assertion">
+      <saml2:Assertion>
+        <saml2:Subject>
+          <saml2:NameID>jane.doe</saml2:NameID>
+          <saml2:SubjectConfirmation Method="urn:oasis:names:tc:SAML:2.0:cm:bearer">
+            <saml2:SubjectConfirmationData NotOnOrAfter="{subject_not_on_or_after}"
+                                           Recipient="https://signin.aws.amazon.com/saml"/>
+          </saml2:SubjectConfirmation>
+        </saml2:Subject>
+        <saml2:Conditions NotBefore="2030-01-01T11:55:00.000Z" NotOnOrAfter="{conditions_not_on_or_after}"/>
+        <saml2:AttributeStatement>
+          <saml2:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">
+            <saml2:AttributeValue>arn:aws:iam::123456789012:role/Fed-Admin,arn:aws:iam::123456789012:saml-provider/OKTA</saml2:AttributeValue>
+          </saml2:Attribute>
+        </saml2:AttributeStatement>
+      </saml2:Assertion>
+    </samlp:Response>"""
+    return base64.b64encode(document.encode()).decode()
+
+
+def test_assertion_expiry_is_earliest_not_on_or_after():
+    saml_response = _saml_response("2030-01-01T12:05:00.000Z", "2030-01-01T12:03:00.000Z")
+
+    expiry = SAMLSelector.get_assertion_expiry(saml_response)
+
+    assert expiry == datetime.datetime(2030, 1, 1, 12, 3, tzinfo=datetime.timezone.utc)
+
+
+def test_assertion_expiry_unreadable_response_returns_none():
+    assert SAMLSelector.get_assertion_expiry("CouldNotCompleteMFA") is None
+
+
+def test_roles_named_from_account_map():
+    saml_response = _saml_response("2030-01-01T12:05:00.000Z", "2030-01-01T12:03:00.000Z")
+
+    roles, table = SAMLSelector.get_roles_from_saml_response(saml_response, {"123456789012": "payments-prod"})
+    listed_roles, _ = SAMLSelector.get_roles_from_saml_response(
+        saml_response, [{"name": "payments-prod", "number": "123456789012"}])
+
+    assert roles == listed_roles
+    assert roles[0]["rolename"] == "payments-prod-Admin"
+    assert table[1] == [0, "123456789012", "payments-prod", "Admin"]
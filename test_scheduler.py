@@ -0,0 +1,99 @@
+# coding=utf-8
+"""Unit tests for expiry-ordered scheduling of batch re-authentication."""
+
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import BatchPlan
+import Config
+import Scheduler
+import TokenState
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_expired_and_unknown_profiles_come_first():
+    expirations = {"fresh": NOW + timedelta(hours=1), "soon": NOW + timedelta(minutes=2),
+                   "expired": NOW - timedelta(minutes=5)}
+
+    ordered = [profile for _, profile in Scheduler.order(["fresh", "soon", "expired", "never"], expirations, set(), NOW)]
+
+    assert ordered == ["expired", "never", "soon", "fresh"]
+
+
+def test_pinned_profiles_count_as_expiring_sooner():
+    expirations = {"pinned": NOW + timedelta(minutes=50), "other": NOW + timedelta(minutes=40)}
+
+    assert Scheduler.urgency(expirations["pinned"], True, NOW, pin_weight=0.5) == (1500.0, 0)
+    ordered = [profile for _, profile in Scheduler.order(["other", "pinned"], expirations, {"pinned"}, NOW)]
+    assert ordered[0] == "pinned"
+
+
+def test_queue_breaks_ties_by_pin_then_name():
+    expiry_queue = Scheduler.ExpiryQueue(NOW)
+    for name, pinned in (("b", False), ("a", False), ("c", True)):
+        expiry_queue.push(name, None, pinned, item=name.upper())
+
+    assert [(name, item) for _, name, item in expiry_queue.drain()] == [("c", "C"), ("a", "A"), ("b", "B")]
+    assert len(expiry_queue) == 0
+
+
+def test_lapses_lists_profiles_expiring_before_their_refresh():
+    groups = [{"profiles": ["quick", "slow"], "finish_seconds": 120.0}]
+    expirations = {"quick": NOW + timedelta(minutes=1), "slow": NOW + timedelta(minutes=30)}
+
+    assert Scheduler.lapses(groups, expirations, NOW) == {"quick": (expirations["quick"], NOW + timedelta(minutes=2))}
+
+
+@pytest.fixture
+def scheduled_home(tmp_path, monkeypatch):
+    aws_dir = tmp_path / ".aws"
+    aws_dir.mkdir(mode=0o700)
+    (aws_dir / "samlsts").write_text(
+        "[global]\nbrowser = chrome\nsamlProvider = Fed-OKTA\nsavedPassword = true\ncacheAssertion = false\n\n"
+        "[Fed-OKTA]\nloginpage = https://login.example.com/app/amazon_aws/sso/saml\nloginTitle = Example - Sign In\n\n"
+        "[alpha-1]\naccountNumber = 123456789001\niamRole = Admin\nusername = alice\n\n"
+        "[alpha-2]\naccountNumber = 123456789002\niamRole = Admin\nusername = alice\n\n"
+        "[beta]\naccountNumber = 123456789003\niamRole = Admin\nusername = bob\n"
+    )
+    (aws_dir / "credentials").write_text("")
+    (aws_dir / "config").write_text("")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path))
+    return aws_dir
+
+
+def test_plan_orders_groups_and_profiles_by_expiry_and_warns(scheduled_home):
+    now = datetime.now(timezone.utc)
+    TokenState.record_expirations(scheduled_home / "aws_saml.db", {
+        "alpha-1": now + timedelta(minutes=50), "alpha-2": now + timedelta(minutes=45),
+        "beta": now + timedelta(seconds=10)})
+
+    plan = BatchPlan.build(["alpha-1", "alpha-2", "beta"], Config.Config(), deadline_seconds=5)
+
+    assert [group["username"] for group in plan.groups] == ["bob", "alice"]
+    assert [group["rank"] for group in plan.groups] == [0, 1]
+    assert plan.groups[1]["profiles"] == ["alpha-2", "alpha-1"]
+    assert plan.groups[1]["assume"] == ["alpha-2", "alpha-1"]
+    assert any(warning.startswith("beta expires in") for warning in plan.warnings)
+    assert any("deadline" in warning for warning in plan.warnings)
+
+
+def test_pinned_group_moves_ahead(scheduled_home):
+    now = datetime.now(timezone.utc)
+    db_path = scheduled_home / "aws_saml.db"
+    TokenState.record_expirations(db_path, {"alpha-1": now + timedelta(minutes=50),
+                                            "alpha-2": now + timedelta(minutes=55),
+                                            "beta": now + timedelta(minutes=40)})
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE pinned_profiles (profile_name TEXT PRIMARY KEY)")
+    conn.execute("INSERT INTO pinned_profiles VALUES ('alpha-1')")
+    conn.commit()
+    conn.close()
+
+    plan = BatchPlan.build(["alpha-1", "alpha-2", "beta"], Config.Config())
+
+    assert [group["username"] for group in plan.groups] == ["alice", "bob"]
+    assert plan.warnings == []
@@ -0,0 +1,145 @@
+# coding=utf-8
+"""Offline tests for regional STS endpoint probing, using local TLS stand-ins for the endpoints."""
+
+import datetime
+import ipaddress
+import socket
+import ssl
+import threading
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+import STSEndpoints
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "sts-stand-in")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(hours=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+                       critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    directory = tmp_path_factory.mktemp("certs")
+    cert_file, key_file = directory / "cert.pem", directory / "key.pem"
+    cert_file.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return str(cert_file), str(key_file)
+
+
+class StandInEndpoint:
+    """A local TLS listener that waits handshake_delay seconds before answering each handshake."""
+
+    def __init__(self, certificate, handshake_delay):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(*certificate)
+        self.handshake_delay = handshake_delay
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handshake, args=(conn,), daemon=True).start()
+
+    def _handshake(self, conn):
+        time.sleep(self.handshake_delay)
+        try:
+            with self.context.wrap_socket(conn, server_side=True):
+                pass
+        except (OSError, ssl.SSLError):
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def stand_ins(certificate):
+    endpoints = {
+        "us-east-1": StandInEndpoint(certificate, 0.3),
+        "eu-west-1": StandInEndpoint(certificate, 0.0),
+    }
+    closed = socket.create_server(("127.0.0.1", 0))
+    closed_port = closed.getsockname()[1]
+    closed.close()
+
+    candidates = {region: ("127.0.0.1", endpoint.port) for region, endpoint in endpoints.items()}
+    candidates["ap-southeast-1"] = ("127.0.0.1", closed_port)
+    client_context = ssl.create_default_context(cafile=certificate[0])
+    yield candidates, client_context
+    for endpoint in endpoints.values():
+        endpoint.close()
+
+
+def test_probe_measures_connect_and_handshake(stand_ins):
+    candidates, client_context = stand_ins
+
+    result = STSEndpoints.probe_endpoint(*candidates["us-east-1"], ssl_context=client_context)
+
+    assert result["handshake"] >= 0.25
+    assert result["total"] == pytest.approx(result["connect"] + result["handshake"])
+
+
+def test_ranking_puts_fastest_healthy_endpoint_first(stand_ins):
+    candidates, client_context = stand_ins
+
+    ranking = STSEndpoints.rank_endpoints(candidates, timeout=1, ssl_context=client_context)
+
+    assert [region for region, _ in ranking] == ["eu-west-1", "us-east-1"]
+
+
+def test_fastest_region_reuses_stored_ranking_until_ttl(stand_ins, tmp_path):
+    candidates, client_context = stand_ins
+    db_path = tmp_path / "aws_saml.db"
+    endpoint_for = candidates.__getitem__
+
+    first = STSEndpoints.fastest_region(db_path, list(candidates), 3600, endpoint_for=endpoint_for,
+                                        timeout=1, ssl_context=client_context)
+    stored = STSEndpoints.load_ranking(db_path, candidates, 3600)
+
+    assert first == "eu-west-1"
+    assert [region for region, _ in stored] == ["eu-west-1", "us-east-1"]
+    assert STSEndpoints.load_ranking(db_path, candidates, 0) is None
+
+
+def test_no_healthy_endpoint_returns_none(tmp_path):
+    closed = socket.create_server(("127.0.0.1", 0))
+    port = closed.getsockname()[1]
+    closed.close()
+
+    region = STSEndpoints.fastest_region(tmp_path / "aws_saml.db", ["us-east-1"], 3600,
+                                         endpoint_for=lambda _: ("127.0.0.1", port), timeout=0.5)
+
+    assert region is None
+
+
+def test_saving_one_candidate_set_keeps_the_others(tmp_path):
+    db_path = tmp_path / "aws_saml.db"
+    STSEndpoints.save_ranking(db_path, ["us-east-1", "us-west-2"], [("us-west-2", 0.02), ("us-east-1", 0.03)])
+
+    STSEndpoints.save_ranking(db_path, ["eu-west-1"], [("eu-west-1", 0.01)])
+
+    assert STSEndpoints.load_ranking(db_path, ["us-east-1", "us-west-2"], 3600) == [("us-west-2", 0.02),
+                                                                                    ("us-east-1", 0.03)]
+    assert STSEndpoints.load_ranking(db_path, ["eu-west-1"], 3600) == [("eu-west-1", 0.01)]
+    assert STSEndpoints.load_ranking(db_path, ["eu-west-1", "ap-south-1"], 3600) is None
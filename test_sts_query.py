@@ -0,0 +1,166 @@
+# coding=utf-8
+"""Offline tests for the boto3-free AssumeRoleWithSAML transport, run against a local fake STS."""
+
+import subprocess
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import AWS
+import STSQuery
+
+ASSUME_ROLE_RESPONSE = """<AssumeRoleWithSAMLResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleWithSAMLResult>
+    <Issuer>https://login.example.com/app/exk123</Issuer>
+    <AssumedRoleUser>
+      <Arn>arn:aws:sts::123456789012:assumed-role/Fed-Admin/jane.doe</Arn>
+      <AssumedRoleId>AROAEXAMPLEROLEID0001:jane.doe</AssumedRoleId>
+    </AssumedRoleUser>
+    <Credentials>
+      <AccessKeyId>ASIAEXAMPLEEXAMPLE01</AccessKeyId>
+      <SecretAccessKey>wJalrXUtnFEMIK7MDENGbPxRfiCYEXAMPLEKEY01</SecretAccessKey>
+      <SessionToken>FwoGZXIvYXdzEXAMPLETOKEN</SessionToken>
+      <Expiration>2030-01-01T12:00:00Z</Expiration>
+    </Credentials>
+    <Audience>https://signin.aws.amazon.com/saml</Audience>
+    <SubjectType>persistent</SubjectType>
+    <PackedPolicySize>6</PackedPolicySize>
+    <NameQualifier>SbdGOnUkh1i4+EXAMPLExL/jEvs=</NameQualifier>
+    <Subject>jane.doe</Subject>
+  </AssumeRoleWithSAMLResult>
+  <ResponseMetadata><RequestId>c6104cbe-af31-11e0-8154-cbc7ccf896c7</RequestId></ResponseMetadata>
+</AssumeRoleWithSAMLResponse>"""
+
+ERROR_RESPONSE = """<ErrorResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <Error><Type>Sender</Type><Code>InvalidIdentityToken</Code><Message>Invalid SAML assertion</Message></Error>
+  <RequestId>c6104cbe-af31-11e0-8154-cbc7ccf896c7</RequestId>
+</ErrorResponse>"""
+
+
+class FakeSTSHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        FakeSTSHandler.requests_seen.append(form)
+        if form.get("SAMLAssertion") == "bad-assertion":
+            status, body = 400, ERROR_RESPONSE
+        else:
+            status, body = 200, ASSUME_ROLE_RESPONSE
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_sts():
+    FakeSTSHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSTSHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    STSQuery.reset_http_session()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+    STSQuery.reset_http_session()
+
+
+def test_assume_role_with_saml_posts_query_form(fake_sts):
+    STSQuery.assume_role_with_saml("us-east-1", "arn:aws:iam::123456789012:role/Fed-Admin",
+                                   "arn:aws:iam::123456789012:saml-provider/OKTA", "assertion", 3600,
+                                   endpoint_url=fake_sts)
+
+    form = FakeSTSHandler.requests_seen[0]
+    assert form["Action"] == "AssumeRoleWithSAML"
+    assert form["Version"] == "2011-06-15"
+    assert form["RoleArn"] == "arn:aws:iam::123456789012:role/Fed-Admin"
+    assert form["PrincipalArn"] == "arn:aws:iam::123456789012:saml-provider/OKTA"
+    assert form["DurationSeconds"] == "3600"
+
+
+def test_response_parsed_into_boto3_shape(fake_sts):
+    sts_object = STSQuery.assume_role_with_saml("us-east-1", "role", "principal", "assertion", 3600,
+                                                endpoint_url=fake_sts)
+
+    assert sts_object["AssumedRoleUser"]["AssumedRoleId"] == "AROAEXAMPLEROLEID0001:jane.doe"
+    assert sts_object["Subject"] == "jane.doe"
+    assert sts_object["Audience"] == "https://signin.aws.amazon.com/saml"
+    assert sts_object["PackedPolicySize"] == 6
+
+    access_id, secret_key, session_token, expiration = AWS.STS.get_sts_details(sts_object)
+    assert access_id == "ASIAEXAMPLEEXAMPLE01"
+    assert secret_key == "wJalrXUtnFEMIK7MDENGbPxRfiCYEXAMPLEKEY01"
+    assert session_token == "FwoGZXIvYXdzEXAMPLETOKEN"
+    assert expiration.utcoffset() is not None
+
+
+def test_error_response_raises_with_aws_code(fake_sts):
+    with pytest.raises(STSQuery.STSQueryError) as raised:
+        STSQuery.assume_role_with_saml("us-east-1", "role", "principal", "bad-assertion", 3600,
+                                       endpoint_url=fake_sts)
+
+    assert raised.value.code == "InvalidIdentityToken"
+    assert raised.value.status_code == 400
+
+
+def test_query_backend_error_exits_like_boto3(fake_sts):
+    with patch.object(AWS.constants, "__sts_endpoint_url__", fake_sts), pytest.raises(SystemExit) as raised:
+        AWS.STS.aws_assume_role("us-east-1", "role", "principal", "bad-assertion", 3600, backend="query")
+
+    assert raised.value.code == 2
+
+
+def test_query_backend_falls_back_to_boto3_when_unreachable():
+    boto_client = MagicMock()
+    boto_client.assume_role_with_saml.return_value = {"Credentials": {}}
+    STSQuery.reset_http_session()
+
+    with patch.object(AWS.constants, "__sts_endpoint_url__", "http://127.0.0.1:1/"), \
+         patch.object(AWS.STS, "get_sts_client", return_value=boto_client):
+        sts_object = AWS.STS.aws_assume_role("us-east-1", "role", "principal", "assertion", 3600, backend="query")
+
+    assert sts_object == {"Credentials": {}}
+    boto_client.assume_role_with_saml.assert_called_once()
+
+
+def test_query_backend_does_not_import_boto3(fake_sts):
+    script = (
+        "import sys, AWS\n"
+        f"AWS.constants.__sts_endpoint_url__ = {fake_sts!r}\n"
+        "AWS.STS.aws_assume_role('us-east-1', 'role', 'principal', 'assertion', 3600, backend='query')\n"
+        "assert 'boto3' not in sys.modules and 'botocore' not in sys.modules\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=str(Path(__file__).resolve().parent),
+                            capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+
+
+def test_http_session_is_reused_without_a_size_and_grown_without_closing():
+    STSQuery.reset_http_session()
+    try:
+        presized = STSQuery.get_http_session(3)
+        assert STSQuery.get_http_session() is presized
+
+        with patch.object(presized, "close") as close:
+            grown = STSQuery.get_http_session(20)
+            assert grown is not presized
+            close.assert_not_called()
+            assert STSQuery.get_http_session(5) is grown
+
+            STSQuery.reset_http_session()
+            close.assert_called_once()
+    finally:
+        STSQuery.reset_http_session()